@@ -25,6 +25,9 @@
 Classes:
 
    Pyckler
+   Engine
+   Memo
+   FileCache, MemoryCache, SQLiteCache
 
 Functions:
 
@@ -32,6 +35,11 @@ Functions:
    dumps(object) -> string
    load(file) -> object
    loads(string) -> object
+   iterload(file) -> iterator
+   load_many(paths) -> iterator
+   aload(path) -> object (coroutine)
+   open_indexed(path) -> mapping
+   adump(object, path) (coroutine)
 
 Misc variables:
 
@@ -41,95 +49,296 @@ Misc variables:
 """
 
 __author__ = 'Michal Vyskocil'
-__version__ = '1.93'
+__version__ = '1.94'
 
 __all__ = [
-    'dump', 'dumps', 'load', 'loads',
-    'Pyckler'
+    'dump', 'dumps', 'load', 'loads', 'iterload', 'load_many', 'aload', 'adump',
+    'dumpb', 'loadb', 'open_indexed',
+    'Pyckler', 'Engine', 'Memo', 'FileCache', 'MemoryCache', 'SQLiteCache', 'LoadError',
+    'Stats', 'Limits', 'LimitError', 'Interner', 'Columns'
     ]
 
-from pprint import _safe_repr
-
-from .cache import CacheMismatchError, read_cache, write_cache
+from .backends import CacheBackend, FileCache, MemoryCache, SQLiteCache
+from .batch import LoadError, load_many
+from .binary import BinaryEncoder, BinaryParser
+from .blocks import records, vector
+from .cache import load_cache, write_cache
+from .columns import Columns, columns as _columns, _globals as _columns_globals
+from .encoder import Encoder
+from .engine import Engine
+from .indexed import IndexedDict, open_indexed
+from .interner import Interner
+from .jsonlike import _fast
+from .limits import LimitError, Limits, _read
+from .memo import Memo
+from .parser import Parser
 from .pyckler import Pyckler
-from .utils import _split_lines
+from .stats import Stats, clock
+
+# methods of Pyckler turning the document into the object
+_METHODS = ("eval", "build", "decode")
+
+# set options of a Pyckler instance, which are given
+def _setup(pyckler, stats=None, limits=None, intern=None):
+    if stats is not None:
+        pyckler.stats = stats
+    if limits is not None:
+        pyckler.limits = limits
+    if intern is True:
+        intern = Interner()
+    if intern:
+        pyckler.intern = intern
+    return pyckler
+
+def _run(pyckler, method):
+    if method not in _METHODS:
+        raise ValueError("one of {} expected for `method', `{}' found".format(
+            ", ".join(_METHODS), method))
+    return getattr(pyckler, method)()
 
 #json-like API
 
-def loads(string, cls=Pyckler, globals=dict()):
+def loads(string, cls=Pyckler, globals=dict(), method="eval", memo=None,
+    stats=None, limits=None, intern=None, columns=False):
     """Deserialize and evaluate string with a valid
     pyckle document to Python object
     
     :param string: The (unicode) string or string list with a document
     :param cls: The visitor class used for evaluation, defaults to ``Pyckler``
     :param globals: An aditional namespace mapping
+    :param method: "eval" to compile and evaluate the document (default),
+                   "build" to build the object directly from the AST,
+                   "decode" to use pyckle's own single pass parser, which
+                   is not limited by the nesting depth of document
+                   JSON-like documents (dicts with string keys, lists,
+                   strings, numbers, True, False, None) are decoded by json
+                   module with any method, if ``cls`` is ``Pyckler``
+    :param memo: The ``Memo`` instance remembering loaded objects, so the
+                 same string is not parsed again, it is not used with
+                 ``limits`` or ``intern``
+    :param stats: The ``Stats`` instance recording time spent in each phase
+                  of loading
+    :param limits: The ``Limits`` of document, exceeding them raises
+                   ``LimitError``, JSON-like documents are not decoded by
+                   json module then
+    :param intern: The ``Interner`` sharing dict keys and short strings
+                   (like JSON-like documents with limits), True for a new one
+    :param columns: Return a list of dicts with the same keys as ``Columns``,
+                    a dict of lists or arrays, see ``pyckle.columns``;
+                    ``pyckle.records`` are built as Columns, the memo is not
+                    used then
 
     :return: Resulting python object
     """
 
-    if isinstance(string, str):
-        slist = _split_lines(string)
-    elif isinstance(string, (list, tuple)):
-        slist = string
-    else:
+    if not isinstance(string, (str, list, tuple)):
         raise TypeError("str, list, tuple expected for `string', `{}' found".format(type(string)))
-    
-    return cls(slist, "<string>", globals).eval()
 
-def load(fp, cls=Pyckler, globals=dict(), use_cache=False, cfilename=None):
+    # records are built as Columns, the memo keeps the lists of dicts only
+    if columns:
+        globals = _columns_globals(cls, globals)
+
+    def load_f():
+        # invalid method is reported by _run
+        obj, ok = _fast(cls, string, stats, limits, intern) \
+            if method in _METHODS else (None, False)
+        if ok:
+            return obj
+        pyckler = _setup(cls(string, "<string>", globals), stats, limits, intern)
+        return _run(pyckler, method)
+
+    if memo is not None and limits is None and intern is None and not columns:
+        ret = memo.loads(string, load_f, cls, globals, method)
+    else:
+        ret = load_f()
+    return _columns(ret) if columns else ret
+
+def load(fp, cls=Pyckler, globals=dict(), use_cache=False, cfilename=None,
+    method="eval", memo=None, stats=None, limits=None, intern=None,
+    columns=False):
     """Deserialize and evaluate file-like object
     containing a valid pyckle document to Python object
     
     :param fp: The file-like object with ``.readlines()`` method
     :param cls: The visitor class used for evaluation, defaults to ``Pyckler``
     :param globals: An aditional namespace mapping
+    :param use_cache: Read the object from cache, missing or outdated cache
+                      is rebuilt by one of concurrent loaders, see
+                      ``pyckle.cache.load_cache``, or the ``CacheBackend``
+                      storing the cache
+    :param cfilename: The cache file, defaults to PEP 3147 location, not
+                      used with a ``CacheBackend``
+    :param method: "eval" (default), "build" or "decode", see ``loads``
+    :param memo: The ``Memo`` instance remembering loaded objects, so the
+                 same unchanged file is not read again, see ``loads``
+    :param stats: The ``Stats`` instance recording time spent in each phase
+                  of loading and cache hits and misses
+    :param limits: The ``Limits`` of document, see ``loads``, no more than
+                   ``max_bytes`` + 1 characters are read
+    :param intern: The ``Interner`` sharing strings, see ``loads``
+    :param columns: Return records as ``Columns``, see ``loads``, cache and
+                    memo keep the loaded list, so the dicts of rows are
+                    created with them
 
     :return: Resulting python object
     """
 
-    if use_cache and hasattr(fp, "name"):
-        try:
-            return read_cache(fp.name, cfilename)
-        except CacheMismatchError:
-            pass
+    def parse_f():
+        if stats is not None:
+            start = clock()
+        lines = _read(fp, limits)
+        if stats is not None:
+            stats.phase("read", start)
+        obj, ok = _fast(cls, lines, stats, limits, intern) \
+            if method in _METHODS else (None, False)
+        if ok:
+            return obj
+        pyckler = cls(
+            lines,
+            fp.name if hasattr(fp, "name") else "<unknown>",
+            globals)
+        return _run(_setup(pyckler, stats, limits, intern), method)
+
+    def load_f():
+        if not hasattr(fp, "name"):
+            return parse_f()
+        # backends can be empty containers
+        if isinstance(use_cache, CacheBackend):
+            return use_cache.load(fp.name, parse_f, stats)
+        if use_cache:
+            return load_cache(fp.name, parse_f, cfilename, stats=stats)
+        return parse_f()
+
+    # records are built as Columns unless the cache or memo keeps the list
+    if columns and not use_cache and memo is None:
+        globals = _columns_globals(cls, globals)
+
+    if memo is not None and limits is None and intern is None:
+        ret = memo.load(fp, load_f, cls, globals, method)
+    else:
+        ret = load_f()
+    return _columns(ret) if columns else ret
+
+def iterload(fp, cls=Pyckler, globals=dict(), chunk_size=64*1024, limits=None,
+    intern=None):
+    """Deserialize file-like object containing a pyckle document with
+    top-level list, tuple, set or dict incrementally
+
+    Yields the items of top-level list, tuple or set, or (key, value)
+    pairs of top-level dict as they are parsed, so only the item being
+    parsed is kept in memory, not the whole document. The document is
+    parsed like ``load(fp, method="decode")`` does.
+
+    :param fp: The file-like object with ``.read()`` method
+    :param cls: The visitor class providing globals, defaults to ``Pyckler``
+    :param globals: An aditional namespace mapping
+    :param chunk_size: The size of chunks read from ``fp``
+    :param limits: The ``Limits`` of document, ``max_bytes`` limits the whole
+                   document, ``max_length`` the number of items yielded
+    :param intern: The ``Interner`` sharing strings, see ``loads``
+
+    :return: Iterator over items of top-level container
+    """
 
-    return cls(
-        fp.readlines(),
+    pyckler = cls(
+        [],
         fp.name if hasattr(fp, "name") else "<unknown>",
-        globals).eval()
+        globals)
+    return Parser(_setup(pyckler, limits=limits, intern=intern)).iterparse(
+        fp.read, chunk_size)
 
-def dumps(obj):
+# asyncio API requires python 3.5, it is imported on the first call
+def aload(*args, **kwargs):
+    """Deserialize pyckle file without blocking the event loop, returns
+    a coroutine, see ``pyckle.aio.aload``"""
+
+    from .aio import aload
+    return aload(*args, **kwargs)
+
+def adump(*args, **kwargs):
+    """Serialize python object to pyckle file without blocking the event
+    loop, returns a coroutine, see ``pyckle.aio.adump``"""
+
+    from .aio import adump
+    return adump(*args, **kwargs)
+
+def dumps(obj, block_size=None, record_size=None):
     """Return serialized python object as a string
 
     :param obj: The python object to be serialized
+    :param block_size: Write numeric lists and arrays with at least
+                       ``block_size`` items as blocks decoded in bulk, see
+                       ``pyckle.blocks``, defaults to None (never)
+    :param record_size: Write lists of at least ``record_size`` dicts with the
+                        same keys as keys and rows, which share the keys once
+                        loaded, defaults to None (never)
 
     :return: String with serialized object
-    
-    WARNING/TODO: ``dumps`` just checks the object is not
-    recursive via ``pprint.isreadable``, but does not
-    impose any other limits
+
+    raises TypeError if object (or any object inside) is not supported
+    by ``Pyckler`` or is recursive
     """
 
-    repr_string, isreadable, isrecursive = \
-        _safe_repr(obj, {}, None, 0)
+    return Encoder(
+        Pyckler.__GLOBALS__, block_size=block_size, record_size=record_size).encode(obj)
+
+def dumpb(obj):
+    """Return serialized python object in binary pyckle format
+
+    :param obj: The python object to be serialized
+
+    :return: Bytes with serialized object, see ``pyckle.binary``
 
-    if not isreadable:
-        raise TypeError("'{}' is not readable".format(obj))
+    raises TypeError if object (or any object inside) is not supported
+    by ``Pyckler`` or is recursive
+    """
+
+    return BinaryEncoder(Pyckler.__GLOBALS__).encode(obj)
+
+def loadb(data, cls=Pyckler, globals=dict(), limits=None):
+    """Deserialize binary pyckle data written by ``dumpb`` to Python object
+
+    :param data: The bytes-like object with binary pyckle data
+    :param cls: The visitor class providing globals, defaults to ``Pyckler``
+    :param globals: An aditional namespace mapping
+    :param limits: The ``Limits`` of data, see ``loads``
+
+    :return: Resulting python object
+
+    raises ValueError for invalid data
+    """
 
-    return repr_string
+    pyckler = _setup(cls([], "<bytes>", globals), limits=limits)
+    return BinaryParser(pyckler).parse(data)
 
-def dump(obj, fp, use_cache=False, cfilename=None):
+def dump(obj, fp, use_cache=False, cfilename=None, validate="stat",
+    out_of_band=False, block_size=None, record_size=None):
     """Serialize python object to a file stream
     
     :param obj: The python object to be serialized
     :param fp: The file-like object with ``.write()`` method
+    :param use_cache: Write the cache of file too, to PEP 3147 location (or
+                      ``cfilename``), or to the ``CacheBackend``
+    :param cfilename: The cache file, defaults to PEP 3147 location
+    :param validate: How the cache is validated, "stat" or "hash",
+                     see ``pyckle.cache.write_cache``
+    :param out_of_band: Store big buffers in the cache out-of-band, so they
+                        are mapped to memory on load, see
+                        ``pyckle.cache.write_cache``
+    :param block_size: Write numeric lists and arrays as blocks, see ``dumps``
+    :param record_size: Write lists of dicts as records, see ``dumps``
     
     :return: what underlying ``.write()`` method returns,
-    mostly number of written bytes
+    mostly number of written bytes, summed over written chunks
     """
 
-    ret = fp.write(dumps(obj))
+    ret = Encoder(
+        Pyckler.__GLOBALS__, block_size=block_size, record_size=record_size).dump(obj, fp)
     fp.flush()
-    if use_cache and hasattr(fp, "name"):
-        write_cache(obj, fp.name, cfilename)
+    if not hasattr(fp, "name"):
+        return ret
+    if isinstance(use_cache, CacheBackend):
+        use_cache.write(obj, fp.name, validate, out_of_band)
+    elif use_cache:
+        write_cache(obj, fp.name, cfilename, validate, out_of_band)
     return ret
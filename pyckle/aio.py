@@ -0,0 +1,119 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""asyncio API of pyckle
+
+    obj = await aload("config.pyckle")
+    await adump(obj, "config.pyckle")
+
+File and cache I/O runs in the default executor of the event loop, parsing
+and serialization in the executor given by caller (a ProcessPoolExecutor
+for big documents), so the event loop is never blocked. Requires python 3.5.
+"""
+
+import asyncio
+import os
+
+from .backends import CacheBackend
+from .cache import load_cache, write_cache
+from .pyckler import Pyckler
+
+# loads in progress, keyed by the event loop and arguments
+_loading = dict()
+
+def _loop():
+    # python3.6 compatibility
+    return getattr(asyncio, "get_running_loop", asyncio.get_event_loop)()
+
+# parse the document, it runs in the caller's executor
+def _parse(lines, filename, cls, globals, method):
+    # pyckle package imports this module
+    from . import _run
+    return _run(cls(lines, filename, globals), method)
+
+# serialize the object, it runs in the caller's executor
+def _encode(obj):
+    from . import dumps
+    return dumps(obj)
+
+def _load(filename, cls, globals, use_cache, method, executor):
+
+    def load_f():
+        with open(filename) as fp:
+            lines = fp.readlines()
+        if executor is None:
+            return _parse(lines, filename, cls, globals, method)
+        return executor.submit(_parse, lines, filename, cls, globals, method).result()
+
+    if isinstance(use_cache, CacheBackend):
+        return use_cache.load(filename, load_f)
+    if use_cache:
+        return load_cache(filename, load_f)
+    return load_f()
+
+def _dump(string, obj, filename, use_cache, validate, out_of_band):
+
+    with open(filename, "w") as fp:
+        ret = fp.write(string)
+    if isinstance(use_cache, CacheBackend):
+        use_cache.write(obj, filename, validate, out_of_band)
+    elif use_cache:
+        write_cache(obj, filename, None, validate, out_of_band)
+    return ret
+
+async def aload(filename, cls=Pyckler, globals=dict(), use_cache=False,
+    method="eval", executor=None):
+    """Deserialize pyckle file without blocking the event loop
+
+    Concurrent loads of the same file (with the same ``cls``, ``globals``,
+    ``use_cache`` and ``method``) are coalesced into one, all callers get the
+    same object then.
+
+    :param filename: The name of pyckle file
+    :param cls: The visitor class used for evaluation, defaults to ``Pyckler``
+    :param globals: An aditional namespace mapping
+    :param use_cache: True or ``CacheBackend``, see ``load``
+    :param method: "eval" (default), "build" or "decode", see ``loads``
+    :param executor: The ``concurrent.futures.Executor`` parsing the document,
+                     defaults to the I/O thread itself, ``cls`` and
+                     ``globals`` must be picklable for a process pool
+
+    :return: Resulting python object
+    """
+
+    loop = _loop()
+    # backends are compared by identity
+    cache = use_cache if isinstance(use_cache, CacheBackend) else bool(use_cache)
+    key = (loop, os.path.abspath(filename), cls, id(globals), cache, method)
+    future = _loading.get(key)
+    if future is None:
+        future = loop.run_in_executor(
+            None, _load, filename, cls, globals, use_cache, method, executor)
+        _loading[key] = future
+        future.add_done_callback(lambda f: _loading.pop(key, None))
+    # cancelled caller does not cancel the others
+    return await asyncio.shield(future)
+
+async def adump(obj, filename, use_cache=False, validate="stat",
+    out_of_band=False, executor=None):
+    """Serialize python object to pyckle file without blocking the event loop
+
+    :param obj: The python object to be serialized
+    :param filename: The name of pyckle file
+    :param use_cache: Write the cache of file too, see ``dump``
+    :param validate: How the cache is validated, see ``dump``
+    :param out_of_band: Store big buffers in the cache out-of-band, see
+                        ``dump``
+    :param executor: The ``concurrent.futures.Executor`` serializing the
+                     object, defaults to the default executor of loop
+
+    :return: The number of written characters
+    """
+
+    loop = _loop()
+    string = await loop.run_in_executor(executor, _encode, obj)
+    return await loop.run_in_executor(
+        None, _dump, string, obj, filename, use_cache, validate, out_of_band)
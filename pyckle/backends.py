@@ -0,0 +1,446 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Cache backends for load and dump
+
+The cache of a pyckle file is stored by a backend passed as ``use_cache``
+argument of ``load`` and ``dump``, ``use_cache=True`` stores it in PEP 3147
+location next to the source file, like before. All backends store the same
+format written by ``pyckle.cache.write_cache`` and validate it against the
+source file the same way.
+
+    FileCache   - PEP 3147 location or a central cache directory
+    MemoryCache - in-memory store of the current process
+    SQLiteCache - single SQLite database file, shared by processes
+
+Directory and SQLite stores can be limited by their size, the least recently
+used caches are evicted then.
+"""
+
+import io
+import os
+import pickle
+import threading
+import time
+
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+from .cache import CacheMismatchError, LOCK_WAIT, \
+    read_cache, write_cache, load_cache, _header, _dump, _load, _read_cache
+from .stats import clock
+from .utils import _cache_path, _hasher, _wr_llong
+
+# cache files in the cache directory
+_SUFFIX = ".pyckle.cache"
+
+# errors of writing cache, which are ignored when cache is rebuilt
+_WRITE_ERRORS = (IOError, OSError, pickle.PicklingError, TypeError, ValueError)
+
+# python2 compatibility, class CacheBackend(metaclass=ABCMeta)
+_Abstract = ABCMeta("_Abstract", (object, ), {})
+
+class CacheBackend(_Abstract):
+    """Base class of cache backends
+
+    Subclasses implement ``read`` and ``write``, ``load`` reads the cache or
+    rebuilds it.
+    """
+
+    # caches are visible to other processes
+    shared = True
+
+    def __init__(self, validate="stat", out_of_band=False):
+        """Initialize a backend
+
+        :param validate: How the caches rebuilt by ``load`` are validated,
+                         see ``pyckle.cache.write_cache``
+        :param out_of_band: Store big buffers of caches rebuilt by ``load``
+                            out-of-band, see ``pyckle.cache.write_cache``
+        """
+
+        self.validate = validate
+        self.out_of_band = out_of_band
+
+    @abstractmethod
+    def read(self, filename):
+        """return the object from the cache of filename
+
+        raises CacheMismatchError if there is no valid cache
+        """
+
+    @abstractmethod
+    def write(self, obj, filename, validate=None, out_of_band=None):
+        """store the cache of filename
+
+        :param validate: "stat" or "hash", defaults to ``self.validate``
+        :param out_of_band: defaults to ``self.out_of_band``
+        """
+
+    def load(self, filename, load_f, stats=None):
+        """return the object from the cache of filename, if there is no
+        valid cache, call ``load_f`` and store its result
+
+        :param stats: The ``pyckle.Stats`` recording read_cache and
+                      write_cache phases and the cache hit or miss
+        """
+
+        if stats is not None:
+            start = clock()
+        try:
+            obj = self.read(filename)
+        except CacheMismatchError as error:
+            if stats is not None:
+                stats.phase("read_cache", start)
+                stats.cache_event(error.reason or "missing")
+        else:
+            if stats is not None:
+                stats.phase("read_cache", start)
+                stats.cache_event("hit")
+            return obj
+
+        obj = load_f()
+        if stats is not None:
+            start = clock()
+        try:
+            self.write(obj, filename)
+        except _WRITE_ERRORS:
+            pass
+        if stats is not None:
+            stats.phase("write_cache", start)
+        return obj
+
+    ### private methods
+
+    def _args(self, validate, out_of_band):
+        return \
+            self.validate if validate is None else validate, \
+            self.out_of_band if out_of_band is None else out_of_band
+
+    # the cache in memory
+    def _dumps(self, obj, filename, validate, out_of_band):
+        validate, out_of_band = self._args(validate, out_of_band)
+        header = _header(filename, validate, out_of_band)
+        buf = io.BytesIO()
+        _dump(buf, header, obj, out_of_band)
+        return buf.getvalue()
+
+    # return the object and updated cache or None
+    def _loads(self, data, filename):
+        obj, refresh = _load(io.BytesIO(data), filename)
+        if refresh is None:
+            return obj, None
+        buf = io.BytesIO()
+        buf.write(data[:8])
+        _wr_llong(buf, refresh)
+        buf.write(data[16:])
+        return obj, buf.getvalue()
+
+class FileCache(CacheBackend):
+    """Caches in files, PEP 3147 location or a cache directory
+
+    Caches in the directory are named by the digest of absolute path of
+    source, so the directory can be shared by any number of processes and
+    sources. Concurrent loaders rebuild a cache once, see
+    ``pyckle.cache.load_cache``.
+    """
+
+    def __init__(self, directory=None, max_bytes=None, wait=LOCK_WAIT, **kwargs):
+        """Initialize a FileCache
+
+        :param directory: The cache directory, defaults to PEP 3147 location
+                          next to each source
+        :param max_bytes: The maximum size of caches in the directory, least
+                          recently used ones are removed once it is exceeded
+        :param wait: The maximum number of seconds spent waiting for other
+                     process rebuilding the cache
+        """
+
+        if max_bytes is not None and directory is None:
+            raise ValueError("max_bytes requires a cache directory")
+
+        CacheBackend.__init__(self, **kwargs)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.wait = wait
+        # size of caches in the directory, counted on the first write, other
+        # processes can change it, so it is recounted by eviction
+        self._size = None
+
+    def path(self, filename):
+        """return the path of cache of filename"""
+
+        if self.directory is None:
+            return _cache_path(filename)
+        h = _hasher()
+        h.update(os.path.abspath(filename).encode("utf-8"))
+        return os.path.join(self.directory, h.hexdigest() + _SUFFIX)
+
+    def read(self, filename):
+        cfilename = self.path(filename)
+        try:
+            obj = read_cache(filename, cfilename)
+        except CacheMismatchError:
+            raise
+        except (IOError, OSError) as error:
+            raise CacheMismatchError(str(error), "missing")
+        self._touch(cfilename)
+        return obj
+
+    def write(self, obj, filename, validate=None, out_of_band=None):
+        validate, out_of_band = self._args(validate, out_of_band)
+        cfilename = self.path(filename)
+        old = self._stat(cfilename)
+        write_cache(obj, filename, cfilename, validate, out_of_band)
+        self._written(cfilename, old)
+
+    def load(self, filename, load_f, stats=None):
+
+        cfilename = self.path(filename)
+        try:
+            obj = _read_cache(filename, cfilename, stats, miss=False)
+        except (CacheMismatchError, IOError, OSError):
+            pass
+        else:
+            self._touch(cfilename)
+            return obj
+
+        old = self._stat(cfilename)
+        obj = load_cache(
+            filename, load_f, cfilename, self.wait,
+            self.validate, self.out_of_band, stats)
+        self._written(cfilename, old)
+        return obj
+
+    ### private methods
+
+    # mark the cache as recently used
+    def _touch(self, cfilename):
+        if self.max_bytes is None:
+            return
+        try:
+            os.utime(cfilename, None)
+        except OSError:
+            pass
+
+    # return (mtime, size) of the cache or None
+    def _stat(self, cfilename):
+        if self.max_bytes is None:
+            return None
+        try:
+            st = os.stat(cfilename)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    # count the cache, which replaced the ``old`` one, the directory is
+    # listed just when the limit is exceeded
+    def _written(self, cfilename, old):
+
+        if self.max_bytes is None:
+            return
+        new = self._stat(cfilename)
+        if new == old:
+            return
+        if self._size is None:
+            self._evict()
+            return
+        self._size += (new[1] if new else 0) - (old[1] if old else 0)
+        if self._size > self.max_bytes:
+            self._evict()
+
+    # remove least recently used caches from the directory
+    def _evict(self):
+
+        caches = list()
+        for name in os.listdir(self.directory):
+            if not name.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            caches.append((st.st_mtime, st.st_size, path))
+
+        size = sum(c[1] for c in caches)
+        for _, csize, path in sorted(caches):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            size -= csize
+        self._size = size
+
+class MemoryCache(CacheBackend):
+    """Caches in memory of the current process
+
+    Unlike ``Memo``, the pickled cache is stored, so every load returns
+    a new object and it is validated against the source file.
+    """
+
+    shared = False
+
+    def __init__(self, max_bytes=None, **kwargs):
+        """Initialize a MemoryCache
+
+        :param max_bytes: The maximum size of caches, least recently used
+                          ones are removed once it is exceeded
+        """
+
+        CacheBackend.__init__(self, **kwargs)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._caches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._caches)
+
+    def read(self, filename):
+
+        key = os.path.abspath(filename)
+        with self._lock:
+            data = self._caches.pop(key, None)
+            if data is not None:
+                self._caches[key] = data
+        if data is None:
+            raise CacheMismatchError("no cache", "missing")
+
+        obj, data2 = self._loads(data, filename)
+        if data2 is not None:
+            with self._lock:
+                if self._caches.get(key) is data:
+                    self._caches[key] = data2
+        return obj
+
+    def write(self, obj, filename, validate=None, out_of_band=None):
+
+        key = os.path.abspath(filename)
+        data = self._dumps(obj, filename, validate, out_of_band)
+        with self._lock:
+            old = self._caches.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._caches[key] = data
+            self.size += len(data)
+            while self.max_bytes is not None and self.size > self.max_bytes:
+                _, old = self._caches.popitem(last=False)
+                self.size -= len(old)
+
+class SQLiteCache(CacheBackend):
+    """Caches in a single SQLite database
+
+    The database can be shared by processes, each thread uses its own
+    connection.
+    """
+
+    def __init__(self, path, max_bytes=None, timeout=LOCK_WAIT, **kwargs):
+        """Initialize a SQLiteCache
+
+        :param path: The database file
+        :param max_bytes: The maximum size of caches, least recently used
+                          ones are removed once it is exceeded
+        :param timeout: The number of seconds to wait for a locked database
+        """
+
+        # optional part of python
+        import sqlite3
+
+        CacheBackend.__init__(self, **kwargs)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._sqlite3 = sqlite3
+        self._local = threading.local()
+
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pyckle_cache ("
+                "filename TEXT PRIMARY KEY, "
+                "data BLOB NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "atime REAL NOT NULL)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS pyckle_cache_atime "
+                "ON pyckle_cache (atime)")
+
+    def read(self, filename):
+
+        key = os.path.abspath(filename)
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT data FROM pyckle_cache WHERE filename = ?",
+                (key, )).fetchone()
+        except self._sqlite3.Error as error:
+            raise CacheMismatchError(str(error), "missing")
+        if row is None:
+            raise CacheMismatchError("no cache", "missing")
+
+        data = bytes(row[0])
+        obj, data2 = self._loads(data, filename)
+        if data2 is not None or self.max_bytes is not None:
+            try:
+                with conn:
+                    conn.execute(
+                        "UPDATE pyckle_cache SET data = ?, atime = ? "
+                        "WHERE filename = ? AND data = ?",
+                        (data2 or data, time.time(), key, data))
+            except self._sqlite3.Error:
+                pass
+        return obj
+
+    def write(self, obj, filename, validate=None, out_of_band=None):
+
+        key = os.path.abspath(filename)
+        data = self._dumps(obj, filename, validate, out_of_band)
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO pyckle_cache VALUES (?, ?, ?, ?)",
+                    (key, self._sqlite3.Binary(data), len(data), time.time()))
+                if self.max_bytes is not None:
+                    self._evict(conn)
+        except self._sqlite3.Error as error:
+            raise IOError(str(error))
+
+    # connections are not sent to other processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_sqlite3"], state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        import sqlite3
+        self.__dict__.update(state)
+        self._sqlite3 = sqlite3
+        self._local = threading.local()
+
+    ### private methods
+
+    # connection of this thread, processes do not share it after fork
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._sqlite3.connect(self.path, timeout=self.timeout)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _evict(self, conn):
+        size = 0
+        for filename, csize in conn.execute(
+            "SELECT filename, size FROM pyckle_cache ORDER BY atime DESC"):
+            size += csize
+            if size > self.max_bytes:
+                conn.execute(
+                    "DELETE FROM pyckle_cache WHERE atime <= "
+                    "(SELECT atime FROM pyckle_cache WHERE filename = ?)",
+                    (filename, ))
+                break
@@ -0,0 +1,181 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Loading of many pyckle files by a pool of processes
+
+    for path, obj in load_many(paths, workers=4):
+        ...
+
+Files with a valid cache are read by the calling process, the others are
+parsed by worker processes, which rebuild their cache.
+"""
+
+import pickle
+
+from .backends import CacheBackend
+from .cache import CacheMismatchError, read_cache
+from .pyckler import Pyckler
+
+class LoadError(Exception):
+    """Error of loading one of files passed to ``load_many``
+
+    :ivar filename: The file, which failed
+    :ivar error: The original exception
+    """
+
+    def __init__(self, filename, error):
+        Exception.__init__(self, filename, error)
+        self.filename = filename
+        self.error = error
+
+    def __str__(self):
+        return "{}: {}: {}".format(
+            self.filename, self.error.__class__.__name__, self.error)
+
+# arguments of load in worker process, set by _init, the initializer of pool
+# running in the worker, the calling process passes them to _load_one, so
+# concurrent load_many calls do not share them
+_worker = None
+
+def _init(cls, globals, use_cache, method):
+    global _worker
+    _worker = (cls, globals, use_cache, method)
+
+def _load_one(task, dumps=True, worker=None):
+    # pyckle package imports this module
+    from . import load
+
+    index, filename = task
+    cls, globals, use_cache, method = worker or _worker
+    try:
+        with open(filename) as fp:
+            obj = load(fp, cls, globals, use_cache=use_cache, method=method)
+        # pickled here, so the object, which can't be sent back, fails
+        # only its file
+        if dumps:
+            obj = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    except Exception as error:
+        return index, None, _picklable(error) if dumps else error
+    return index, obj, None
+
+# exception, which can be sent back to the calling process
+def _picklable(error):
+    try:
+        pickle.loads(pickle.dumps(error, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return RuntimeError("{}: {}".format(error.__class__.__name__, error))
+    return error
+
+# return the object from valid cache of filename or raise CacheMismatchError
+def _read(filename, use_cache):
+    if isinstance(use_cache, CacheBackend):
+        return use_cache.read(filename)
+    try:
+        return read_cache(filename)
+    except (IOError, OSError) as error:
+        raise CacheMismatchError(str(error), "missing")
+
+def load_many(paths, cls=Pyckler, globals=dict(), use_cache=False, method="eval",
+    workers=None, ordered=True, errors="raise", chunksize=None):
+    """Load many pyckle files in parallel by a pool of processes
+
+    Files with a valid cache (if ``use_cache`` is set) are read by the calling
+    process, the others are loaded by ``workers`` processes like ``load``
+    does, so they rebuild the missing or outdated caches. Caches of backends
+    not shared by processes (``MemoryCache``) are written by the calling
+    process.
+
+    :param paths: The names of pyckle files
+    :param cls: The visitor class used for evaluation, defaults to ``Pyckler``,
+                it must be picklable, like ``globals``
+    :param globals: An aditional namespace mapping
+    :param use_cache: True or ``CacheBackend``, see ``load``
+    :param method: "eval" (default), "build" or "decode", see ``loads``
+    :param workers: The number of processes, defaults to the number of CPUs,
+                    1 loads the files in the calling process
+    :param ordered: Yield the results in the order of ``paths``, otherwise
+                    as they are loaded
+    :param errors: "raise" raises ``LoadError`` for the first file (in order
+                   results are yielded), which failed, "return" yields the
+                   ``LoadError`` instead of the object
+    :param chunksize: The number of files sent to a worker at once
+
+    :return: Iterator of (path, object) pairs
+    """
+
+    # imported on the first use, it is slow to import
+    import multiprocessing
+
+    if errors not in ("raise", "return"):
+        raise ValueError("raise or return expected for `errors', `{}' found".format(errors))
+    paths = list(paths)
+    # backends can be empty containers
+    if not isinstance(use_cache, CacheBackend):
+        use_cache = bool(use_cache)
+    shared = getattr(use_cache, "shared", True)
+    return _load_many(
+        paths, (cls, globals, use_cache if shared else False, method),
+        use_cache, shared, workers or multiprocessing.cpu_count(), ordered,
+        errors, chunksize)
+
+def _load_many(paths, args, use_cache, shared, workers, ordered, errors, chunksize):
+
+    def result(index, obj, error):
+        if error is None:
+            if pool is not None:
+                obj = pickle.loads(obj)
+            if not shared:
+                try:
+                    use_cache.write(obj, paths[index])
+                except (IOError, OSError, pickle.PicklingError, TypeError, ValueError):
+                    pass
+            return paths[index], obj
+        error = LoadError(paths[index], error)
+        if errors == "raise":
+            raise error
+        return paths[index], error
+
+    # warm caches are read here
+    hits = dict()
+    tasks = list()
+    for index, filename in enumerate(paths):
+        if use_cache is not False:
+            try:
+                hits[index] = _read(filename, use_cache)
+                continue
+            except CacheMismatchError:
+                pass
+        tasks.append((index, filename))
+
+    if not ordered:
+        for index in sorted(hits):
+            yield paths[index], hits.pop(index)
+
+    if workers == 1 or len(tasks) < 2:
+        done = (_load_one(task, False, args) for task in tasks)
+        pool = None
+    else:
+        if chunksize is None:
+            chunksize = max(1, len(tasks) // (workers * 4))
+        import multiprocessing
+        pool = multiprocessing.Pool(min(workers, len(tasks)), _init, args)
+        imap = pool.imap if ordered else pool.imap_unordered
+        done = imap(_load_one, tasks, chunksize)
+
+    try:
+        next_index = 0
+        for index, obj, error in done:
+            while next_index in hits:
+                yield paths[next_index], hits.pop(next_index)
+                next_index += 1
+            yield result(index, obj, error)
+            next_index = index + 1
+        for index in sorted(hits):
+            yield paths[index], hits[index]
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,352 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Benchmark suite of pyckle
+
+    python -m pyckle.bench
+    python -m pyckle.bench --json new.json --compare old.json
+    python -m pyckle.bench --suite depth --suite startup
+
+Generates a corpus of representative documents and measures loads (by each
+method), Engine.loads, load, iterload, dumps, dump, binary dumpb and loadb,
+cache write and read and the peak memory of loads. Results can be written as
+JSON and compared with results of other version, the ratio new/old time is
+printed then.
+
+Other suites, which are not run by default:
+
+    depth       - dumps and loads of deeply nested lists
+    concurrency - concurrent loads of one file by a pool of processes,
+                  without cache, with cache rebuilt once and with valid cache
+    load_many   - load_many of many small files by 1, 2, 4 ... workers
+    startup     - python start-up with and without import pyckle
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+from . import __version__, dumps, dump, loads, load, iterload, dumpb, loadb
+from . import Engine, load_many
+from .cache import read_cache, write_cache
+
+# document shapes of the corpus, size is the number of items
+def _wide_dict(rnd, size):
+    return {"key-{}".format(i): rnd.choice((i, -i * 0.5, "value-{}".format(i), None, True))
+            for i in range(size)}
+
+def _deep(rnd, size):
+    # ast.parse limits the nesting depth of eval and build
+    obj = [rnd.randrange(1024)]
+    for i in range(min(size, 90)):
+        obj = [i, {"level": obj}]
+    return obj
+
+def _numbers(rnd, size):
+    return [rnd.random() * 10**rnd.randint(-5, 5) if i % 2 else rnd.randrange(-2**40, 2**40)
+            for i in range(size)]
+
+def _decimals(rnd, size):
+    from datetime import datetime, timedelta
+    from decimal import Decimal
+    start = datetime(2013, 1, 1)
+    return [(Decimal(rnd.randrange(10**8)) / 100, start + timedelta(seconds=rnd.randrange(10**8)))
+            for i in range(size)]
+
+def _complex(rnd, size):
+    return [complex(rnd.random(), -rnd.random()) for i in range(size)]
+
+def _mixed(rnd, size):
+    return {i: [rnd.randrange(1024), rnd.random(), "item-{}".format(i), (i, -i), {i, -i}]
+            for i in range(size)}
+
+SHAPES = {
+    "wide_dict": _wide_dict,
+    "deep": _deep,
+    "numbers": _numbers,
+    "decimals": _decimals,
+    "complex": _complex,
+    "mixed": _mixed,
+    }
+
+def corpus(shape, size, seed=42):
+    """return the object of given shape with about ``size`` items"""
+    return SHAPES[shape](random.Random(seed), size)
+
+def _time(f, repeat):
+    return min(timeit.repeat(f, number=1, repeat=repeat))
+
+# return peak memory allocated by f or None
+def _peak(f):
+    try:
+        import tracemalloc
+    except ImportError:
+        # python2 compatibility
+        return None
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _result(shape, size, op, t, method=None, peak=None):
+    return {
+        "shape": shape, "size": size, "op": op,
+        "method": method, "time": t, "peak": peak}
+
+def run(shapes=None, size=10000, repeat=3, methods=("eval", "build", "decode")):
+    """run the benchmarks
+
+    :return: list of results, dicts with shape, size (bytes of document),
+             op, method, time and peak (bytes or None)
+    """
+
+    ret = list()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for shape in shapes or sorted(SHAPES):
+            obj = corpus(shape, size)
+            source = dumps(obj)
+            filename = os.path.join(tmpdir, shape + ".pyckle")
+            cfilename = filename + ".cache"
+
+            def result(op, t, method=None, peak=None):
+                ret.append(_result(shape, len(source), op, t, method, peak))
+
+            result("dumps", _time(lambda: dumps(obj), repeat))
+
+            def dump_f():
+                with io.open(filename, "w", encoding="utf-8") as fp:
+                    dump(obj, fp)
+            result("dump", _time(dump_f, repeat))
+
+            for method in methods:
+                result(
+                    "loads", _time(lambda: loads(source, method=method), repeat),
+                    method, _peak(lambda: loads(source, method=method)))
+                engine = Engine(method=method)
+                result("engine", _time(lambda: engine.loads(source), repeat), method)
+
+                def load_f():
+                    with io.open(filename, encoding="utf-8") as fp:
+                        return load(fp, method=method)
+                result("load", _time(load_f, repeat), method)
+
+            def iterload_f():
+                with io.open(filename, encoding="utf-8") as fp:
+                    for _ in iterload(fp):
+                        pass
+            result("iterload", _time(iterload_f, repeat), "decode", _peak(iterload_f))
+
+            data = dumpb(obj)
+            result("dumpb", _time(lambda: dumpb(obj), repeat))
+            result("loadb", _time(lambda: loadb(data), repeat),
+                peak=_peak(lambda: loadb(data)))
+
+            result("write_cache", _time(lambda: write_cache(obj, filename, cfilename), repeat))
+            result("read_cache", _time(lambda: read_cache(filename, cfilename), repeat),
+                peak=_peak(lambda: read_cache(filename, cfilename)))
+    finally:
+        shutil.rmtree(tmpdir)
+    return ret
+
+def run_depth(size=10000, repeat=3):
+    """measure dumps and loads(method="decode") of lists nested 10 * size
+    times and less, eval and build are limited by the depth of ast"""
+
+    ret = list()
+    depth = 100
+    while depth <= 10 * size:
+        obj = 42
+        for i in range(depth):
+            obj = [obj]
+        source = dumps(obj)
+        shape = "depth-{}".format(depth)
+        ret.append(_result(shape, len(source), "dumps", _time(lambda: dumps(obj), repeat)))
+        ret.append(_result(
+            shape, len(source), "loads",
+            _time(lambda: loads(source, method="decode"), repeat), "decode"))
+        depth *= 10
+    return ret
+
+# load in a worker process of run_concurrency
+def _load_file(args):
+    filename, cfilename = args
+    with open(filename) as fp:
+        return len(load(
+            fp, use_cache=cfilename is not None, cfilename=cfilename,
+            method="decode"))
+
+def run_concurrency(size=10000, repeat=3, loaders=64):
+    """measure ``loaders`` concurrent loads of the same file by a pool of
+    cpu_count() processes: without cache, with missing cache rebuilt by one
+    of loaders and with valid cache, and the start-up of pool"""
+
+    # imported on the first use, it is slow to import
+    import multiprocessing
+
+    ret = list()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = dumps(corpus("mixed", max(1, size // 2)))
+        filename = os.path.join(tmpdir, "concurrency.pyckle")
+        cfilename = filename + ".cache"
+        with io.open(filename, "w", encoding="utf-8") as fp:
+            fp.write(source)
+
+        cpus = multiprocessing.cpu_count()
+        start = timeit.default_timer()
+        pool = multiprocessing.Pool(cpus)
+        try:
+            pool.map(len, [""] * cpus, chunksize=1)
+            ret.append(_result(
+                "concurrency", len(source), "pool", timeit.default_timer() - start))
+            for op, c in (("uncached", None), ("rebuilt", cfilename), ("cached", cfilename)):
+                start = timeit.default_timer()
+                pool.map(_load_file, [(filename, c)] * loaders, chunksize=1)
+                ret.append(_result(
+                    "concurrency", len(source), op, timeit.default_timer() - start,
+                    "decode"))
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        shutil.rmtree(tmpdir)
+    return ret
+
+def run_load_many(size=10000, repeat=3):
+    """measure load_many of size / 5 small files by 1, 2, 4 ... up to
+    cpu_count() workers, one worker loads them in this process"""
+
+    import multiprocessing
+
+    ret = list()
+    tmpdir = tempfile.mkdtemp()
+    try:
+        paths = list()
+        for i in range(max(2, size // 5)):
+            path = os.path.join(tmpdir, "{}.pyckle".format(i))
+            with io.open(path, "w", encoding="utf-8") as fp:
+                fp.write(dumps(corpus("mixed", 16, seed=i)))
+            paths.append(path)
+
+        cpus = multiprocessing.cpu_count()
+        workers = 1
+        while True:
+            def load_many_f():
+                for _ in load_many(paths, workers=workers):
+                    pass
+            ret.append(_result(
+                "load_many-{}".format(workers), len(paths), "load_many",
+                _time(load_many_f, repeat)))
+            if workers >= cpus:
+                break
+            workers = min(2 * workers, cpus)
+    finally:
+        shutil.rmtree(tmpdir)
+    return ret
+
+def run_startup(size=10000, repeat=3):
+    """measure the start-up of python with and without import pyckle"""
+
+    import subprocess
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ret = list()
+    for op, code in (("python", "pass"), ("import", "import pyckle")):
+        ret.append(_result("startup", 0, op, _time(
+            lambda: subprocess.check_call([sys.executable, "-c", code], env=env),
+            10 * repeat)))
+    return ret
+
+SUITES = {
+    "depth": run_depth,
+    "concurrency": run_concurrency,
+    "load_many": run_load_many,
+    "startup": run_startup,
+    }
+
+def _key(r):
+    return r["shape"], r["op"], r["method"]
+
+def _format(results, base=None):
+
+    base = dict((_key(r), r) for r in base or ())
+    lines = list()
+    for r in results:
+        line = "{:<10} {:>9}B {:<12} {:<7} {:9.4f}s".format(
+            r["shape"], r["size"], r["op"], r["method"] or "", r["time"])
+        if r["peak"] is not None:
+            line += " {:8.1f}MB".format(r["peak"] / 2.0**20)
+        old = base.get(_key(r))
+        if old is not None and old["time"]:
+            line += "  x{:.2f}".format(r["time"] / old["time"])
+        lines.append(line)
+    return "\n".join(lines)
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(
+        prog="python -m pyckle.bench", description="benchmark suite of pyckle")
+    parser.add_argument("--size", type=int, default=10000,
+        help="number of items of documents (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+        help="number of runs, the best is reported (default: %(default)s)")
+    parser.add_argument("--shape", action="append", choices=sorted(SHAPES),
+        help="document shape, can be repeated (default: all)")
+    parser.add_argument("--method", action="append", choices=("eval", "build", "decode"),
+        help="loads method, can be repeated (default: all)")
+    parser.add_argument("--suite", action="append", choices=["corpus"] + sorted(SUITES),
+        help="suite of benchmarks, can be repeated (default: corpus)")
+    parser.add_argument("--json", metavar="FILE",
+        help="write results as JSON to FILE, - for standard output")
+    parser.add_argument("--compare", metavar="FILE",
+        help="print the ratio of times to results in FILE")
+    args = parser.parse_args(argv)
+
+    results = list()
+    for suite in args.suite or ("corpus", ):
+        if suite == "corpus":
+            results.extend(run(
+                args.shape, args.size, args.repeat,
+                args.method or ("eval", "build", "decode")))
+        else:
+            results.extend(SUITES[suite](args.size, args.repeat))
+    report = {
+        "pyckle": __version__,
+        "python": platform.python_implementation() + " " + platform.python_version(),
+        "platform": platform.platform(),
+        "size": args.size,
+        "repeat": args.repeat,
+        "results": results,
+        }
+
+    base = None
+    if args.compare:
+        with open(args.compare) as fp:
+            base = json.load(fp)["results"]
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+        return 0
+    print(_format(results, base))
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(report, fp, indent=1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,490 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Compact binary pyckle format
+
+    data = dumpb({"a": [1, 2.5, decimal.Decimal("1.1")]})
+    obj = loadb(data)
+
+The binary format stores the same values as pyckle documents do, as tagged
+records, the length of strings and the number of items of containers precede
+them:
+
+    magic (8B)
+    N, T, F                 None, True, False
+    i, h, k, q              int8, int16, int32 and int64 integers
+    I length bytes          other integers, two's complement
+    f float64, c 2*float64  floats and complex numbers
+    s length utf-8          strings
+    b length bytes          bytes
+    t, l, e count items     tuples, lists and sets
+    d count key value ...   dicts
+    g name                  allowed name, like in defaultdict(list, {})
+    C name nargs nkwargs    call of allowed name, positional arguments and
+      args key value ...    (string key, value) pairs follow
+    a typecode length bytes array.array of little endian items, arrays
+                            of platform dependent size are calls
+
+The name is the length and utf-8 of a new name or the index of a name used
+before with the highest bit set. Integers are little endian, lengths and
+counts are unsigned 32bit. Like in
+pyckle documents, the only callables are the allowed names of Pyckler, so
+loading is as safe as loading of text, but there is nothing to tokenize and
+parse.
+"""
+
+import struct
+import sys
+
+from .encoder import Encoder
+from .limits import LimitError
+
+MAGIC = b'pyckleb\x00'
+
+_LENGTH = struct.Struct('<I')
+_INT8 = struct.Struct('<b')
+_INT16 = struct.Struct('<h')
+_INT32 = struct.Struct('<i')
+_INT64 = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_COMPLEX = struct.Struct('<dd')
+_CALL = struct.Struct('<II')
+
+# headers of records
+_TAG_INT8 = struct.Struct('<cb')
+_TAG_INT16 = struct.Struct('<ch')
+_TAG_INT32 = struct.Struct('<ci')
+_TAG_INT64 = struct.Struct('<cq')
+_TAG_FLOAT = struct.Struct('<cd')
+_TAG_COMPLEX = struct.Struct('<cdd')
+_TAG_LENGTH = struct.Struct('<cI')
+
+_INT64_MIN = -2**63
+_INT64_MAX = 2**63 - 1
+
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+# the name is a reference to the name used before
+_REF = 0x80000000
+
+# tags as ints, data[pos] is an int
+_NONE, _TRUE, _FALSE = ord('N'), ord('T'), ord('F')
+_I8, _I16, _I32, _I64, _BIG = ord('i'), ord('h'), ord('k'), ord('q'), ord('I')
+_F64, _C128 = ord('f'), ord('c')
+_STR, _BYTES = ord('s'), ord('b')
+_TUPLE, _LIST, _SET, _DICT = ord('t'), ord('l'), ord('e'), ord('d')
+_NAME, _CALL_TAG, _ARRAY = ord('g'), ord('C'), ord('a')
+
+def _str(s):
+    data = s.encode('utf-8', 'surrogatepass')
+    return _TAG_LENGTH.pack(b's', len(data)) + data
+
+class BinaryEncoder(Encoder):
+    """Serializer of Python objects to binary pyckle format, it supports
+    the same types as ``Encoder``
+
+    Usage:
+    encoder = BinaryEncoder()
+    encoder.encode({1, 2})
+    b'pyckleb\\x00e\\x02\\x00\\x00\\x00i\\x01i\\x02'
+    """
+
+    _EMPTY = b''
+
+    def __init__(self, globals=None, chunk_size=64*1024):
+        """Initialize a BinaryEncoder
+
+        :param globals: The mapping of names allowed in the output, see
+                        ``Encoder``
+        :param chunk_size: The size of chunks written to file
+        """
+
+        Encoder.__init__(self, globals, chunk_size)
+
+        for typ, writer in (
+            (type(None),    self._write_none),
+            (bool,          self._write_bool),
+            (int,           self._write_int),
+            (float,         self._write_float),
+            (complex,       self._write_complex),
+            (str,           self._write_str),
+            (bytes,         self._write_bytes),
+            (tuple,         self._write_tuple),
+            (list,          self._write_list),
+            (dict,          self._write_dict),
+            (set,           self._write_set),
+            (frozenset,     self._write_set),
+            ):
+            self._writers[typ] = writer
+
+    def encode(self, obj):
+        """return serialized python object as bytes
+
+        raises TypeError for objects, which can't be serialized
+        """
+
+        self._start(None)
+        self._emit(MAGIC)
+        try:
+            self._write(obj)
+            return self._EMPTY.join(self._out)
+        finally:
+            self._out = None
+
+    def dump(self, obj, fp):
+        """serialize python object to a binary file stream by chunks
+
+        :return: sum of numbers returned by ``fp.write``, if it returns them
+
+        raises TypeError for objects, which can't be serialized
+        """
+
+        self._start(fp)
+        self._emit(MAGIC)
+        try:
+            self._write(obj)
+            self._flush()
+            return self._ret
+        finally:
+            self._out = None
+            self._fp = None
+
+    ### private methods
+
+    def _start(self, fp):
+        Encoder._start(self, fp)
+        self._refs = dict()
+
+    # the name field, names written before are referenced by their index
+    def _ref(self, name):
+        try:
+            return _LENGTH.pack(self._refs[name] | _REF)
+        except KeyError:
+            self._refs[name] = len(self._refs)
+            return _str(name)[1:]
+
+    # emit the header and yield the items of container
+    def _write_items(self, obj, header, items):
+        self._enter(obj)
+        self._emit(header)
+        for item in items:
+            yield item
+        self._leave(obj)
+
+    def _write_call(self, obj, *args, **kwargs):
+
+        self._enter(obj)
+        self._emit(
+            b'C' + self._ref(self._name(type(obj))) +
+            _CALL.pack(len(args), len(kwargs)))
+        for arg in args:
+            yield arg
+        for key, value in sorted(kwargs.items()):
+            self._emit(_str(key))
+            yield value
+        self._leave(obj)
+
+    def _write_none(self, obj):
+        self._emit(b'N')
+
+    def _write_bool(self, obj):
+        self._emit(b'T' if obj else b'F')
+
+    def _write_int(self, obj):
+        if -128 <= obj < 128:
+            self._emit(_TAG_INT8.pack(b'i', obj))
+        elif -32768 <= obj < 32768:
+            self._emit(_TAG_INT16.pack(b'h', obj))
+        elif -2**31 <= obj < 2**31:
+            self._emit(_TAG_INT32.pack(b'k', obj))
+        elif _INT64_MIN <= obj <= _INT64_MAX:
+            self._emit(_TAG_INT64.pack(b'q', obj))
+        else:
+            data = obj.to_bytes(obj.bit_length() // 8 + 1, 'little', signed=True)
+            self._emit(_TAG_LENGTH.pack(b'I', len(data)) + data)
+
+    def _write_float(self, obj):
+        self._emit(_TAG_FLOAT.pack(b'f', obj))
+
+    def _write_complex(self, obj):
+        self._emit(_TAG_COMPLEX.pack(b'c', obj.real, obj.imag))
+
+    def _write_str(self, obj):
+        self._emit(_str(obj))
+
+    def _write_bytes(self, obj):
+        self._emit(_TAG_LENGTH.pack(b'b', len(obj)) + obj)
+
+    def _write_tuple(self, obj):
+        return self._write_items(obj, _TAG_LENGTH.pack(b't', len(obj)), obj)
+
+    def _write_list(self, obj):
+        return self._write_items(obj, _TAG_LENGTH.pack(b'l', len(obj)), obj)
+
+    def _write_dict(self, obj):
+
+        self._enter(obj)
+        self._emit(_TAG_LENGTH.pack(b'd', len(obj)))
+        for key, value in obj.items():
+            yield key
+            yield value
+        self._leave(obj)
+
+    def _write_set(self, obj):
+        if type(obj) is set:
+            return self._write_items(obj, _TAG_LENGTH.pack(b'e', len(obj)), obj)
+        return self._write_call(obj, set(obj))
+
+    def _write_array(self, obj):
+        # the size of 'u', 'l' and 'L' items differs by platform
+        if obj.typecode == 'u':
+            return self._write_call(obj, obj.typecode, obj.tounicode())
+        if obj.typecode in ('l', 'L'):
+            return self._write_call(obj, obj.typecode, obj.tolist())
+        self._name(type(obj))
+        if _BIG_ENDIAN:
+            obj = type(obj)(obj.typecode, obj)
+            obj.byteswap()
+        data = obj.tobytes()
+        self._emit(b'a' + obj.typecode.encode('ascii') + _LENGTH.pack(len(data)) + data)
+
+    def _write_defaultdict(self, obj):
+
+        factory = obj.default_factory
+        if factory is not None and factory not in self._names:
+            raise TypeError("'defaultdict' with '{}' factory is not readable".format(
+                getattr(factory, '__name__', factory)))
+
+        self._enter(obj)
+        self._emit(
+            b'C' + self._ref(self._name(type(obj))) + _CALL.pack(2, 0) +
+            (b'N' if factory is None else b'g' + self._ref(self._names[factory])))
+        yield dict(obj)
+        self._leave(obj)
+
+class _Frame(object):
+    """container or call being decoded"""
+
+    __slots__ = ('tag', 'count', 'items', 'func', 'nargs')
+
+    def __init__(self, tag, count, func=None, nargs=0):
+        self.tag = tag
+        self.count = count
+        self.items = list()
+        self.func = func
+        self.nargs = nargs
+
+    def close(self):
+        tag = self.tag
+        items = self.items
+        if tag == _LIST:
+            return items
+        if tag == _TUPLE:
+            return tuple(items)
+        if tag == _DICT:
+            return dict(zip(items[::2], items[1::2]))
+        if tag == _SET:
+            return set(items)
+        nargs = self.nargs
+        kwargs = dict(zip(items[nargs::2], items[nargs+1::2]))
+        return self.func(*items[:nargs], **kwargs)
+
+class BinaryParser(object):
+    """Parser of binary pyckle data
+
+    Usage:
+    parser = BinaryParser(Pyckler([], "<bytes>"))
+    obj = parser.parse(data)
+    """
+
+    def __init__(self, pyckler):
+        """Initialize a BinaryParser
+
+        :param pyckler: The Pyckler instance, which provides allowed names
+                        and limits
+        """
+        self._lookup = pyckler._lookup
+        self._filename = pyckler._filename
+        self._limits = pyckler.limits
+        # objects of names in the order of their definition
+        self._names = list()
+
+    def parse(self, data):
+        """return Python object from binary pyckle data
+
+        raises ValueError for invalid data, LimitError if data exceeds limits
+        """
+
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("{}: not a binary pyckle data".format(self._filename))
+        limits = self._limits
+        if limits is not None:
+            self._limit(limits.exceeded("max_bytes", len(data)), 0)
+        try:
+            return self._parse(data, limits)
+        except (struct.error, IndexError, UnicodeDecodeError) as error:
+            raise ValueError("{}: truncated or invalid binary pyckle data ({})".format(
+                self._filename, error))
+
+    ### private methods
+
+    def _parse(self, data, limits):
+
+        size = len(data)
+        pos = len(MAGIC)
+        stack = list()
+        nodes = 0
+        self._names = list()
+
+        while True:
+
+            tag = data[pos]
+            pos += 1
+            if limits is not None:
+                nodes += 1
+                self._limit(limits.exceeded("max_nodes", nodes), pos - 1)
+
+            if tag == _I8:
+                obj = _INT8.unpack_from(data, pos)[0]
+                pos += 1
+            elif tag == _STR or tag == _BYTES:
+                length = _LENGTH.unpack_from(data, pos)[0]
+                if limits is not None:
+                    self._limit(limits.exceeded("max_str", length), pos - 1)
+                pos += 4
+                end = pos + length
+                if end > size:
+                    raise ValueError("{}: truncated binary pyckle data".format(self._filename))
+                if tag == _STR:
+                    obj = str(data[pos:end], 'utf-8', 'surrogatepass')
+                else:
+                    obj = bytes(data[pos:end])
+                pos = end
+            elif tag == _I16:
+                obj = _INT16.unpack_from(data, pos)[0]
+                pos += 2
+            elif tag == _I32:
+                obj = _INT32.unpack_from(data, pos)[0]
+                pos += 4
+            elif tag == _F64:
+                obj = _FLOAT.unpack_from(data, pos)[0]
+                pos += 8
+            elif tag == _I64:
+                obj = _INT64.unpack_from(data, pos)[0]
+                pos += 8
+            elif tag == _NONE:
+                obj = None
+            elif tag == _TRUE:
+                obj = True
+            elif tag == _FALSE:
+                obj = False
+            elif tag in (_TUPLE, _LIST, _SET, _DICT, _CALL_TAG):
+                start = pos - 1
+                func, nargs = None, 0
+                if tag == _CALL_TAG:
+                    func, pos = self._name(data, pos)
+                    nargs, nkwargs = _CALL.unpack_from(data, pos)
+                    pos += 8
+                    length = nargs + nkwargs
+                    count = nargs + 2 * nkwargs
+                else:
+                    length = count = _LENGTH.unpack_from(data, pos)[0]
+                    pos += 4
+                    if tag == _DICT:
+                        count *= 2
+                if limits is not None:
+                    self._limit(
+                        limits.exceeded("max_depth", len(stack) + 1) or
+                        limits.exceeded("max_length", length),
+                        start)
+                frame = _Frame(tag, count, func, nargs)
+                if count:
+                    stack.append(frame)
+                    continue
+                obj = self._close(frame, start)
+            elif tag == _BIG:
+                length = _LENGTH.unpack_from(data, pos)[0]
+                pos += 4
+                if limits is not None and limits.max_digits is not None:
+                    # 8 bits are more than 2 digits
+                    self._limit(limits.exceeded("max_digits", 2 * length - 2), pos - 5)
+                if pos + length > size:
+                    raise ValueError("{}: truncated binary pyckle data".format(self._filename))
+                obj = int.from_bytes(data[pos:pos+length], 'little', signed=True)
+                if limits is not None:
+                    self._limit(limits.integer(obj), pos - 5)
+                pos += length
+            elif tag == _C128:
+                obj = complex(*_COMPLEX.unpack_from(data, pos))
+                pos += 16
+            elif tag == _NAME:
+                obj, pos = self._name(data, pos)
+            elif tag == _ARRAY:
+                obj, pos = self._array(data, pos)
+            else:
+                raise ValueError("{}: unknown record '{}' at {}".format(
+                    self._filename, chr(tag), pos - 1))
+
+            # add the value to the enclosing frames, which are closed by it
+            while stack:
+                frame = stack[-1]
+                frame.items.append(obj)
+                if len(frame.items) < frame.count:
+                    break
+                stack.pop()
+                obj = self._close(frame, pos)
+            else:
+                if pos != size:
+                    raise ValueError("{}: extra data after binary pyckle data".format(
+                        self._filename))
+                return obj
+
+    # allowed name, return (obj, new pos)
+    def _name(self, data, pos):
+        length = _LENGTH.unpack_from(data, pos)[0]
+        pos += 4
+        if length & _REF:
+            try:
+                return self._names[length & ~_REF], pos
+            except IndexError:
+                raise ValueError("{}: undefined name at {}".format(self._filename, pos - 4))
+        name = str(data[pos:pos+length], 'utf-8')
+        try:
+            obj = self._lookup(name)
+        except (KeyError, ImportError, AttributeError):
+            raise ValueError("{}: '{}' is not allowed name".format(self._filename, name))
+        self._names.append(obj)
+        return obj, pos + length
+
+    def _array(self, data, pos):
+
+        typecode = chr(data[pos])
+        length = _LENGTH.unpack_from(data, pos + 1)[0]
+        pos += 5
+        try:
+            array_f = self._lookup('array.array')
+        except (KeyError, ImportError, AttributeError):
+            raise ValueError("{}: 'array.array' is not allowed name".format(self._filename))
+        if self._limits is not None:
+            self._limit(self._limits.exceeded("max_str", length), pos - 6)
+        if pos + length > len(data):
+            raise ValueError("{}: truncated binary pyckle data".format(self._filename))
+        ret = array_f(typecode)
+        ret.frombytes(data[pos:pos+length])
+        if _BIG_ENDIAN:
+            ret.byteswap()
+        return ret, pos + length
+
+    # close the frame, calls allocating too much memory are not called
+    def _close(self, frame, pos):
+        if frame.tag == _CALL_TAG and self._limits is not None:
+            self._limit(self._limits.allocation(frame.func, frame.items), pos)
+        return frame.close()
+
+    def _limit(self, msg, pos):
+        if msg is not None:
+            raise LimitError(msg, (self._filename, 1, pos + 1, None))
+
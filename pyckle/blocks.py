@@ -0,0 +1,98 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Blocks in pyckle documents
+
+Long numeric sequences are written by ``dumps(obj, block_size=N)`` as one
+base64 string of their little endian items
+
+    pyckle.vector('d', 'mpmZmZmZuT+amZmZmZnJPw==')          # array.array
+    list(pyckle.vector('q', 'AQAAAAAAAAACAAAAAAAAAA=='))    # list
+
+``pyckle.vector`` is an allowed name of Pyckler, so the block is decoded in
+bulk by ``array.frombytes`` instead of creating and evaluating a node for
+every item. The array supports the buffer protocol, ``numpy.asarray`` of it
+does not copy the data.
+
+Lists of dicts of the same string keys are written by
+``dumps(obj, record_size=N)`` as keys and rows of values
+
+    pyckle.records(('id', 'name'), [(1, 'foo'), (2, 'bar')])
+
+so keys are written once and all dicts share the same key objects.
+"""
+
+import binascii
+import sys
+
+# python2 compatibility
+_intern = getattr(sys, "intern", None) or intern
+
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+# the size of 'u', 'l' and 'L' items differs by platform
+_TYPECODES = frozenset('bBhHiIqQfd')
+
+def vector(typecode, data):
+    """return array.array of ``typecode`` from base64 encoded little endian
+    items"""
+
+    if typecode not in _TYPECODES:
+        raise ValueError("one of {} expected for `typecode', `{}' found".format(
+            ", ".join(sorted(_TYPECODES)), typecode))
+    import array
+    ret = array.array(typecode)
+    ret.frombytes(binascii.a2b_base64(data))
+    if _BIG_ENDIAN:
+        ret.byteswap()
+    return ret
+
+def records(keys, rows):
+    """return the list of dicts of ``keys`` and values of each row"""
+
+    keys = tuple(_intern(k) if k.__class__ is str else k for k in keys)
+    n = len(keys)
+    ret = list()
+    for row in rows:
+        if len(row) != n:
+            raise ValueError("{} values expected in the row, {} found".format(n, len(row)))
+        ret.append(dict(zip(keys, row)))
+    return ret
+
+# return base64 of little endian items of array
+def _encode(obj):
+    if _BIG_ENDIAN:
+        obj = type(obj)(obj.typecode, obj)
+        obj.byteswap()
+    return binascii.b2a_base64(obj.tobytes()).decode('ascii').rstrip('\n')
+
+# return array.array of list items or None, if the list is not numeric
+def _array(obj):
+    import array
+    types = set(map(type, obj))
+    if types == {float}:
+        return array.array('d', obj)
+    if types == {int}:
+        try:
+            return array.array('q', obj)
+        except OverflowError:
+            return None
+    return None
+
+# return the keys shared by all dicts of the list or None
+def _shape(obj):
+
+    first = obj[0]
+    if first.__class__ is not dict or not first:
+        return None
+    keys = tuple(first)
+    if any(k.__class__ is not str for k in keys):
+        return None
+    n = len(keys)
+    for d in obj:
+        if d.__class__ is not dict or len(d) != n or tuple(d) != keys:
+            return None
+    return keys
@@ -4,8 +4,11 @@
 #
 
 import os
+import binascii
 import errno
+import mmap
 import pickle
+import time
 import tokenize
 
 # python2 compatibility
@@ -14,19 +17,53 @@ if hasattr(tokenize, "open"):
 else:
     _open = lambda filename: open(filename, 'U')
 
+# python2 compatibility
+_replace = getattr(os, "replace", os.rename)
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
 # python2 compatibility
 try:
     from _pickle import UnpicklingError
 except ImportError:
     from pickle import UnpicklingError
 
-from pyckle.utils import _cache_path, _wr_llong, _rd_llong, _stat
+from pyckle.stats import clock
+from pyckle.utils import _cache_path, _wr_llong, _rd_llong, _stat, _digest
 
 MAGIC=b'pyckle\x00\x00'
+# cache validated by the digest of source
+HMAGIC=b'pyckle\x00\x01'
+# caches with buffers stored out-of-band, validated like MAGIC and HMAGIC
+OMAGIC=b'pyckle\x00\x02'
+OHMAGIC=b'pyckle\x00\x03'
+
+DIGEST_SIZE = 20
+
+# sources modified less than RACY_NS before the cache has been written
+# can be modified again with the same timestamp, so their digest is checked
+RACY_NS = 2 * 10**9
 
 # long long mask
 LL_MASK = 0xFFFFFFFFFFFFFFFF
 
+# smaller buffers are stored in the pickle
+OOB_MIN_SIZE = 4096
+# out-of-band buffers are aligned to this
+OOB_ALIGN = 64
+
+# how many seconds load_cache waits for other process rebuilding the cache
+LOCK_WAIT = 10
+# how often waiting processes check the cache
+LOCK_POLL = 0.01
+
 """
 Cache support for pyckle
 
@@ -36,49 +73,257 @@ only.
 """
 
 class CacheMismatchError(IOError):
-    pass
+    """the cache does not match its source
+
+    ``reason`` is one of "missing", "magic", "size", "timestamp", "digest",
+    "unpickling" or "truncated"
+    """
+
+    def __init__(self, message, reason=None):
+        IOError.__init__(self, message)
+        self.reason = reason
+
+# reconstructors of objects with out-of-band buffers, the buffer is a
+# read-only memoryview of the mapped cache file
+def _load_memoryview(buf, format, shape):
+    ret = memoryview(buf)
+    if format != 'B' or len(shape) != 1:
+        ret = ret.cast(format, shape)
+    return ret
+
+def _load_bytes(buf):
+    return bytes(buf)
+
+def _load_array(typecode, buf):
+    import array
+    ret = array.array(typecode)
+    ret.frombytes(buf)
+    return ret
+
+if hasattr(pickle, "PickleBuffer"):
+
+    class _Pickler(pickle.Pickler):
+        """pickler passing big buffers of bytes, array.array and memoryview
+        objects out-of-band; bytearray does it by itself in protocol 5"""
+
+        def reducer_override(self, obj):
+            typ = type(obj)
+            if typ is bytes and len(obj) >= OOB_MIN_SIZE:
+                return _load_bytes, (pickle.PickleBuffer(obj), )
+            # array module is not imported for the check
+            elif typ.__name__ == "array" and typ.__module__ == "array" and \
+                len(obj) * obj.itemsize >= OOB_MIN_SIZE:
+                return _load_array, (obj.typecode, pickle.PickleBuffer(obj))
+            elif typ is memoryview and obj.nbytes >= OOB_MIN_SIZE and obj.c_contiguous:
+                return _load_memoryview, (pickle.PickleBuffer(obj), obj.format, obj.shape)
+            return NotImplemented
+
+# write the pickle of ``obj`` with big buffers stored out-of-band, so they
+# can be mapped to memory without a copy
+#
+#   length of pickle (8B), number of buffers (8B)
+#   (offset (8B), length (8B)) for every buffer
+#   pickle, buffers aligned to OOB_ALIGN
+def _dump_oob(obj, fp):
+
+    import io
+
+    buffers = list()
+    def buffer_callback(buf):
+        buf = buf.raw()
+        if buf.nbytes < OOB_MIN_SIZE:
+            return True
+        buffers.append(buf)
+        return False
+
+    data = io.BytesIO()
+    _Pickler(data, protocol=5, buffer_callback=buffer_callback).dump(obj)
+    data = data.getbuffer()
+
+    offset = fp.tell() + 16 + 16 * len(buffers) + len(data)
+    offsets = list()
+    for buf in buffers:
+        offset += -offset % OOB_ALIGN
+        offsets.append(offset)
+        offset += buf.nbytes
+
+    _wr_llong(fp, len(data))
+    _wr_llong(fp, len(buffers))
+    for offset, buf in zip(offsets, buffers):
+        _wr_llong(fp, offset)
+        _wr_llong(fp, buf.nbytes)
+    fp.write(data)
+    for offset, buf in zip(offsets, buffers):
+        fp.write(b'\0' * (offset - fp.tell()))
+        fp.write(buf)
+
+# load the pickle written by _dump_oob, buffers are views of the mapped file
+def _load_oob(fp):
+
+    size = _rd_llong(fp)
+    count = _rd_llong(fp)
+    table = [(_rd_llong(fp), _rd_llong(fp)) for i in range(count)]
+    start = fp.tell()
+
+    if hasattr(fp, "getbuffer"):
+        # in-memory cache
+        mv = fp.getbuffer()
+    else:
+        mv = memoryview(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ))
+    if start + size > len(mv) or \
+        any(offset + length > len(mv) for offset, length in table):
+        raise CacheMismatchError("truncated cache", "truncated")
+    return pickle.loads(
+        mv[start:start+size],
+        buffers=[mv[offset:offset+length] for offset, length in table])
 
-def write_cache(obj, filename, cfilename=None):
+# return the header of cache of filename - magic, timestamp, size and digest
+def _header(filename, validate, out_of_band):
+
+    import io
+
+    if validate not in ("stat", "hash"):
+        raise ValueError("stat or hash expected for `validate', `{}' found".format(validate))
+    if out_of_band and pickle.HIGHEST_PROTOCOL < 5:
+        raise ValueError("out_of_band requires pickle protocol 5")
+
+    with _open(filename) as fp:
+        timestamp, size = _stat(filename, fp, ns=validate == "hash")
+        size &= LL_MASK
+
+    if validate == "hash":
+        digest = _digest(filename)
+        if timestamp > time.time() * 10**9 - RACY_NS:
+            timestamp = 0
+
+    if out_of_band:
+        magic = OMAGIC if validate == "stat" else OHMAGIC
+    else:
+        magic = MAGIC if validate == "stat" else HMAGIC
+
+    ret = io.BytesIO()
+    ret.write(magic)
+    _wr_llong(ret, timestamp)
+    _wr_llong(ret, size)
+    if validate == "hash":
+        ret.write(digest)
+    return ret.getvalue()
+
+# write the cache to a file-like object
+def _dump(fp, header, obj, out_of_band):
+    fp.write(header)
+    if out_of_band:
+        _dump_oob(obj, fp)
+    else:
+        pickle.dump(obj, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+# read the cache of filename from a file-like object, return the object and
+# the new timestamp to be stored in the cache or None
+def _load(cfp, filename):
+
+    magic = cfp.read(8)
+    if magic not in (MAGIC, HMAGIC, OMAGIC, OHMAGIC):
+        raise CacheMismatchError("unexpected magic", "magic")
+    hashed = magic in (HMAGIC, OHMAGIC)
+
+    with _open(filename) as fp:
+        timestamp, size = _stat(filename, fp, ns=hashed)
+        size &= LL_MASK
+
+    ctimestamp = int(_rd_llong(cfp))
+    csize = _rd_llong(cfp)
+    if size != csize:
+        raise CacheMismatchError("size mismatch", "size")
+
+    refresh = None
+    if not hashed:
+        if timestamp > ctimestamp:
+            raise CacheMismatchError("timestamp mismatch", "timestamp")
+    else:
+        cdigest = cfp.read(DIGEST_SIZE)
+        # stat data differs, so check the content
+        if timestamp != ctimestamp:
+            if _digest(filename) != cdigest:
+                raise CacheMismatchError("digest mismatch", "digest")
+            if timestamp <= time.time() * 10**9 - RACY_NS:
+                refresh = timestamp
+
+    try:
+        if magic in (OMAGIC, OHMAGIC):
+            obj = _load_oob(cfp)
+        else:
+            obj = pickle.load(cfp)
+    except (UnpicklingError, EOFError, ValueError):
+        raise CacheMismatchError("unpickling error", "unpickling")
+    return obj, refresh
+
+def write_cache(obj, filename, cfilename=None, validate="stat", out_of_band=False):
     """Write cache of pyckle file
 
     :param obj: The object to write.
     :param filename: The source file name, where obj has been serialized.
     :param cfilename: Target cache-file, default to PEP 3147 location
+    :param validate: How ``read_cache`` checks the cache is up to date
+                     "stat" - compare the timestamp (in seconds) and size
+                     "hash" - compare the size and the digest of source,
+                     which is recomputed only if the timestamp (in
+                     nanoseconds) differs
+    :param out_of_band: Store big buffers of bytes, bytearray, array.array
+                        and memoryview objects out of the pickle, so
+                        ``read_cache`` maps them to memory instead of reading,
+                        requires pickle protocol 5. Only memoryview objects
+                        are loaded without any copy, the others own their
+                        memory, so they are copied once from the mapping
+                        (about 2x faster than unpickling for array.array)
 
     :return:  Path to resulting cache file or None if not written
 
+    The cache is written to a temporary file, which is renamed to
+    ``cfilename`` once complete, so the old cache is never truncated while
+    its buffers are mapped to memory by ``read_cache`` and concurrent readers
+    see either the old or the new cache, never a partial one.
+
     **WARNING**: note that caller is responsible to use the same ``obj`` than the
                  one serialized in ``file``, otherwise bad things will happen. The
                  content of cfilename is used as is and not checked, so it can contain
                  any arbitrary python code.
     """
 
-    with _open(filename) as fp:
-        timestamp, size = _stat(filename, fp)
-        size &= LL_MASK
+    header = _header(filename, validate, out_of_band)
 
     if cfilename is None:
         cfilename = _cache_path(filename)
 
-    try:
-        dirname = os.path.dirname(cfilename)
-        if dirname:
-            os.makedirs(dirname)
-    except OSError as error:
-        if error.errno != errno.EEXIST:
-            return None
-    
-    with open(cfilename, 'wb') as fp:
-        fp.write(b'\0\0\0\0\0\0\0\0')
-        _wr_llong(fp, timestamp)
-        _wr_llong(fp, size)
-        pickle.dump(obj, fp, protocol=pickle.HIGHEST_PROTOCOL)
-        fp.flush()
-        fp.seek(0, 0)
-        fp.write(MAGIC)
-        return cfilename
+    if not _makedirs(cfilename):
+        return None
 
-    return None
+    # devices, pipes and alike are written directly, never replaced
+    if os.path.exists(cfilename) and not os.path.isfile(cfilename):
+        tfilename = cfilename
+        fd = os.open(cfilename, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    else:
+        # unique name in the same directory, so rename is atomic and
+        # concurrent writers do not clobber each other, mkstemp is not used
+        # as it ignores umask
+        tfilename = "{}.{}.tmp".format(
+            cfilename, binascii.hexlify(os.urandom(8)).decode("ascii"))
+        fd = os.open(
+            tfilename,
+            os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0),
+            0o666)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            _dump(fp, header, obj, out_of_band)
+        if tfilename != cfilename:
+            _replace(tfilename, cfilename)
+    except BaseException:
+        if tfilename != cfilename:
+            try:
+                os.unlink(tfilename)
+            except OSError:
+                pass
+        raise
+    return cfilename
 
 def read_cache(filename, cfilename=None):
     """Read a cache of pyckle file
@@ -92,24 +337,225 @@ def read_cache(filename, cfilename=None):
     """
 
     if cfilename is None:
-        cfilename = _cache_path(file)
+        cfilename = _cache_path(filename)
 
-    with _open(filename) as fp:
-        timestamp, size = _stat(filename, fp)
-        size &= LL_MASK
+    with open(cfilename, 'rb') as cfp:
+        obj, refresh = _load(cfp, filename)
 
-    with open(cfilename, 'rb') as fp:
-        if fp.read(8) != MAGIC:
-            raise CacheMismatchError("unexpected magic")
-        ctimestamp = int(_rd_llong(fp))
-        csize = _rd_llong(fp)
-        if size != csize:
-            raise CacheMismatchError("size mismatch")
-        if timestamp > ctimestamp:
-            raise CacheMismatchError("timestamp mismatch")
+    # store the new timestamp, so the digest is not computed next time
+    if refresh is not None:
+        try:
+            with open(cfilename, 'r+b') as cfp:
+                cfp.seek(len(HMAGIC), 0)
+                _wr_llong(cfp, refresh)
+        except (IOError, OSError):
+            pass
+
+    return obj
+
+# read_cache recording the "read_cache" phase and the hit or the reason of
+# miss in stats, misses of repeated reads are not recorded
+def _read_cache(filename, cfilename, stats, miss=True):
+
+    if stats is None:
+        return read_cache(filename, cfilename)
+
+    start = clock()
+    try:
+        obj = read_cache(filename, cfilename)
+    except (CacheMismatchError, IOError, OSError) as error:
+        stats.phase("read_cache", start)
+        if miss:
+            stats.cache_event(getattr(error, "reason", None) or "missing")
+        raise
+    stats.phase("read_cache", start)
+    stats.cache_event("hit")
+    return obj
+
+# create the directory of cache, return False on failure
+def _makedirs(cfilename):
+    try:
+        dirname = os.path.dirname(cfilename)
+        if dirname:
+            os.makedirs(dirname)
+    except OSError as error:
+        if error.errno != errno.EEXIST:
+            return False
+    return True
+
+# format of existing cache or the given one
+def _cache_format(cfilename, validate="stat", out_of_band=False):
+
+    try:
+        with open(cfilename, 'rb') as fp:
+            magic = fp.read(8)
+    except (IOError, OSError):
+        return validate, out_of_band
+
+    return \
+        "hash" if magic in (HMAGIC, OHMAGIC) else "stat", \
+        magic in (OMAGIC, OHMAGIC)
+
+class _RebuildLock(object):
+    """exclusive lock of the cache being rebuilt
+
+    It is a lock of the operating system (flock or msvcrt.locking), so it is
+    released when its owner dies and it never needs to be broken. The lock
+    file is never removed, as it would let two processes lock two different
+    files. It contains the stat data of source, for which the rebuild has
+    failed, so others do not wait for (and do not try) a rebuild, which
+    fails again.
+    """
+
+    def __init__(self, lfilename):
+        # raises OSError if not possible
+        if fcntl is None and msvcrt is None:
+            raise OSError(errno.ENOSYS, "file locking is not supported")
+        self._fd = os.open(
+            lfilename,
+            os.O_CREAT | os.O_RDWR | getattr(os, "O_BINARY", 0),
+            0o666)
+        self._locked = False
+
+    def acquire(self):
+        """try to lock, return True if locked"""
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                os.lseek(self._fd, 0, 0)
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+        except (IOError, OSError):
+            return False
+        self._locked = True
+        return True
+
+    def release(self):
+        if not self._locked:
+            return
+        self._locked = False
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, 0)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    def close(self):
+        self.release()
+        os.close(self._fd)
+
+    def failed(self, st):
+        """return True if rebuild failed for source with given stat data"""
+        try:
+            os.lseek(self._fd, 0, 0)
+            return os.read(self._fd, 64) == self._record(st)
+        except OSError:
+            return False
+
+    def record(self, st):
+        """record the failure of rebuild of source with given stat data, or
+        clear it if ``st`` is None, the lock must be held"""
         try:
-            return pickle.load(fp)
-        except UnpicklingError:
+            os.lseek(self._fd, 0, 0)
+            os.ftruncate(self._fd, 0)
+            if st is not None:
+                os.write(self._fd, self._record(st))
+        except OSError:
             pass
-        raise CacheMismatchError("unpickling error")
-    raise CacheMismatchError("IOError")
+
+    @staticmethod
+    def _record(st):
+        return "{} {}\n".format(*st).encode("ascii")
+
+def load_cache(filename, load_f, cfilename=None, wait=LOCK_WAIT,
+    validate="stat", out_of_band=False, stats=None):
+    """Read a cache of pyckle file, rebuild it if does not match
+
+    Reading is lock-free. Only one of concurrent callers (threads or
+    processes) rebuilds the missing or outdated cache by calling ``load_f``
+    and writing its result, the others wait up to ``wait`` seconds for the new
+    cache, then they call ``load_f`` themselves. If the rebuild fails (load_f
+    raises or the result can't be pickled), it is recorded, so waiting
+    callers call ``load_f`` at once and nobody tries to rebuild the cache until
+    the source changes. The rebuilt cache has the same format like the
+    outdated one, a missing cache is written in the format given by
+    ``validate`` and ``out_of_band``.
+
+    :param filename: The source file name
+    :param load_f: The function returning the object loaded from source
+    :param cfilename: Target cache-file, default to PEP 3147 location
+    :param wait: The maximum number of seconds spent waiting for other
+                 process rebuilding the cache
+    :param validate: The validation of missing cache, see ``write_cache``
+    :param out_of_band: Out-of-band buffers in missing cache, see
+                        ``write_cache``
+    :param stats: The ``pyckle.Stats`` recording read_cache and write_cache
+                  phases and the cache hit or the reason of miss
+
+    :return: The object from cache or returned by ``load_f``
+    """
+
+    if cfilename is None:
+        cfilename = _cache_path(filename)
+
+    try:
+        return _read_cache(filename, cfilename, stats)
+    except (CacheMismatchError, IOError, OSError):
+        pass
+
+    st = _stat(filename, ns=True)
+    try:
+        if not _makedirs(cfilename):
+            raise OSError(errno.EACCES, "can't create cache directory")
+        lock = _RebuildLock(cfilename + ".lock")
+    except OSError:
+        # cache directory does not exist or is not writable
+        return load_f()
+
+    try:
+        deadline = time.time() + wait
+        while not lock.acquire():
+            if lock.failed(st) or time.time() > deadline:
+                break
+            time.sleep(LOCK_POLL)
+            try:
+                return _read_cache(filename, cfilename, stats, miss=False)
+            except (CacheMismatchError, IOError, OSError):
+                pass
+        else:
+            # rebuilt by the previous owner of the lock
+            try:
+                return _read_cache(filename, cfilename, stats, miss=False)
+            except (CacheMismatchError, IOError, OSError):
+                pass
+            if not lock.failed(st):
+                fmt = _cache_format(cfilename, validate, out_of_band)
+                return _rebuild(filename, load_f, cfilename, lock, st, fmt, stats)
+    finally:
+        lock.close()
+
+    return load_f()
+
+# rebuild the cache holding the lock
+def _rebuild(filename, load_f, cfilename, lock, st, fmt, stats=None):
+
+    validate, out_of_band = fmt
+    try:
+        obj = load_f()
+    except Exception:
+        lock.record(st)
+        raise
+
+    # source changed while loaded, cache would not match its content
+    if st != _stat(filename, ns=True):
+        return obj
+    if stats is not None:
+        start = clock()
+    try:
+        write_cache(obj, filename, cfilename, validate, out_of_band)
+        lock.record(None)
+    except (IOError, OSError, pickle.PicklingError, TypeError, ValueError):
+        lock.record(st)
+    if stats is not None:
+        stats.phase("write_cache", start)
+    return obj
@@ -0,0 +1,145 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Columns of records of pyckle documents
+
+    table = loads(document, columns=True)
+    total = sum(table["price"])
+    for row in table.rows():
+        print(row.name, row.price)
+
+A list of dicts with the same string keys is turned into Columns, a dict of
+one column per key. Columns of ints and floats are ``array.array`` of 'q' and
+'d' items, others are lists, so aggregations never touch the per row dicts.
+Other objects are returned unchanged.
+
+``dumps(obj, record_size=N)`` writes such lists as ``pyckle.records``, which
+are read without repeating the keys, see ``pyckle.blocks``. With columns,
+``pyckle.records`` of the namespace is replaced by ``records`` building the
+Columns from rows directly, so the dicts of rows are never created, nested
+records are read as Columns too.
+"""
+
+from .blocks import _array, _intern, _shape
+
+class Columns(dict):
+    """Dict of columns of the same length
+
+    :ivar length: The number of rows
+    """
+
+    def __init__(self, columns, length):
+        """Initialize Columns
+
+        :param columns: The mapping or pairs of key and column
+        :param length: The number of rows
+        """
+
+        dict.__init__(self, columns)
+        self.length = length
+
+    def __repr__(self):
+        return "Columns({}, {})".format(dict.__repr__(self), self.length)
+
+    def row(self, index):
+        """return the Row view of row ``index``"""
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("row index out of range")
+        return Row(self, index)
+
+    def rows(self):
+        """return iterator over Row views of all rows"""
+        return (Row(self, i) for i in range(self.length))
+
+class Row(object):
+    """View of one row of Columns, values are read by key or attribute"""
+
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns, index):
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._columns[key][self._index]
+
+    def __getattr__(self, name):
+        try:
+            return self._columns[name][self._index]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            other = dict(other.items())
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    # python2 compatibility
+    __hash__ = None
+
+    def __repr__(self):
+        return "Row({!r})".format(dict(self.items()))
+
+    def keys(self):
+        return self._columns.keys()
+
+    def items(self):
+        index = self._index
+        return [(key, column[index]) for key, column in self._columns.items()]
+
+def columns(obj):
+    """return Columns of the list of dicts with the same string keys, other
+    objects are returned unchanged"""
+
+    if obj.__class__ is not list or not obj:
+        return obj
+    keys = _shape(obj)
+    if keys is None:
+        return obj
+    # _shape checked the order of keys of every dict
+    values = zip(*(d.values() for d in obj))
+    return Columns(
+        ((key, _column(value)) for key, value in zip(keys, values)),
+        len(obj))
+
+def records(keys, rows):
+    """return Columns of ``keys`` and values of each row, ``pyckle.records``
+    with columns"""
+
+    keys = tuple(_intern(k) if k.__class__ is str else k for k in keys)
+    n = len(keys)
+    for row in rows:
+        if len(row) != n:
+            raise ValueError("{} values expected in the row, {} found".format(n, len(row)))
+    values = zip(*rows) if rows else [()] * n
+    return Columns(
+        ((key, _column(value)) for key, value in zip(keys, values)),
+        len(rows))
+
+# return the copy of globals reading pyckle.records as Columns, if the name
+# is allowed and not given by the caller
+def _globals(cls, globals):
+    if 'pyckle.records' in globals or 'pyckle.records' not in cls.__GLOBALS__:
+        return globals
+    ret = dict(globals)
+    ret['pyckle.records'] = records
+    return ret
+
+# return array.array of numeric column or list
+def _column(values):
+    ret = _array(values)
+    return ret if ret is not None else list(values)
@@ -0,0 +1,390 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Serializer of Python objects to pyckle documents
+
+Objects are written by writers dispatched by their exact type, so subclasses
+of builtin types are not serialized unless they have a writer too. Types from
+standard library are written as calls of their fully qualified names, like
+fractions.Fraction(1, 3), so the output loads back through Pyckler. Long
+numeric lists and arrays and lists of records can be written as blocks, see
+``pyckle.blocks``.
+"""
+
+from .blocks import _array, _encode, _shape, _TYPECODES
+from .utils import _Lazy, _make_globals
+
+_INF = float('inf')
+
+# marks the exhausted generator of items
+_END = object()
+
+# python2 compatibility
+try:
+    _PY2_TYPES = (long, unicode)
+except NameError:
+    _PY2_TYPES = ()
+
+# globals with lazily imported names resolved, if their modules are imported
+# already, objects of types from other modules can't exist
+def _loaded(globals):
+    ret = dict()
+    for name, value in globals.items():
+        if value.__class__ is _Lazy:
+            if not value.loaded():
+                continue
+            try:
+                value = value.resolve()
+            except (ImportError, AttributeError):
+                continue
+        ret[name] = value
+    return ret
+
+class Encoder(object):
+    """Serializer of Python objects
+
+    Usage:
+    encoder = Encoder()
+    encoder.encode({1, 2})
+    '{1, 2}'
+    """
+
+    # the output is joined by it
+    _EMPTY = ''
+
+    def __init__(self, globals=None, chunk_size=64*1024, block_size=None,
+        record_size=None):
+        """Initialize an Encoder
+
+        :param globals: The mapping of names allowed in the output, defaults
+                        to globals of ``Pyckler``, types missing there are
+                        not serialized
+        :param chunk_size: The size of chunks written to file
+        :param block_size: Lists of floats or ints (int64) and numeric arrays
+                           with at least ``block_size`` items are written as
+                           blocks decoded in bulk, defaults to None (never),
+                           requires ``pyckle.vector`` in globals
+        :param record_size: Lists of at least ``record_size`` dicts with the
+                            same string keys are written as keys and rows
+                            of values, defaults to None (never), requires
+                            ``pyckle.records`` in globals
+        """
+
+        if globals is None:
+            globals = _make_globals()
+        globals = _loaded(globals)
+
+        self._chunk_size = chunk_size
+        self._names = {v : k for k, v in globals.items() if isinstance(v, type)}
+        self._block_size = block_size if 'pyckle.vector' in globals else None
+        self._record_size = record_size if 'pyckle.records' in globals else None
+        self._writers = dict()
+
+        for typ, writer in (
+            (type(None),    self._write_repr),
+            (bool,          self._write_repr),
+            (int,           self._write_repr),
+            (float,         self._write_float),
+            (complex,       self._write_complex),
+            (str,           self._write_repr),
+            (bytes,         self._write_repr),
+            (tuple,         self._write_tuple),
+            (list,          self._write_list),
+            (dict,          self._write_dict),
+            (set,           self._write_set),
+            (frozenset,     self._write_set),
+            ):
+            self._writers[typ] = writer
+
+        for typ in _PY2_TYPES:
+            self._writers[typ] = self._write_repr
+
+        for name, writer in (
+            ('bytearray',               self._write_bytearray),
+            ('memoryview',              self._write_memoryview),
+            ('array.array',             self._write_array),
+            ('collections.deque',       self._write_deque),
+            ('collections.Counter',     self._write_counter),
+            ('collections.ChainMap',    self._write_chainmap),
+            ('collections.OrderedDict', self._write_ordereddict),
+            ('collections.defaultdict', self._write_defaultdict),
+            ('datetime.date',           self._write_date),
+            ('datetime.time',           self._write_time),
+            ('datetime.datetime',       self._write_datetime),
+            ('datetime.timedelta',      self._write_timedelta),
+            ('datetime.timezone',       self._write_timezone),
+            ('decimal.Decimal',         self._write_decimal),
+            ('fractions.Fraction',      self._write_fraction),
+            ):
+            typ = globals.get(name)
+            if isinstance(typ, type):
+                self._writers[typ] = writer
+
+        self._out = None
+        self._size = 0
+        self._fp = None
+        self._ret = None
+        self._ids = set()
+
+    def encode(self, obj):
+        """return serialized python object as a string
+
+        raises TypeError for objects, which can't be serialized
+        """
+
+        self._start(None)
+        try:
+            self._write(obj)
+            return self._EMPTY.join(self._out)
+        finally:
+            self._out = None
+
+    def dump(self, obj, fp):
+        """serialize python object to a file stream by chunks
+
+        :return: sum of numbers returned by ``fp.write``, if it returns them
+
+        raises TypeError for objects, which can't be serialized
+        """
+
+        self._start(fp)
+        try:
+            self._write(obj)
+            self._flush()
+            return self._ret
+        finally:
+            self._out = None
+            self._fp = None
+
+    ### private methods
+
+    def _start(self, fp):
+        self._out = list()
+        self._size = 0
+        self._fp = fp
+        self._ret = None
+        self._ids = set()
+
+    # append a string to output, write it to fp once there is enough of it
+    def _emit(self, s):
+        self._out.append(s)
+        self._size += len(s)
+        if self._fp is not None and self._size >= self._chunk_size:
+            self._flush()
+
+    def _flush(self):
+        ret = self._fp.write(self._EMPTY.join(self._out))
+        if ret is not None:
+            self._ret = (self._ret or 0) + ret
+        del self._out[:]
+        self._size = 0
+
+    # writers of scalars emit them directly, writers of containers return a
+    # generator, which emits the surrounding text and yields the items to be
+    # written, so nested containers are kept on the explicit stack
+    def _write(self, obj):
+
+        writers = self._writers
+        stack = list()
+
+        while True:
+            try:
+                writer = writers[type(obj)]
+            except KeyError:
+                raise TypeError("'{}' is not readable".format(type(obj).__name__))
+            items = writer(obj)
+            if items is not None:
+                stack.append(items)
+
+            # find the next object to write
+            while stack:
+                obj = next(stack[-1], _END)
+                if obj is not _END:
+                    break
+                stack.pop()
+            else:
+                return
+
+    # the name of type in the output
+    def _name(self, typ):
+        try:
+            return self._names[typ]
+        except KeyError:
+            raise TypeError("'{}' is not allowed name".format(typ.__name__))
+
+    # mark the container as being written, so recursive ones are detected
+    def _enter(self, obj):
+        if id(obj) in self._ids:
+            raise TypeError("'{}' is recursive".format(type(obj).__name__))
+        self._ids.add(id(obj))
+
+    def _leave(self, obj):
+        self._ids.discard(id(obj))
+
+    # yield items of a container separated by commas
+    def _write_items(self, obj, opening, items, closing):
+
+        self._enter(obj)
+        self._emit(opening)
+        first = True
+        for item in items:
+            if not first:
+                self._emit(', ')
+            first = False
+            yield item
+        self._emit(closing)
+        self._leave(obj)
+
+    # write obj as a call of its type with given arguments, keyword
+    # arguments must be literals
+    def _write_call(self, obj, *args, **kwargs):
+        closing = ''.join(
+            ', {}={!r}'.format(k, v) for k, v in sorted(kwargs.items()))
+        return self._write_items(obj, self._name(type(obj)) + '(', args, closing + ')')
+
+    def _write_repr(self, obj):
+        self._emit(repr(obj))
+
+    def _write_float(self, obj):
+        # inf and nan are not python literals
+        if obj != obj or obj in (_INF, -_INF):
+            self._emit("float('{!r}')".format(obj))
+        else:
+            self._emit(repr(obj))
+
+    def _write_complex(self, obj):
+        if  obj.real != obj.real or obj.real in (_INF, -_INF) or \
+            obj.imag != obj.imag or obj.imag in (_INF, -_INF):
+            return self._write_call(obj, obj.real, obj.imag)
+        self._emit(repr(obj))
+
+    def _write_tuple(self, obj):
+        return self._write_items(obj, '(', obj, ',)' if len(obj) == 1 else ')')
+
+    def _write_list(self, obj):
+        if self._block_size is not None and len(obj) >= self._block_size \
+            and list in self._names:
+            block = _array(obj)
+            if block is not None:
+                self._emit('{}({})'.format(self._names[list], self._vector(block)))
+                return None
+        if self._record_size is not None and len(obj) >= self._record_size:
+            keys = _shape(obj)
+            if keys is not None:
+                return self._write_items(
+                    obj,
+                    'pyckle.records({!r}, ['.format(keys),
+                    (tuple(d.values()) for d in obj),
+                    '])')
+        return self._write_items(obj, '[', obj, ']')
+
+    def _write_dict(self, obj):
+
+        self._enter(obj)
+        self._emit('{')
+        first = True
+        for key, value in obj.items():
+            if not first:
+                self._emit(', ')
+            first = False
+            yield key
+            self._emit(': ')
+            yield value
+        self._emit('}')
+        self._leave(obj)
+
+    def _write_set(self, obj):
+        if not obj:
+            self._emit(self._name(type(obj)) + '()')
+        elif type(obj) is set:
+            return self._write_items(obj, '{', obj, '}')
+        else:
+            return self._write_items(obj, self._name(type(obj)) + '({', obj, '})')
+
+    def _write_bytearray(self, obj):
+        return self._write_call(obj, bytes(obj))
+
+    def _write_memoryview(self, obj):
+        if obj.format != 'B':
+            raise TypeError("'memoryview' of format '{}' is not readable".format(obj.format))
+        return self._write_call(obj, obj.tobytes())
+
+    def _write_array(self, obj):
+        if self._block_size is not None and len(obj) >= self._block_size \
+            and obj.typecode in _TYPECODES:
+            self._emit(self._vector(obj))
+        elif obj.typecode == 'u':
+            return self._write_call(obj, obj.typecode, obj.tounicode())
+        else:
+            return self._write_call(obj, obj.typecode, obj.tolist())
+
+    def _vector(self, obj):
+        return "pyckle.vector('{}', '{}')".format(obj.typecode, _encode(obj))
+
+    def _write_deque(self, obj):
+        if obj.maxlen is None:
+            return self._write_call(obj, list(obj))
+        else:
+            return self._write_call(obj, list(obj), obj.maxlen)
+
+    def _write_counter(self, obj):
+        return self._write_call(obj, dict(obj))
+
+    def _write_chainmap(self, obj):
+        return self._write_call(obj, *obj.maps)
+
+    def _write_ordereddict(self, obj):
+        return self._write_call(obj, list(obj.items()))
+
+    def _write_defaultdict(self, obj):
+        factory = obj.default_factory
+        if factory is not None and factory not in self._names:
+            raise TypeError("'defaultdict' with '{}' factory is not readable".format(
+                getattr(factory, '__name__', factory)))
+        return self._write_items(
+            obj,
+            '{}({}, '.format(
+                self._name(type(obj)),
+                'None' if factory is None else self._names[factory]),
+            (dict(obj), ),
+            ')')
+
+    def _write_date(self, obj):
+        return self._write_call(obj, obj.year, obj.month, obj.day)
+
+    def _write_time(self, obj):
+        args = [obj.hour, obj.minute, obj.second, obj.microsecond]
+        if obj.tzinfo is not None:
+            args.append(obj.tzinfo)
+        return self._write_call(obj, *args, **self._fold(obj))
+
+    def _write_datetime(self, obj):
+        args = [obj.year, obj.month, obj.day,
+                obj.hour, obj.minute, obj.second, obj.microsecond]
+        if obj.tzinfo is not None:
+            args.append(obj.tzinfo)
+        return self._write_call(obj, *args, **self._fold(obj))
+
+    # fold of repeated local time, python 3.6+
+    def _fold(self, obj):
+        return {'fold' : 1} if getattr(obj, 'fold', 0) else {}
+
+    def _write_timedelta(self, obj):
+        return self._write_call(obj, obj.days, obj.seconds, obj.microseconds)
+
+    def _write_timezone(self, obj):
+        offset = obj.utcoffset(None)
+        name = obj.tzname(None)
+        if name == type(obj)(offset).tzname(None):
+            return self._write_call(obj, offset)
+        else:
+            return self._write_call(obj, offset, name)
+
+    def _write_decimal(self, obj):
+        return self._write_call(obj, str(obj))
+
+    def _write_fraction(self, obj):
+        return self._write_call(obj, obj.numerator, obj.denominator)
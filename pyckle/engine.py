@@ -0,0 +1,107 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Reusable engine loading any number of pyckle documents
+
+    engine = Engine(globals={"Point": Point}, method="decode")
+    obj = engine.loads("Point(1, 2)")
+    obj2 = engine.load(fp)
+
+``loads`` and ``load`` prepare the namespace (copy of ``__GLOBALS__``,
+imports of modules) for every document, the engine does it once.
+"""
+
+from .columns import columns as _columns, _globals as _columns_globals
+from .interner import Interner
+from .jsonlike import _fast
+from .limits import _read
+from .pyckler import Pyckler, _Namespace
+from .utils import _fix_imports
+
+class Engine(object):
+    """Pyckler class, globals and method prepared once
+
+    The namespace, module imports and dispatch tables of ``cls`` are prepared
+    when the engine is created, each document creates just a light-weight
+    ``cls`` instance sharing them. The engine is never modified by loads, so
+    it can be shared by threads.
+    """
+
+    def __init__(self, cls=Pyckler, globals=dict(), method="eval", fix_imports=True,
+        limits=None, intern=None, columns=False):
+        """Initialize an Engine
+
+        :param cls: The visitor class used for evaluation, defaults to ``Pyckler``
+        :param globals: An aditional namespace mapping
+        :param method: "eval" (default), "build" or "decode", see ``loads``
+        :param fix_imports: Add all underlying modules into globals
+        :param limits: The ``Limits`` of documents, see ``loads``
+        :param intern: The ``Interner`` shared by all documents, True for
+                       a new one, see ``loads``
+        :param columns: Return records as ``Columns``, see ``loads``
+        """
+
+        # pyckle package imports this module
+        from . import _METHODS
+        if method not in _METHODS:
+            raise ValueError("one of {} expected for `method', `{}' found".format(
+                ", ".join(_METHODS), method))
+
+        namespace = dict(cls.__GLOBALS__)
+        # records are built as Columns
+        namespace.update(_columns_globals(cls, globals) if columns else globals)
+        if fix_imports:
+            namespace = _fix_imports(namespace)
+
+        self.cls = cls
+        self.method = method
+        self.limits = limits
+        self.intern = Interner() if intern is True else intern
+        self.columns = columns
+        self._namespace = _Namespace(namespace)
+        cls._dispatch_table("visit_")
+        cls._dispatch_table("build_")
+
+    def pyckler(self, source, filename="<string>"):
+        """return ``cls`` instance for the source sharing prepared namespace"""
+        ret = self.cls(source, filename, self._namespace)
+        if self.limits is not None:
+            ret.limits = self.limits
+        if self.intern:
+            ret.intern = self.intern
+        return ret
+
+    def loads(self, string):
+        """Deserialize and evaluate string with a valid pyckle document
+
+        :param string: The (unicode) string or string list with a document
+
+        :return: Resulting python object
+        """
+
+        if not isinstance(string, (str, list, tuple)):
+            raise TypeError("str, list, tuple expected for `string', `{}' found".format(type(string)))
+        obj, ok = _fast(self.cls, string, limits=self.limits, intern=self.intern)
+        if not ok:
+            obj = getattr(self.pyckler(string), self.method)()
+        return _columns(obj) if self.columns else obj
+
+    def load(self, fp):
+        """Deserialize and evaluate file-like object containing a valid pyckle
+        document
+
+        :param fp: The file-like object with ``.readlines()`` method
+
+        :return: Resulting python object
+        """
+
+        lines = _read(fp, self.limits)
+        obj, ok = _fast(self.cls, lines, limits=self.limits, intern=self.intern)
+        if not ok:
+            obj = getattr(
+                self.pyckler(lines, fp.name if hasattr(fp, "name") else "<unknown>"),
+                self.method)()
+        return _columns(obj) if self.columns else obj
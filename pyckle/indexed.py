@@ -0,0 +1,291 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Random access to entries of big pyckle documents
+
+    with open_indexed("data.pyckle") as doc:
+        value = doc["key"]
+
+The document with a top-level dict is scanned once for byte offsets of its
+entries, without creating any value. The index is stored next to the cache
+of document (``pyckle.cache.load_cache``), so it is rebuilt only when the
+document changes, the content of document is validated by its hash, as stale
+offsets of the same size rewrite would read wrong spans. The document is mapped to memory and just the entry being
+read is parsed, so reading one key of a huge document costs the parsing of
+its value only. Values are parsed on every access, they are not kept.
+
+With ``nested=True`` the entries of dicts which are values of the top-level
+dict are indexed too, such values are returned as IndexedDict.
+"""
+
+import mmap
+import re
+import tokenize
+
+# python2 compatibility
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from .cache import load_cache
+from .engine import Engine
+from .pyckler import Pyckler
+from .utils import _index_path
+
+_BOM = b'\xef\xbb\xbf'
+
+# whitespace, line continuations and comments
+_WS = re.compile(br'(?:[ \t\f\r\n]+|\\\r?\n|\#[^\r\n]*)*')
+
+# brackets, separators, strings and comments of document, other characters
+# (numbers, names, operators) are skipped, a lone quote starts an
+# unterminated string
+_TOKEN = re.compile(br'''
+    [][(){},:]
+    |\'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'
+    |"""(?:[^"\\]|\\.|"(?!""))*"""
+    |'(?:[^'\\\n]|\\.)*'
+    |"(?:[^"\\\n]|\\.)*"
+    |\#[^\r\n]*
+    |['"]
+    ''', re.VERBOSE | re.DOTALL)
+
+_SPACES = frozenset((b' ', b'\t', b'\f', b'\r', b'\n'))
+
+# characters are compared as ints
+_OPENING = frozenset(map(ord, '([{'))
+_CLOSING = dict((ord(c), ord(o)) for c, o in (')(', '][', '}{'))
+
+class IndexedDict(Mapping):
+    """Read-only mapping of top-level entries of the document
+
+    Keys are loaded by the index, values are parsed from the mapped document
+    on access. Close it (or use ``with``) to unmap the document, nested
+    IndexedDict instances share the mapping.
+    """
+
+    def __init__(self, buf, index, engine, encoding):
+        self._buf = buf
+        self._index = index
+        self._engine = engine
+        self._encoding = encoding
+
+    def __getitem__(self, key):
+        start, end, children = self._index[key]
+        if children is not None:
+            return IndexedDict(self._buf, children, self._engine, self._encoding)
+        return _load(self._engine, self._buf, start, end, self._encoding)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __repr__(self):
+        return "<IndexedDict of {} entries>".format(len(self._index))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def span(self, key):
+        """return (start, end) byte offsets of the value of ``key``"""
+        start, end, _ = self._index[key]
+        return start, end
+
+    def close(self):
+        """unmap the document"""
+        if hasattr(self._buf, "close"):
+            self._buf.close()
+
+def open_indexed(path, cls=Pyckler, globals=dict(), method="decode",
+    nested=False, use_cache=True):
+    """Open pyckle file with a top-level dict for reading of single entries
+
+    :param path: The path of file
+    :param cls: The visitor class used for evaluation, defaults to ``Pyckler``
+    :param globals: An aditional namespace mapping
+    :param method: "eval", "build" or "decode" (default), see ``loads``
+    :param nested: Index entries of dicts on the second level too
+    :param use_cache: Store the index next to the cache of file, so it is
+                      built once for every change of file
+
+    :return: IndexedDict of entries
+    """
+
+    engine = Engine(cls, globals, method)
+    with open(path, 'rb') as fp:
+        encoding = _encoding(fp)
+        if _size(fp) == 0:
+            buf = b''
+        else:
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def index_f():
+        return _scan(buf, path, nested, engine, encoding)
+
+    try:
+        if use_cache:
+            index = load_cache(
+                path, index_f, _index_path(path, nested), validate="hash")
+        else:
+            index = index_f()
+    except BaseException:
+        # the traceback can refer to the scanner of mapping, it is unmapped
+        # once released then
+        try:
+            if buf:
+                buf.close()
+        except BufferError:
+            pass
+        raise
+    return IndexedDict(buf, index, engine, encoding)
+
+# return the encoding of document given by the coding cookie
+def _encoding(fp):
+    # python2 compatibility
+    detect = getattr(tokenize, "detect_encoding", None)
+    if detect is None:
+        return "utf-8"
+    encoding, _ = detect(fp.readline)
+    fp.seek(0)
+    # the BOM is skipped by _scan
+    return "utf-8" if encoding == "utf-8-sig" else encoding
+
+def _size(fp):
+    fp.seek(0, 2)
+    ret = fp.tell()
+    fp.seek(0)
+    return ret
+
+# return the index of top-level dict of the document
+def _scan(buf, filename, nested, engine, encoding):
+
+    pos = len(_BOM) if buf[:len(_BOM)] == _BOM else 0
+    pos = _WS.match(buf, pos).end()
+    if buf[pos:pos+1] != b'{':
+        _error("dict expected", buf, pos, filename)
+
+    tokens = _TOKEN.finditer(buf, pos + 1)
+    entries, pos = _entries(buf, tokens, pos, nested, True, filename)
+
+    pos = _WS.match(buf, pos).end()
+    if pos != len(buf):
+        _error("invalid syntax", buf, pos, filename)
+
+    # just keys are parsed
+    def index(entries):
+        ret = dict()
+        for kstart, kend, vstart, vend, children in entries:
+            key = _load(engine, buf, kstart, kend, encoding)
+            ret[key] = (
+                vstart, vend, None if children is None else index(children))
+        return ret
+
+    return index(entries)
+
+# return the value of the span, the span continued on the next lines is
+# parenthesized, so it is a valid expression
+def _load(engine, buf, start, end, encoding):
+    text = buf[start:end].decode(encoding)
+    if '\n' in text:
+        text = '(' + text + '\n)'
+    return engine.loads(text)
+
+# return the list of (key start, key end, value start, value end, children)
+# of the dict opened at ``pos`` and the position after it, the nested dicts
+# are indexed if ``nested`` is True, children is the list of their entries;
+# when ``strict`` is False, None is returned for a set instead of an error
+def _entries(buf, tokens, pos, nested, strict, filename):
+
+    ret = list()
+    stack = list()
+    start = pos + 1
+    colon = None
+    children = None
+    isset = False
+
+    for m in tokens:
+        c = buf[m.start()]
+        # python2 compatibility
+        if c.__class__ is not int:
+            c = ord(c)
+
+        if c in _OPENING:
+            stack.append(c)
+            continue
+
+        if c in _CLOSING:
+            if stack:
+                if stack.pop() != _CLOSING[c]:
+                    _error("closing parenthesis does not match", buf, m.start(), filename)
+                continue
+            if c != ord(b'}'):
+                _error("closing parenthesis does not match", buf, m.start(), filename)
+            if colon is not None:
+                ret.append(_entry(buf, start, colon, m.start(), children))
+            elif _WS.match(buf, start).end() != m.start():
+                isset = True
+            if isset:
+                if strict:
+                    _error("dict expected", buf, pos, filename)
+                return None, m.end()
+            return ret, m.end()
+
+        if c in (ord(b'"'), ord(b"'")) and m.end() - m.start() == 1:
+            _error("unterminated string", buf, m.start(), filename)
+        if stack:
+            continue
+
+        if c == ord(b':'):
+            if colon is not None or isset:
+                _error("invalid syntax", buf, m.start(), filename)
+            colon = m.end()
+            p = _WS.match(buf, colon).end()
+            if nested and buf[p:p+1] == b'{':
+                next(tokens)
+                children, _ = _entries(buf, tokens, p, False, False, filename)
+        elif c == ord(b','):
+            if colon is None:
+                isset = True
+                if strict:
+                    _error("dict expected", buf, pos, filename)
+            else:
+                ret.append(_entry(buf, start, colon, m.start(), children))
+            start = m.end()
+            colon = None
+            children = None
+
+    _error("unexpected EOF while parsing", buf, pos, filename)
+
+# return the entry of spans of key and value without surrounding whitespace,
+# so the indented entry is a valid expression for ast.parse
+def _entry(buf, start, colon, end, children):
+    return _strip(buf, start, colon - 1) + _strip(buf, colon, end) + (children, )
+
+def _strip(buf, start, end):
+    start = _WS.match(buf, start, end).end()
+    while end > start and buf[end-1:end] in _SPACES:
+        end -= 1
+    return start, end
+
+def _error(msg, buf, pos, filename):
+
+    start = buf.rfind(b'\n', 0, pos) + 1
+    end = buf.find(b'\n', pos)
+    end = len(buf) if end == -1 else end + 1
+    lineno = buf[:pos].count(b'\n') + 1
+
+    raise SyntaxError(
+        msg,
+        (filename, lineno, pos - start + 1, buf[start:end].decode("utf-8", "replace")))
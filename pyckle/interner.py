@@ -0,0 +1,54 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Sharing of equal strings of loaded documents
+
+    interner = Interner(max_length=32)
+    rows = loads(document, intern=interner)
+    more = loads(other, intern=interner)
+
+Documents with many records repeat the same dict keys and short values,
+each occurrence becomes a separate string object. With an Interner, dict keys
+are interned by ``sys.intern`` and strings up to ``max_length`` characters
+are shared through its table, which can be used by any number of loads.
+"""
+
+import sys
+
+# python2 compatibility
+_intern = getattr(sys, "intern", None) or intern
+
+class Interner(object):
+    """Table of shared strings
+
+    :ivar table: The dict of shared strings, it grows with every new string,
+                 clear it or create a new Interner to release them
+    """
+
+    def __init__(self, keys=True, max_length=32, table=None):
+        """Initialize an Interner
+
+        :param keys: Intern string keys of dicts
+        :param max_length: The maximum length of shared strings, 0 to share
+                           none of them
+        :param table: The dict of shared strings, defaults to a new one
+        """
+
+        self.keys = keys
+        self.max_length = max_length
+        self.table = dict() if table is None else table
+
+    def key(self, s):
+        """return the shared string for the dict key ``s``"""
+        if self.keys and s.__class__ is str:
+            return _intern(s)
+        return self.string(s)
+
+    def string(self, s):
+        """return the shared string equal to ``s``"""
+        if s.__class__ is str and len(s) <= self.max_length:
+            return self.table.setdefault(s, s)
+        return s
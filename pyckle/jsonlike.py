@@ -0,0 +1,119 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Fast path for JSON-like pyckle documents
+
+Documents built only from dicts with string keys, lists, strings, numbers,
+True, False and None are translated to JSON and decoded by the json module,
+which is an order of magnitude faster than any of Pyckler methods. Anything
+else (tuples, sets, complex numbers, names, calls, comments, string escapes
+with different meaning in JSON) raises ValueError, so the caller falls back
+to the full path, which returns the same object.
+"""
+
+import json
+import re
+
+from .pyckler import Pyckler
+from .stats import clock
+
+# strings and True, False, None, everything else must be a JSON punctuation,
+# whitespace or number
+_SPLIT = re.compile(r"""
+    ('[^'\\\n\r]*(?:\\.[^'\\\n\r]*)*'
+    |"[^"\\\n\r]*(?:\\.[^"\\\n\r]*)*"
+    |\b(?:True|False|None)\b)""", re.VERBOSE)
+_OTHER = re.compile(r"[ \t\n\r\[\]{}:,0-9.eE+\-]*\Z")
+
+_NAMES = {"True": "true", "False": "false", "None": "null"}
+
+# escapes with the same meaning in python and JSON, \' is turned to '
+# surrogates are combined by JSON, but not by python
+_ESCAPES = re.compile(r"""\\(?:[\\nrtbf"']|u(?![dD][89a-fA-F])[0-9a-fA-F]{4})""")
+_QUOTES = re.compile(r"""\\.|\"""")
+
+_decoder = json.JSONDecoder(strict=False)
+
+def _quote(match):
+    s = match.group(0)
+    if s == '"':
+        return '\\"'
+    if s == "\\'":
+        return "'"
+    return s
+
+# return the JSON string for python string literal
+def _string(token):
+
+    body = token[1:-1]
+    if '\\' in body:
+        if '\\' in _ESCAPES.sub('', body):
+            raise ValueError("unsupported escape")
+        return '"' + _QUOTES.sub(_quote, body) + '"'
+
+    if token[0] == '"':
+        return token
+    return '"' + body.replace('"', '\\"') + '"'
+
+def decode(text):
+    """return the object from JSON-like pyckle document
+
+    raises ValueError if the document is not JSON-like, then it must be
+    loaded by the full path
+    """
+
+    # indented document is an error in python
+    if text.lstrip("\r\n")[:1] in (" ", "\t"):
+        raise ValueError("indented document")
+    # so is the indented last line without the newline
+    stripped = text.rstrip(" \t")
+    if len(stripped) != len(text) and stripped[-1:] in ("\r", "\n"):
+        raise ValueError("indented last line")
+    # python source can't contain null characters
+    if "\x00" in text:
+        raise ValueError("null character")
+
+    parts = _SPLIT.split(text)
+    match = _OTHER.match
+    for i in range(0, len(parts), 2):
+        if match(parts[i]) is None:
+            raise ValueError("not a JSON-like document")
+    for i in range(1, len(parts), 2):
+        token = parts[i]
+        parts[i] = _NAMES.get(token) or _string(token)
+
+    try:
+        return _decoder.decode("".join(parts))
+    # RecursionError in python 3.5+
+    except RuntimeError:
+        raise ValueError("too deep document")
+
+def _fast(cls, source, stats=None, limits=None, intern=None):
+    """return (object, True) for JSON-like source or (None, False)
+
+    Only documents loaded by Pyckler without limits and interning are
+    decoded, its subclasses can restrict the grammar and json module can't
+    check limits or share strings. The time is recorded as "jsonlike" phase
+    of ``stats``.
+    """
+
+    if cls is not Pyckler or limits is not None or intern:
+        return None, False
+    text = source if isinstance(source, str) else ''.join(source)
+    if stats is None:
+        try:
+            return decode(text), True
+        except ValueError:
+            return None, False
+
+    start = clock()
+    try:
+        ret = decode(text), True
+        stats.add_bytes(len(text))
+    except ValueError:
+        ret = None, False
+    stats.phase("jsonlike", start)
+    return ret
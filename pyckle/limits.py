@@ -0,0 +1,190 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Resource limits of pyckle documents
+
+    limits = Limits(max_bytes=2**20, max_depth=32, max_length=10000)
+    obj = loads(untrusted, limits=limits)
+
+Limits are checked while the document is read, parsed and verified, before
+the object is created, so a hostile document is rejected in the time and
+memory bounded by the limits:
+
+    max_bytes  - characters of document, checked before parsing, ``load``
+                 never reads more
+    max_nodes  - number of values (literals, names, containers, calls)
+    max_depth  - nesting of containers and calls
+    max_length - number of items of a container or arguments of a call
+    max_str    - characters of string, bytes of bytes literal, size of
+                 bytearray(n)
+    max_digits - decimal digits of integer, digits and exponent of the
+                 argument of decimal.Decimal and fractions.Fraction
+
+``max_length`` bounds the items of ``pyckle.vector`` and the rows of
+``pyckle.records`` too, as they are decoded in bulk.
+
+``ast.parse`` used by "eval" and "build" methods can't be interrupted, the
+tree is checked once it is parsed, its size is bounded by ``max_bytes``.
+The "decode" method checks all limits while parsing.
+"""
+
+import re
+
+from .blocks import records, vector
+
+# one decimal digit has log2(10) bits
+_BITS_PER_DIGIT = 3.3219280948873626
+
+# constructors allocating the memory given by the int argument
+_ALLOCATORS = (bytearray, bytes)
+
+# constructors converting the digits and the exponent of argument, known by
+# name, so the modules are not imported
+_NUMBERS = frozenset((
+    ("decimal", "Decimal"), ("_pydecimal", "Decimal"),
+    ("fractions", "Fraction")))
+
+_EXPONENT = re.compile(r'[eE]\s*[+-]?([0-9_]+)')
+
+# the size of items of pyckle.vector
+_ITEMSIZES = dict(b=1, B=1, h=2, H=2, i=4, I=4, q=8, Q=8, f=4, d=8)
+
+class LimitError(SyntaxError):
+    """the document exceeds the limit"""
+    pass
+
+class Limits(object):
+    """Limits of pyckle document, None means unlimited"""
+
+    def __init__(self, max_bytes=None, max_nodes=None, max_depth=None,
+        max_length=None, max_str=None, max_digits=None):
+        """Initialize Limits
+
+        :param max_bytes: The maximum number of characters of document
+        :param max_nodes: The maximum number of values
+        :param max_depth: The maximum nesting of containers and calls
+        :param max_length: The maximum number of items of container
+        :param max_str: The maximum length of string or bytes
+        :param max_digits: The maximum number of digits of integer
+        """
+
+        self.max_bytes = max_bytes
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_length = max_length
+        self.max_str = max_str
+        self.max_digits = max_digits
+
+    def __repr__(self):
+        return "Limits({})".format(", ".join(
+            "{}={}".format(name, getattr(self, name)) for name in (
+                "max_bytes", "max_nodes", "max_depth", "max_length",
+                "max_str", "max_digits")
+            if getattr(self, name) is not None))
+
+    def exceeded(self, name, value):
+        """return the error message if value exceeds the limit ``name``
+        or None"""
+
+        limit = getattr(self, name)
+        if limit is None or value <= limit:
+            return None
+        return "{} exceeded: {} > {}".format(name, value, limit)
+
+    def integer(self, value):
+        """return the error message if integer has too many digits or None
+
+        The number is never converted to string, if it is too big.
+        """
+
+        if self.max_digits is None or value.__class__ is bool:
+            return None
+        bits = abs(value).bit_length()
+        if bits > (self.max_digits + 1) * _BITS_PER_DIGIT:
+            return "max_digits exceeded: about {} > {}".format(
+                int(bits / _BITS_PER_DIGIT), self.max_digits)
+        return self.exceeded("max_digits", len(str(abs(value))))
+
+    def allocation(self, func, args):
+        """return the error message if the call of ``func`` would allocate
+        more than the limits allow or None
+
+        ``max_str`` bounds bytearray(n) and bytes(n), ``max_digits`` the
+        argument of Decimal and Fraction and ``max_length`` the items of
+        ``pyckle.vector`` and the rows of ``pyckle.records``. Arguments,
+        which are not known (None) are not checked.
+        """
+
+        if not args:
+            return None
+        if func in _ALLOCATORS:
+            size = args[0]
+            if isinstance(size, int) and not isinstance(size, bool):
+                return self.exceeded("max_str", size)
+            return None
+        if func is vector:
+            if len(args) != 2 or not isinstance(args[1], (str, bytes)):
+                return None
+            data = args[1].rstrip(b'=' if isinstance(args[1], bytes) else '=')
+            size = _ITEMSIZES.get(args[0], 1)
+            return self.exceeded("max_length", len(data) * 3 // 4 // size)
+        if func is records:
+            if len(args) != 2 or not hasattr(args[1], "__len__"):
+                return None
+            return self.exceeded("max_length", len(args[1]))
+        name = (getattr(func, "__module__", None), getattr(func, "__name__", None))
+        if name in _NUMBERS:
+            return self.number(args[0])
+        return None
+
+    def number(self, value):
+        """return the error message if the argument of Decimal or Fraction
+        has too many digits or too big exponent or None
+
+        The exponent is bounded by ``max_digits`` too, as it is the number of
+        digits of the integer or denominator of the value.
+        """
+
+        if self.max_digits is None:
+            return None
+        if isinstance(value, tuple) and len(value) == 3:
+            # Decimal((sign, digits, exponent))
+            digits, exponent = value[1], value[2]
+            if not hasattr(digits, "__len__"):
+                return None
+            digits = len(digits)
+        elif isinstance(value, str):
+            m = _EXPONENT.search(value)
+            end = len(value) if m is None else m.start()
+            digits = sum(c.isdigit() for c in value[:end])
+            exponent = 0
+            if m is not None:
+                exponent = m.group(1).replace("_", "")
+                # never convert the long string of digits
+                if len(exponent) > len(str(self.max_digits)):
+                    return "max_digits exceeded: exponent of {} digits > {}".format(
+                        len(exponent), self.max_digits)
+                exponent = int(exponent)
+        elif hasattr(value, "as_tuple"):
+            digits, exponent = value.as_tuple()[1:]
+            digits = len(digits)
+        else:
+            return None
+        msg = self.exceeded("max_digits", digits)
+        if msg is not None or not isinstance(exponent, int):
+            # Decimal('nan') and Decimal('inf') have str exponent
+            return msg
+        if abs(exponent) > self.max_digits:
+            return "max_digits exceeded: exponent {} > {}".format(
+                exponent, self.max_digits)
+        return None
+
+# read the document by load, a document longer than max_bytes is read just
+# partially, Pyckler reports it
+def _read(fp, limits):
+    if limits is None or limits.max_bytes is None:
+        return fp.readlines()
+    return fp.read(limits.max_bytes + 1)
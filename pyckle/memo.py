@@ -0,0 +1,181 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""In-process memo of loaded pyckle documents
+
+Documents loaded again and again (configuration files read on every request)
+are parsed only once, next loads return the remembered object as long as the
+document has not been changed.
+"""
+
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from copy import deepcopy
+
+from .cache import RACY_NS
+from .utils import _digest, _hasher
+
+# return the identity and stat data of opened file or None
+def _fstat(fp):
+    try:
+        st = os.fstat(fp.fileno())
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+    # python2 compatibility
+    mtime = getattr(st, "st_mtime_ns", int(st.st_mtime * 10**9))
+    return st.st_dev, st.st_ino, mtime, st.st_size
+
+class Memo(object):
+    """LRU memo of objects returned by ``load`` and ``loads``
+
+    Files are keyed by their path and stat data (or digest), strings by their
+    digest, both together with the Pyckler class, identity of globals and the
+    load method. Entries are evicted in least recently used order when there
+    is more than ``max_entries`` of them or when the documents they were
+    loaded from are bigger than ``max_bytes`` in sum.
+
+    Usage:
+    memo = Memo(max_entries=32)
+    obj = load(fp, memo=memo)
+    obj2 = load(fp, memo=memo) # not parsed again
+    obj is obj2
+    """
+
+    def __init__(self, max_entries=128, max_bytes=None, copy=False, validate="stat"):
+        """Initialize a Memo
+
+        :param max_entries: The maximum number of remembered objects, None
+                            for unlimited
+        :param max_bytes: The maximum size of remembered documents in sum,
+                          None for unlimited
+        :param copy: Return a deep copy of remembered object, so callers can
+                     modify it, otherwise the shared object is returned
+        :param validate: How the file is checked for a change, "stat" compares
+                         the timestamp (in nanoseconds) and size, "hash" the
+                         digest of the content
+
+        In "stat" mode, files modified less than ``pyckle.cache.RACY_NS``
+        ago are not remembered, as they can be modified again with the same
+        timestamp. Files modified while loaded are not remembered in either
+        mode.
+        """
+
+        if validate not in ("stat", "hash"):
+            raise ValueError("stat or hash expected for `validate', `{}' found".format(validate))
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.copy = copy
+        self.validate = validate
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """forget all remembered objects, counters are kept"""
+
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def loads(self, string, load_f, cls, globals, method):
+        """return the remembered object loaded from string or call ``load_f``
+        and remember its result"""
+
+        lines = (string, ) if isinstance(string, str) else string
+        h = _hasher()
+        size = 0
+        for line in lines:
+            h.update(line.encode("utf-8"))
+            size += len(line)
+        key = ("<string>", h.digest(), cls, id(globals), method)
+        return self._get(key, size, globals, load_f)
+
+    def load(self, fp, load_f, cls, globals, method):
+        """return the remembered object loaded from file or call ``load_f``
+        and remember its result
+
+        File-like objects without a name or a file descriptor are not
+        remembered.
+        """
+
+        filename = getattr(fp, "name", None)
+        st = _fstat(fp)
+        if not isinstance(filename, str) or st is None:
+            return load_f()
+        dev, ino, timestamp, size = st
+
+        if self.validate == "hash":
+            # the digest is computed from the path, which must be still
+            # the same, unmodified file as fp
+            try:
+                pst = os.stat(filename)
+                digest = _digest(filename)
+            except (IOError, OSError):
+                return load_f()
+            if (pst.st_dev, pst.st_ino) != (dev, ino) or _fstat(fp) != st:
+                return self._miss(load_f)
+            key = (filename, size, digest, cls, id(globals), method)
+        else:
+            if timestamp > time.time() * 10**9 - RACY_NS:
+                return self._miss(load_f)
+            key = (filename, size, timestamp, cls, id(globals), method)
+        return self._get(key, size, globals, load_f, lambda: _fstat(fp) == st)
+
+    ### private methods
+
+    # load the object, which is not remembered
+    def _miss(self, load_f):
+        with self._lock:
+            self.misses += 1
+        return load_f()
+
+    # valid_f says the loaded object can be remembered
+    def _get(self, key, size, globals, load_f, valid_f=None):
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is not None:
+            return deepcopy(entry[0]) if self.copy else entry[0]
+
+        obj = load_f()
+        if valid_f is None or valid_f():
+            self._put(key, size, globals, obj)
+        return deepcopy(obj) if self.copy else obj
+
+    def _put(self, key, size, globals, obj):
+
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            # the same document loaded by two threads at once
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            # globals are referenced to keep their id unique
+            self._entries[key] = (obj, size, globals)
+            self.size += size
+
+            while self._entries and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries) or
+                (self.max_bytes is not None and self.size > self.max_bytes)):
+                _, old = self._entries.popitem(last=False)
+                self.size -= old[1]
@@ -0,0 +1,729 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Hand written recursive descent parser of pyckle documents
+
+Unlike Pyckler.eval or Pyckler.build it does not use the ``tokenize`` or
+``ast`` modules at all, the document is scanned once and objects are created
+while parsing. It accepts the same subset of Python as Pyckler does
+
+    * numbers, strings and bytes literals, True, False and None
+    * negative and complex numbers like -1 or 3.2-6.5j
+    * tuples (including the top-level one without parentheses), lists,
+      sets and dicts, dicts can contain **mapping
+    * calls of whitelisted (dotted) names with positional and keyword
+      arguments, like fractions.Fraction(22, 7), dict(a=1) or dict(**mapping)
+
+Names are resolved using the globals of a Pyckler instance, custom visit_*
+methods of Pyckler subclasses are not called. Limits of the Pyckler are
+checked before the value exceeding them is created.
+"""
+
+import re
+
+from ast import literal_eval
+from keyword import iskeyword
+
+from .limits import LimitError
+
+# whitespace, line continuations and comments, the newlines are allowed
+# inside brackets only
+_WS = re.compile(r'(?:[ \t\f]+|\\\r?\n|#[^\r\n]*)*')
+_WS_NL = re.compile(r'(?:[ \t\f\r\n]+|\\\r?\n|#[^\r\n]*)*')
+
+_NUMBER = re.compile(r'''
+    (?P<int>0[xX][0-9a-fA-F_]+|0[oO][0-7_]+|0[bB][01_]+)
+    |(?P<float>(?:[0-9][0-9_]*\.?[0-9_]*|\.[0-9][0-9_]*)(?:[eE][+-]?[0-9][0-9_]*)?)
+     (?P<imag>[jJ])?
+    ''', re.VERBOSE)
+
+_STRING = re.compile(r'''
+    (?P<prefix>[rRbBuU]{0,2})
+    (?P<body>
+        \'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'
+        |"""(?:[^"\\]|\\.|"(?!""))*"""
+        |'(?:[^'\\\n]|\\.)*'
+        |"(?:[^"\\\n]|\\.)*"
+    )''', re.VERBOSE | re.DOTALL)
+
+_NAME = re.compile(r'[^\W\d]\w*', re.UNICODE)
+
+_CONSTANTS = {'True' : True, 'False' : False, 'None' : None}
+
+_CLOSING = {'[' : ']', '(' : ')', '{' : '}'}
+
+# the top-level set() or frozenset(...) written by dumps for iterparse
+_SET_CALL = re.compile(r'(set|frozenset)[ \t\f]*\(')
+
+# unary operators, which are not supported
+_UNARY = ('+', '~')
+
+# marks a frame without a pending dict key or keyword argument
+_NOKEY = object()
+# marks a frame with pending **mapping
+_UNPACK = object()
+
+class _Frame(object):
+    """container or call being parsed"""
+
+    __slots__ = ('kind', 'pos', 'closing', 'items', 'key', 'comma', 'isnum',
+                 'func', 'kwargs', 'names', 'unpack')
+
+    def __init__(self, kind, pos):
+        self.kind = kind
+        self.pos = pos
+        self.closing = ')' if kind == 'call' else _CLOSING[kind]
+        # dict or set is decided by the first item
+        self.items = None if kind == '{' else list()
+        self.key = _NOKEY
+        self.comma = False
+        self.isnum = False
+        self.func = None
+        self.kwargs = dict() if kind == 'call' else None
+        # names of keyword arguments
+        self.names = set() if kind == 'call' else None
+        # call with **mapping
+        self.unpack = False
+
+    # return the resulting (obj, isnumber)
+    def close(self):
+        kind = self.kind
+        if kind == '(':
+            # just a parenthesized expression
+            if len(self.items) == 1 and not self.comma:
+                return self.items[0], self.isnum
+            return tuple(self.items), False
+        if kind == '{' and self.items is None:
+            return dict(), False
+        if kind == 'call':
+            return self.func(*self.items, **self.kwargs), False
+        return self.items, False
+
+class Parser(object):
+    """Parser of a single pyckle document
+
+    Usage:
+    parser = Parser(Pyckler(["42", ], "<string>"))
+    obj = parser.parse("42")
+    obj == 42
+    """
+
+    def __init__(self, pyckler):
+        """Initialize a Parser
+
+        :param pyckler: The Pyckler instance, which provides globals and file
+                        name for error reporting
+        """
+        self._lookup = pyckler._lookup
+        self._filename = pyckler._filename
+        self._limits = pyckler.limits
+        self._intern = pyckler.intern
+        # number of values and characters read, checked against limits
+        self._nodes = 0
+        self._size = 0
+        self._s = ''
+        # number of lines and columns dropped from the beginning of
+        # the buffer by iterparse
+        self._lineno = 0
+        self._offset = 0
+
+    def parse(self, s):
+        """parse the document and return resulting Python object
+
+        raises SyntaxError
+        """
+
+        self._s = s
+        pos = _WS_NL.match(s, 0).end()
+        obj, pos, _ = self._expr(pos, 0)
+
+        # top-level tuple without parentheses, the newline ends it
+        pos = _WS.match(s, pos).end()
+        if s[pos:pos+1] == ',':
+            items = [obj, ]
+            while s[pos:pos+1] == ',':
+                pos = _WS.match(s, pos+1).end()
+                if s[pos:pos+1] in ('', '\r', '\n'):
+                    break
+                obj, pos, _ = self._expr(pos, 0)
+                items.append(obj)
+                pos = _WS.match(s, pos).end()
+            obj = tuple(items)
+
+        pos = _WS_NL.match(s, pos).end()
+        if pos != len(s):
+            self._error("invalid syntax", pos)
+        return obj
+
+    def iterparse(self, read, size=64*1024):
+        """parse the document read by chunks and yield items of the top-level
+        list, tuple or set or (key, value) pairs of the top-level dict
+
+        Only the unparsed rest of document is kept in memory. An incomplete
+        item is parsed again once more data are read, so syntax errors are
+        reported when the whole item (or the rest of document) is read.
+
+        :param read: The function returning up to ``size`` characters,
+                     like ``fp.read``, empty string means the end of file
+        :param size: The size of chunk
+
+        raises SyntaxError
+        """
+
+        self._s = s = read(size)
+        eof = not s
+        self._count(len(s), 0)
+
+        pos = _WS_NL.match(s, 0).end()
+        while pos == len(s) and not eof:
+            s, eof = self._read(read, size)
+            pos = _WS_NL.match(s, 0).end()
+
+        # set() or frozenset(...), the container of argument is the top-level
+        # one, it can't be a dict
+        wrapped = s[pos:pos+1] not in _CLOSING
+        if wrapped:
+            while len(s) - pos < len('frozenset(') and not eof:
+                s, eof = self._read(read, size, pos)
+                pos = 0
+            m = _SET_CALL.match(s, pos)
+            if m is None:
+                self._error("list, tuple, set or dict expected", pos)
+            try:
+                self._lookup(m.group(1))
+            except (KeyError, ImportError, AttributeError):
+                self._error("'{}' is not allowed name".format(m.group(1)), pos)
+            s, pos, eof = self._skip(read, size, m.end(), eof)
+            if s[pos:pos+1] == ')':
+                self._skip_end(read, size, pos + 1, eof)
+                return
+
+        opening = s[pos:pos+1]
+        if opening not in _CLOSING:
+            self._error("list, tuple, set or dict expected", pos)
+        closing = _CLOSING[opening]
+        isdict = None if opening == '{' and not wrapped else False
+        self._value(pos, 1)
+        length = 0
+        nodes = self._nodes
+
+        # start is the position after the opening bracket or a comma, the
+        # buffer is never cut after it, as it can be in the middle of comment
+        start = pos + 1
+        while True:
+
+            try:
+                pos = _WS_NL.match(s, start).end()
+                if s[pos:pos+1] == closing:
+                    break
+                unpack = isdict is not False and s[pos:pos+2] == '**'
+                if unpack:
+                    pos = _WS_NL.match(s, pos+2).end()
+                item, end, _ = self._expr(pos, 1)
+                end = _WS_NL.match(s, end).end()
+                if isdict is None and s[end:end+1]:
+                    isdict = unpack or s[end:end+1] == ':'
+                if unpack:
+                    item = list(self._mapping(item).items())
+                elif isdict:
+                    if s[end:end+1] != ':':
+                        self._error("invalid syntax", end)
+                    value, end, _ = self._expr(_WS_NL.match(s, end+1).end(), 1)
+                    if self._intern is not None:
+                        item = self._intern.key(item)
+                    item = (item, value)
+                    end = _WS_NL.match(s, end).end()
+                if s[end:end+1] == ',':
+                    end += 1
+                elif s[end:end+1] != closing:
+                    self._error("invalid syntax", end)
+                length += len(item) if unpack else 1
+                self._length(length, pos)
+            except LimitError:
+                raise
+            except SyntaxError:
+                if eof:
+                    raise
+                # the item is not complete, read more and try again
+                self._nodes = nodes
+                s, eof = self._read(read, max(size, len(s)), start)
+                start = 0
+                continue
+            nodes = self._nodes
+
+            if unpack:
+                for i in item:
+                    yield i
+            else:
+                yield item
+            start = end
+
+            # drop parsed items from the buffer
+            if start > size:
+                s, _ = self._read(read, 0, start)
+                start = 0
+
+        if wrapped:
+            s, pos, eof = self._skip(read, size, pos + 1, eof)
+            if s[pos:pos+1] != ')':
+                self._error("invalid syntax", pos)
+        self._skip_end(read, size, pos + 1, eof)
+
+    ### private methods
+
+    # parse expression starting on pos, return (obj, new pos, isnumber),
+    # where isnumber says the obj is an (optionally negative) number literal
+    #
+    # nested containers and calls are kept on the explicit stack of frames,
+    # so the depth of document is not limited by the recursion limit
+    def _expr(self, pos, depth):
+
+        s = self._s
+        stack = list()
+
+        while True:
+
+            # the start of a value - a container or call opens a new frame
+            start = pos
+            frame = None
+            c = s[pos:pos+1]
+            if c in _CLOSING:
+                frame = _Frame(c, pos)
+            else:
+                obj, pos, isnum, call = self._operand(pos, depth + len(stack))
+                if call:
+                    frame = _Frame('call', start)
+                    frame.func = obj
+
+            if frame is not None:
+                stack.append(frame)
+                if self._limits is not None:
+                    self._value(start, depth + len(stack))
+                pos = _WS_NL.match(s, pos+1).end()
+                if s[pos:pos+1] != frame.closing:
+                    if frame.kind in ('call', '{'):
+                        pos = self._keyword(frame, pos)
+                    continue
+                stack.pop()
+                obj, isnum = self._close(frame)
+                pos += 1
+
+            # the end of a value - add it to the enclosing frames, which
+            # are closed by it
+            while True:
+
+                ws = _WS_NL if depth + len(stack) else _WS
+                p = ws.match(s, pos).end()
+                if s[p:p+1] in ('+', '-'):
+                    obj, pos = self._binop(obj, isnum, start, p, depth + len(stack))
+                    isnum = False
+                    p = ws.match(s, pos).end()
+
+                if not stack:
+                    return obj, pos, isnum
+
+                frame = stack[-1]
+                c = s[p:p+1]
+
+                if frame.kind == '{':
+                    if frame.items is None:
+                        frame.items = dict() if c == ':' or frame.key is _UNPACK else set()
+                    if frame.items.__class__ is set:
+                        frame.items.add(obj)
+                    elif frame.key is _NOKEY:
+                        if c != ':':
+                            self._error("invalid syntax", p)
+                        frame.key = obj if self._intern is None else self._intern.key(obj)
+                        pos = _WS_NL.match(s, p+1).end()
+                        break
+                    elif frame.key is _UNPACK:
+                        frame.items.update(self._mapping(obj))
+                        frame.key = _NOKEY
+                    else:
+                        frame.items[frame.key] = obj
+                        frame.key = _NOKEY
+                elif frame.kind == 'call' and frame.key is _UNPACK:
+                    mapping = self._mapping(obj, frame.func)
+                    for key in mapping.keys():
+                        if key in frame.kwargs:
+                            raise TypeError(
+                                "{}() got multiple values for keyword argument '{}'".format(
+                                    getattr(frame.func, '__name__', 'function'), key))
+                        frame.kwargs[key] = mapping[key]
+                    frame.key = _NOKEY
+                elif frame.kind == 'call' and frame.key is not _NOKEY:
+                    if frame.key in frame.kwargs:
+                        raise TypeError(
+                            "{}() got multiple values for keyword argument '{}'".format(
+                                getattr(frame.func, '__name__', 'function'), frame.key))
+                    frame.kwargs[frame.key] = obj
+                    frame.key = _NOKEY
+                else:
+                    frame.items.append(obj)
+                    frame.isnum = isnum
+
+                if self._limits is not None:
+                    self._length(
+                        len(frame.items) + len(frame.kwargs or ()), frame.pos)
+
+                if c == ',':
+                    frame.comma = True
+                    pos = _WS_NL.match(s, p+1).end()
+                    if s[pos:pos+1] != frame.closing:
+                        if frame.kind in ('call', '{'):
+                            pos = self._keyword(frame, pos)
+                        break
+                    p = pos
+                elif c != frame.closing:
+                    self._error("invalid syntax", p)
+
+                stack.pop()
+                obj, isnum = self._close(frame)
+                start = frame.pos
+                pos = p + 1
+
+    # the right side of complex number, p is the position of operator
+    def _binop(self, obj, isnum, start, p, depth):
+
+        s = self._s
+        ws = _WS_NL if depth else _WS
+
+        op = s[p]
+        right, end, isnum2, _ = self._operand(ws.match(s, p+1).end(), depth)
+        if  not (isnum and isnum2) or \
+            not (isinstance(obj, complex) or isinstance(right, complex)):
+            self._error("Illegal expression, only complex numbers are allowed", start)
+
+        p = ws.match(s, end).end()
+        if s[p:p+1] in ('+', '-'):
+            self._error("Illegal expression, only complex numbers are allowed", start)
+
+        return (obj + right if op == '+' else obj - right), end
+
+    # parse single operand - literal or name, return (obj, new pos, isnumber,
+    # iscall), for names followed by a call the new pos is the one of '('
+    def _operand(self, pos, depth):
+
+        s = self._s
+        c = s[pos:pos+1]
+        if self._limits is not None:
+            self._value(pos, depth)
+
+        if c in _UNARY:
+            self._error(
+                "Unsupported unary operator, only negative numbers are allowed",
+                pos)
+
+        if c == '-':
+            p = (_WS_NL if depth else _WS).match(s, pos+1).end()
+            if s[p:p+1] == '(':
+                obj, end, isnum = self._parens(p, depth, False)
+                if not isnum:
+                    self._error(
+                        "Unsupported unary operator, only negative numbers are allowed",
+                        pos)
+                return -obj, end, True, False
+            m = _NUMBER.match(s, p)
+            if m is None or not m.group(0):
+                self._error(
+                    "Unsupported unary operator, only negative numbers are allowed",
+                    pos)
+            return -self._number(m), m.end(), True, False
+
+        # parenthesized right side of complex number
+        if c == '(':
+            obj, end, isnum = self._parens(pos, depth, True)
+            return obj, end, isnum, False
+
+        if c.isdigit() or (c == '.' and s[pos+1:pos+2].isdigit()):
+            m = _NUMBER.match(s, pos)
+            return self._number(m), m.end(), True, False
+
+        if c in ('"', "'") or (c and c in 'rRbBuU' and _STRING.match(s, pos)):
+            return self._strings(pos, depth)
+
+        m = _NAME.match(s, pos)
+        if m is None:
+            self._error("invalid syntax", pos)
+        return self._name(m, depth)
+
+    # return the dotted name starting with the match of _NAME and the position
+    # after it, the whitespace around dots is allowed like in Python
+    def _dotted(self, m, depth):
+
+        s = self._s
+        ws = _WS_NL if depth else _WS
+        names = [m.group(0), ]
+        end = m.end()
+        while True:
+            p = ws.match(s, end).end()
+            if s[p:p+1] != '.':
+                return '.'.join(names), end
+            p = ws.match(s, p+1).end()
+            m = _NAME.match(s, p)
+            if m is None:
+                self._error("invalid syntax", p)
+            names.append(m.group(0))
+            end = m.end()
+
+    # parenthesized (optionally negative if ``signed``) number, return
+    # (obj, new pos, isnumber), anything else is not a number and the rest
+    # is left to the caller reporting the error
+    def _parens(self, pos, depth, signed):
+
+        s = self._s
+        n = 0
+        while s[pos:pos+1] == '(':
+            n += 1
+            pos = _WS_NL.match(s, pos+1).end()
+
+        if s[pos:pos+1] == '-' and not signed:
+            return None, pos, False
+        if s[pos:pos+1] in _CLOSING:
+            return None, pos, False
+        obj, pos, isnum, call = self._operand(pos, depth + n)
+        if call or not isnum:
+            return None, pos, False
+
+        for i in range(n):
+            pos = _WS_NL.match(s, pos).end()
+            if s[pos:pos+1] != ')':
+                return None, pos, False
+            pos += 1
+        return obj, pos, True
+
+    def _number(self, m):
+        num = m.group('int') or m.group('float')
+        try:
+            if m.group('imag'):
+                return complex(0, float(num))
+            if m.group('int') or num.replace('_', '').isdigit():
+                if self._limits is None:
+                    return int(num, 0)
+                # decimal digits are checked before the conversion
+                if not m.group('int'):
+                    self._limit(
+                        self._limits.exceeded(
+                            "max_digits", len(num.replace('_', '').lstrip('0'))),
+                        m.start())
+                ret = int(num, 0)
+                self._limit(self._limits.integer(ret), m.start())
+                return ret
+            return float(num)
+        except ValueError:
+            self._error("invalid token", m.start())
+
+    # string literal(s) - adjacent ones are concatenated
+    def _strings(self, pos, depth):
+
+        s = self._s
+        ws = _WS_NL if depth else _WS
+        ret = None
+
+        while True:
+            # plain single quoted string, long ones (like blocks) are found
+            # much faster than by the regular expression
+            c = s[pos:pos+1]
+            if c in ('"', "'") and s[pos+1:pos+3] != c * 2:
+                end = s.find(c, pos + 1)
+                value = s[pos+1:end]
+                if end != -1 and '\\' not in value and '\n' not in value:
+                    self._string(ret, value, pos)
+                    ret = value if ret is None else ret + value
+                    end += 1
+                    pos = ws.match(s, end).end()
+                    continue
+
+            m = _STRING.match(s, pos)
+            if m is None:
+                break
+            token = m.group(0)
+            if m.group('prefix') or '\\' in token:
+                try:
+                    value = literal_eval(token)
+                except (SyntaxError, ValueError):
+                    self._error("invalid syntax", pos)
+            else:
+                quote = 3 if token[:3] in ('"""', "'''") else 1
+                value = token[quote:-quote]
+
+            self._string(ret, value, pos)
+            ret = value if ret is None else ret + value
+
+            end = m.end()
+            pos = ws.match(s, end).end()
+
+        if ret is None:
+            self._error("EOL while scanning string literal", pos)
+        if self._intern is not None:
+            ret = self._intern.string(ret)
+        return ret, end, False, False
+
+    # check the string literal ``value`` added to ``ret``
+    def _string(self, ret, value, pos):
+        if ret is not None and type(ret) is not type(value):
+            self._error("cannot mix bytes and nonbytes literals", pos)
+        if self._limits is not None:
+            self._limit(
+                self._limits.exceeded("max_str", len(value) + len(ret or '')),
+                pos)
+
+    def _name(self, m, depth):
+
+        s = self._s
+        pos = m.start()
+        name, end = self._dotted(m, depth)
+
+        if name in _CONSTANTS:
+            return _CONSTANTS[name], end, False, False
+        if name == 'not':
+            self._error(
+                "Unsupported unary operator, only negative numbers are allowed",
+                pos)
+        if name == 'lambda':
+            self._error("Unsupported type of node: 'Lambda'", pos)
+        if iskeyword(name):
+            self._error("invalid syntax", pos)
+        try:
+            obj = self._lookup(name)
+        except (KeyError, ImportError, AttributeError):
+            self._error("'{}' is not allowed name".format(name), pos)
+
+        p = (_WS_NL if depth else _WS).match(s, end).end()
+        if s[p:p+1] != '(':
+            return obj, end, False, False
+        return obj, p, False, True
+
+    # skip the whitespace from start reading more, return (buffer, position
+    # of the next character, eof)
+    def _skip(self, read, size, start, eof):
+
+        s = self._s
+        pos = _WS_NL.match(s, start).end()
+        while pos == len(s) and not eof:
+            s, eof = self._read(read, size, start)
+            start = 0
+            pos = _WS_NL.match(s, 0).end()
+        return s, pos, eof
+
+    # the rest of document from start must be just the whitespace
+    def _skip_end(self, read, size, start, eof):
+        s, pos, _ = self._skip(read, size, start, eof)
+        if pos != len(s):
+            self._error("invalid syntax", pos)
+
+    # check if the argument on pos is a keyword one (foo=value) or
+    # **mapping, return the position of its value, dicts can have
+    # **mapping only
+    def _keyword(self, frame, pos):
+
+        s = self._s
+        if s[pos:pos+2] == '**':
+            if frame.items.__class__ is set:
+                self._error("invalid syntax", pos)
+            frame.key = _UNPACK
+            frame.unpack = True
+            return _WS_NL.match(s, pos+2).end()
+        if frame.kind == '{':
+            return pos
+
+        m = _NAME.match(s, pos)
+        if m:
+            p = _WS_NL.match(s, m.end()).end()
+            if s[p:p+1] == '=' and s[p+1:p+2] != '=':
+                # python2 compatibility, True, False and None are not keywords
+                if iskeyword(m.group(0)) or m.group(0) in _CONSTANTS:
+                    self._error("invalid syntax", pos)
+                if m.group(0) in frame.names:
+                    self._error("keyword argument repeated: {}".format(m.group(0)), pos)
+                frame.names.add(m.group(0))
+                frame.key = m.group(0)
+                return _WS_NL.match(s, p+1).end()
+
+        if frame.unpack:
+            self._error("positional argument follows keyword argument unpacking", pos)
+        if frame.kwargs:
+            self._error("positional argument follows keyword argument", pos)
+        return pos
+
+    # check the value of **mapping, func is given for calls
+    def _mapping(self, obj, func=None):
+        if hasattr(obj, 'keys'):
+            return obj
+        if func is None:
+            raise TypeError("'{}' object is not a mapping".format(type(obj).__name__))
+        raise TypeError("{}() argument after ** must be a mapping, not {}".format(
+            getattr(func, '__name__', 'function'), type(obj).__name__))
+
+    # close the frame, calls allocating too much memory are not called
+    def _close(self, frame):
+        if self._limits is not None and frame.kind == 'call':
+            self._limit(
+                self._limits.allocation(frame.func, frame.items), frame.pos)
+        return frame.close()
+
+    # count the value starting on pos on given depth
+    def _value(self, pos, depth):
+        if self._limits is None:
+            return
+        self._nodes += 1
+        self._limit(
+            self._limits.exceeded("max_nodes", self._nodes) or
+            self._limits.exceeded("max_depth", depth),
+            pos)
+
+    def _length(self, length, pos):
+        if self._limits is not None:
+            self._limit(self._limits.exceeded("max_length", length), pos)
+
+    # count characters read by iterparse
+    def _count(self, size, pos):
+        self._size += size
+        if self._limits is not None:
+            self._limit(self._limits.exceeded("max_bytes", self._size), pos)
+
+    # raise LimitError with the message returned by Limits or do nothing
+    def _limit(self, msg, pos):
+        if msg is not None:
+            self._error(msg, pos, LimitError)
+
+    # drop first ``pos`` characters of the buffer and append up to ``size``
+    # characters read, return the new buffer and end of file flag
+    def _read(self, read, size, pos=0):
+
+        s = self._s
+        if pos:
+            lines = s.count('\n', 0, pos)
+            if lines:
+                self._lineno += lines
+                self._offset = pos - s.rfind('\n', 0, pos) - 1
+            else:
+                self._offset += pos
+            s = s[pos:]
+
+        chunk = read(size) if size else ''
+        self._s = s + chunk
+        self._count(len(chunk), len(s))
+        return self._s, bool(size) and not chunk
+
+    # raise SyntaxError (or its subclass) with the same arguments as
+    # PycklerBase._seargs
+    def _error(self, msg, pos, error=SyntaxError):
+
+        s = self._s
+        start = s.rfind('\n', 0, pos) + 1
+        end = s.find('\n', pos)
+        end = len(s) if end == -1 else end + 1
+
+        lineno = s.count('\n', 0, pos) + 1
+        offset = pos - start + 1
+        if lineno == 1:
+            offset += self._offset
+
+        raise error(
+            msg,
+            (self._filename, lineno + self._lineno, offset, s[start:end])
+            )
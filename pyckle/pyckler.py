@@ -7,13 +7,114 @@
 import ast
 import _ast
 
+from ast import iter_child_nodes
 from copy import copy
-from io import StringIO
-from itertools import chain
-from collections import defaultdict
-from pprint import pprint, isreadable
+from collections import deque
+
+from .limits import LimitError
+from .parser import Parser
+from .stats import clock
+from .utils import _PACKAGE, _Lazy, _eval_globals, _fix_imports, \
+    _make_globals, _split_lines, _split_modules
+
+# python 3.8+ parses all literals to _ast.Constant
+_NUM = getattr(_ast, "Num", None) or _ast.Constant
+_NUM_ATTR = "value" if _NUM.__name__ == "Constant" else "n"
+
+# return the value of a number literal node or None
+def _number(node):
+    if node.__class__ is not _NUM:
+        return None
+    n = getattr(node, _NUM_ATTR)
+    if isinstance(n, bool) or not isinstance(n, (int, float, complex)):
+        return None
+    return n
+
+# nodes increasing the depth of document, see Limits
+_CONTAINERS = (_ast.Tuple, _ast.List, _ast.Set, _ast.Dict, _ast.Call)
+
+# return the value of a literal node or None
+def _literal(node):
+    for attr in ("value", "s", "n"):
+        if hasattr(node, attr):
+            return getattr(node, attr)
+    return None
+
+# return the value of literal argument of call or None, Decimal((0, (1, ), 3))
+# has a literal tuple
+def _argument(node):
+    if isinstance(node, _ast.Tuple):
+        try:
+            return ast.literal_eval(node)
+        except ValueError:
+            return None
+    if isinstance(node, _ast.Attribute):
+        return None
+    return _literal(node)
+
+# return the dotted name of Name or Attribute node or None
+def _dotted(node):
+    names = list()
+    while isinstance(node, _ast.Attribute):
+        names.append(node.attr)
+        node = node.value
+    if not isinstance(node, _ast.Name):
+        return None
+    names.append(node.id)
+    return '.'.join(reversed(names))
+
+class _DispatchTable(dict):
+    """node class -> method mapping for a PycklerBase (sub)class
+
+    It is filled by ``prefix``_* methods (visit_*, build_*) when created, node
+    classes not known at that time are resolved (and remembered) on the first
+    occurence. Leaves are node classes without children, which are handled by
+    an unoverridden no-op visitor of PycklerBase, so the visit loop does not
+    need to queue them at all.
+    """
 
-from .utils import _fix_imports, _make_globals
+    LEAVES = ("Num", "Str", "Bytes", "NameConstant", "Constant",
+              "Load", "Add", "Sub", "USub")
+
+    def __init__(self, cls, prefix, generic):
+        dict.__init__(self)
+        self._cls = cls
+        self._prefix = prefix
+        self._generic = generic
+        for name in dir(cls):
+            if not name.startswith(prefix):
+                continue
+            node_cls = getattr(_ast, name[len(prefix):], None)
+            if isinstance(node_cls, type):
+                self[node_cls] = getattr(cls, name)
+
+        leaves = set()
+        for name in self.LEAVES if prefix == "visit_" else ():
+            node_cls = getattr(_ast, name, None)
+            method = prefix + name
+            if node_cls is not None and \
+                getattr(cls, method) is getattr(PycklerBase, method):
+                leaves.add(node_cls)
+        self.leaves = frozenset(leaves)
+
+    def resolve(self, node_cls):
+        method = self._prefix + node_cls.__name__
+        method_f = getattr(self._cls, method, getattr(self._cls, self._generic))
+        self[node_cls] = method_f
+        return method_f
+
+class _Namespace(dict):
+    """globals prepared by ``Engine``, used by PycklerBase as they are
+
+    ``eval_globals`` is a copy with ``__builtins__`` already set, so eval
+    never modifies it and it can be shared by threads.
+    """
+
+    def __init__(self, globals):
+        dict.__init__(self, globals)
+        self.eval_globals = _eval_globals(globals)
+        # eval inserts __builtins__ on the first call
+        eval("0", self.eval_globals)
 
 class PycklerBase():
     """Basic class implementing all verification, parsing and evaluation
@@ -23,28 +124,52 @@ class PycklerBase():
 
     __GLOBALS__ = {}
 
+    # pyckle.Stats recording the phases, set by loads and load
+    stats = None
+    # pyckle.Limits of documents, set by loads and load
+    limits = None
+    # pyckle.Interner sharing strings, set by loads and load
+    intern = None
+
     def __init__(self, source, filename, globals=dict(), fix_imports=True):
         """Initialize a PycklerBase instance, which analyzes and evaluates pyckle source
         
-        :param source: The list or tuple of strings (each for one line)
+        :param source: The string or list or tuple of strings (each for one line)
         :param filename: The name of file used for error reporting
         :param globals: An aditional namespace mapping
         ``fix_imports`` - add all underlying modules into globals, defaults to True
         """
 
-        assert source is not isinstance(source, str), "ERROR: source must be a list or tuple of strings"
+        assert isinstance(source, (str, list, tuple)), "ERROR: source must be a string or a list or tuple of strings"
 
         self._source = source
+        self._lines = None
         self._filename = filename
+        # prepared once by Engine
+        if isinstance(globals, _Namespace):
+            self._globals = globals
+            self._eval_globals = globals.eval_globals
+            return
         self._globals = copy(self.__GLOBALS__)
         self._globals.update(globals)
         if fix_imports:
             self._globals = _fix_imports(self._globals)
+        self._eval_globals = None
 
     @property
     def globals(self):
-        """return copy of globals used for verification and evaluation"""
-        return copy(self._globals)
+        """return copy of globals used for verification and evaluation
+
+        All modules are imported, names missing in them are left out.
+        """
+        ret = copy(self._globals)
+        for name, value in self._globals.items():
+            if value.__class__ is _Lazy:
+                try:
+                    ret[name] = self._lookup(name)
+                except (ImportError, AttributeError):
+                    del ret[name]
+        return ret
 
     def visit(self, node):
         """verify if given node impose all pyckle restrictions
@@ -52,24 +177,132 @@ class PycklerBase():
         raises SyntaxError or return given node
         """
 
-        def visitor(node):
-            method = 'visit_' + node.__class__.__name__
-            visitor_f = getattr(self, method, self.generic_visit)
-            return visitor_f(node)
+        if self.limits is not None:
+            return self._visit_limited(node)
+
+        table = self._dispatch_table("visit_")
+        leaves = table.leaves
+        queue = deque((node, ))
+        popleft, append = queue.popleft, queue.append
+
+        # breadth first, like ast.walk, but every node is visited exactly
+        # once and trivial leaves (literals, contexts) are never queued
+        while queue:
+            n = popleft()
+            visitor_f = table.get(n.__class__)
+            if visitor_f is None:
+                visitor_f = table.resolve(n.__class__)
+            visitor_f(self, n)
+            # the dotted name is verified by visit_Attribute as a whole
+            if n.__class__ is _ast.Attribute:
+                continue
+            for child in iter_child_nodes(n):
+                if child.__class__ in leaves and \
+                    getattr(child, "value", None) is not Ellipsis:
+                    continue
+                append(child)
+        return node
 
-        visitor(node)
-        for n in ast.walk(node):
-            visitor(n)
+    # visit checking the limits, every node is checked before its children
+    def _visit_limited(self, node):
+
+        table = self._dispatch_table("visit_")
+        limits = self.limits
+        queue = deque(((node, 0), ))
+        popleft, append = queue.popleft, queue.append
+        expr = _ast.expr
+        nodes = 0
+
+        while queue:
+            n, depth = popleft()
+            if isinstance(n, expr):
+                nodes += 1
+                msg = limits.exceeded("max_nodes", nodes) or self._limit(n, depth)
+                if msg is not None:
+                    raise LimitError(msg, self._seargs(n))
+            visitor_f = table.get(n.__class__)
+            if visitor_f is None:
+                visitor_f = table.resolve(n.__class__)
+            visitor_f(self, n)
+            if isinstance(n, _CONTAINERS):
+                depth += 1
+            if n.__class__ is _ast.Attribute:
+                continue
+            for child in iter_child_nodes(n):
+                append((child, depth))
         return node
 
+    # return the message if node exceeds the limits or None
+    def _limit(self, node, depth):
+
+        limits = self.limits
+        if isinstance(node, _CONTAINERS):
+            msg = limits.exceeded("max_depth", depth + 1)
+            if msg is not None:
+                return msg
+            if isinstance(node, _ast.Dict):
+                return limits.exceeded("max_length", len(node.keys))
+            if isinstance(node, _ast.Call):
+                msg = limits.exceeded("max_length", len(node.args) + len(node.keywords))
+                name = _dotted(node.func)
+                if msg is None and node.args and name is not None:
+                    try:
+                        func = self._lookup(name)
+                    except (KeyError, ImportError, AttributeError):
+                        # reported by visit_Name or visit_Attribute
+                        return None
+                    return limits.allocation(func, [_argument(n) for n in node.args])
+                return msg
+            return limits.exceeded("max_length", len(node.elts))
+
+        value = _literal(node)
+        if isinstance(value, (str, bytes)):
+            return limits.exceeded("max_str", len(value))
+        if isinstance(value, int):
+            return limits.integer(value)
+        return None
+
+    @classmethod
+    def _dispatch_table(cls, prefix="visit_"):
+        """return the node class -> visit (or build) method mapping of this class
+
+        The table is built once for every (sub)class and stored in its own
+        __dict__, so subclasses never share the table of their parent.
+        """
+
+        if "_DISPATCH_TABLES" not in cls.__dict__:
+            cls._DISPATCH_TABLES = dict()
+        try:
+            return cls._DISPATCH_TABLES[prefix]
+        except KeyError:
+            generic = "generic_visit" if prefix == "visit_" else "generic_build"
+            table = _DispatchTable(cls, prefix, generic)
+            cls._DISPATCH_TABLES[prefix] = table
+            return table
+
     def parse(self):
         """parse and verify the AST
         
         raises SyntaxError of return topmost AST node
         """
         
-        node = ast.parse(''.join(self._source), self._filename, mode="eval")
-        return self.visit(node)
+        stats = self.stats
+        if stats is None:
+            node = ast.parse(self._text(), self._filename, mode="eval")
+            self.visit(node)
+        else:
+            text = self._text()
+            stats.add_bytes(len(text))
+            start = clock()
+            node = ast.parse(text, self._filename, mode="eval")
+            start = stats.phase("parse", start)
+            self.visit(node)
+            stats.phase("visit", start)
+            stats.add_nodes(sum(1 for n in ast.walk(node)))
+
+        if self.intern is not None:
+            self._intern(node)
+        return node
 
     def eval(self):
         """evaluate the code, once is parsed and verifyied
@@ -78,8 +311,66 @@ class PycklerBase():
         """
 
         node = self.parse()
+        stats = self.stats
+        if stats is not None:
+            start = clock()
         code = compile(node, self._filename, mode="eval")
-        return eval(code, self.globals)
+        if stats is not None:
+            start = stats.phase("compile", start)
+        if self._eval_globals is not None:
+            ret = eval(code, self._eval_globals)
+        else:
+            # names used by the document are imported by visit
+            ret = eval(code, _eval_globals(self._globals))
+        if stats is not None:
+            stats.phase("eval", start)
+        return ret
+
+    def build(self):
+        """build the Python object directly from the verified AST
+
+        Gives the same result as ``eval``, but nodes are turned to objects
+        one by one, so the document is never compiled to the bytecode
+        
+        raises SyntaxError of return Python object
+        """
+
+        node = self.parse()
+        self._build_table = self._dispatch_table("build_")
+        if self.stats is None:
+            return self._build(node)
+        start = clock()
+        ret = self._build(node)
+        self.stats.phase("build", start)
+        return ret
+
+    def decode(self):
+        """parse the source with pyckle's own parser, which creates objects
+        in one pass without ``tokenize``, ``ast`` or ``compile``
+
+        Names are checked against globals, but visit_* methods of subclasses
+        are not called. Unlike ``ast.parse`` it handles documents of any
+        nesting depth.
+
+        raises SyntaxError of return Python object
+        """
+
+        if self.stats is None:
+            return Parser(self).parse(self._text())
+        text = self._text()
+        self.stats.add_bytes(len(text))
+        start = clock()
+        ret = Parser(self).parse(text)
+        self.stats.phase("decode", start)
+        return ret
+
+    # build an object from a single node
+    def _build(self, node):
+        try:
+            build_f = self._build_table[node.__class__]
+        except KeyError:
+            build_f = self._build_table.resolve(node.__class__)
+        return build_f(self, node)
 
     ### visit meths
     def visit_Expression(self, node):
@@ -95,17 +386,29 @@ class PycklerBase():
     def visit_Bytes(self, node):
         return
 
+    # True, False and None in python 3.4 - 3.7
+    def visit_NameConstant(self, node):
+        return
+
+    # all literals in python 3.8+
+    def visit_Constant(self, node):
+        if node.value is Ellipsis:
+            raise SyntaxError(
+                "Unsupported type of node: 'Ellipsis'",
+                self._seargs(node)
+                )
+        return
+
     def visit_BinOp(self, node):
 
         def isnumber(node):
 
-            if isinstance(node, _ast.Num):
-                return "complex" if isinstance(node.n, complex) else "number"
-            elif hasattr(node, "op") and \
-                isinstance(node.op, _ast.USub) and isinstance(node.operand, _ast.Num):
-                return "complex" if isinstance(node.operand.n, complex) else "number"
-
-            return None
+            if isinstance(node, _ast.UnaryOp) and isinstance(node.op, _ast.USub):
+                node = node.operand
+            n = _number(node)
+            if n is None:
+                return None
+            return "complex" if isinstance(n, complex) else "number"
 
         foo = isnumber(node.left), isnumber(node.right)
 
@@ -120,8 +423,11 @@ class PycklerBase():
             )
 
     def visit_Name(self, node):
-        if node.id in self._globals:
+        try:
+            self._lookup(node.id)
             return
+        except (KeyError, ImportError, AttributeError):
+            pass
         raise SyntaxError(
             "'{}' is not allowed name".format(node.id),
             self._seargs(node)
@@ -140,8 +446,9 @@ class PycklerBase():
         return
 
     def visit_Call(self, node):
-        if  node.starargs is not None or \
-            node.kwargs is not None:
+        # python 3.5+ has Starred nodes in args instead
+        if  getattr(node, "starargs", None) is not None or \
+            getattr(node, "kwargs", None) is not None:
             raise NotImplementedError("starargs or kwargs support is not implemented in visit_Call")
 
         return
@@ -163,8 +470,16 @@ class PycklerBase():
 
         s = '.'.join(l)
 
-        if s in self._globals:
+        # eval needs the modules too, the names of node are not visited, so
+        # the bare package is never allowed
+        try:
+            self._lookup(s)
+            for mod in _split_modules(s):
+                if mod != _PACKAGE:
+                    self._lookup(mod)
             return
+        except (KeyError, ImportError, AttributeError):
+            pass
 
         raise SyntaxError(
             "'{}' is not allowed name".format(s),
@@ -183,7 +498,7 @@ class PycklerBase():
 
     # FIXME: this runs twice for complex numbers
     def visit_UnaryOp(self, node):
-        if isinstance(node.op, _ast.USub) and isinstance(node.operand, _ast.Num):
+        if isinstance(node.op, _ast.USub) and _number(node.operand) is not None:
             return
         raise SyntaxError(
             "Unsupported unary operator, only negative numbers are allowed",
@@ -204,15 +519,168 @@ class PycklerBase():
             self._seargs(node)
             )
 
+    ### build meths - called on verified nodes only
+    def build_Expression(self, node):
+        return self._build(node.body)
+
+    def build_Num(self, node):
+        return node.n
+
+    def build_Str(self, node):
+        return node.s
+
+    def build_Bytes(self, node):
+        return node.s
+
+    def build_NameConstant(self, node):
+        return node.value
+
+    def build_Constant(self, node):
+        return node.value
+
+    def build_Name(self, node):
+        return self._globals[node.id]
+
+    # the dotted name is verified in visit_Attribute
+    def build_Attribute(self, node):
+        names = list()
+        n = node
+        while isinstance(n, _ast.Attribute):
+            names.append(n.attr)
+            n = n.value
+        names.append(n.id)
+        return self._globals['.'.join(reversed(names))]
+
+    def build_Tuple(self, node):
+        return tuple(self._build(n) for n in node.elts)
+
+    def build_List(self, node):
+        return [self._build(n) for n in node.elts]
+
+    def build_Set(self, node):
+        return {self._build(n) for n in node.elts}
+
+    def build_Dict(self, node):
+        ret = dict()
+        for k, v in zip(node.keys, node.values):
+            # {**mapping} in python 3.5+
+            if k is None:
+                ret.update(self._build(v))
+            else:
+                ret[self._build(k)] = self._build(v)
+        return ret
+
+    def build_Call(self, node):
+        func = self._build(node.func)
+        args = [self._build(n) for n in node.args]
+        kwargs = dict()
+        names = set()
+        for kw in node.keywords:
+            # compile raises it for eval
+            if kw.arg in names:
+                raise SyntaxError(
+                    "keyword argument repeated: {}".format(kw.arg),
+                    self._seargs(kw)
+                    )
+            # foo(**mapping) in python 3.5+
+            if kw.arg is None:
+                mapping = self._build(kw.value)
+                if not hasattr(mapping, "keys"):
+                    raise TypeError("{}() argument after ** must be a mapping, not {}".format(
+                        getattr(func, '__name__', 'function'), type(mapping).__name__))
+                items = [(k, mapping[k]) for k in mapping.keys()]
+            else:
+                names.add(kw.arg)
+                items = ((kw.arg, self._build(kw.value)), )
+            for key, value in items:
+                if key in kwargs:
+                    raise TypeError(
+                        "{}() got multiple values for keyword argument '{}'".format(
+                            getattr(func, '__name__', 'function'), key))
+                kwargs[key] = value
+        return func(*args, **kwargs)
+
+    def build_UnaryOp(self, node):
+        return -self._build(node.operand)
+
+    def build_BinOp(self, node):
+        left, right = self._build(node.left), self._build(node.right)
+        if isinstance(node.op, _ast.Add):
+            return left + right
+        return left - right
+
+    def generic_build(self, node):
+        raise SyntaxError(
+            "Unsupported type of node: '{}'".format(node.__class__.__name__),
+            self._seargs(node)
+            )
+
     ### private methods
 
+    # return the value of allowed name, import it on the first use
+    # raises KeyError, ImportError or AttributeError
+    def _lookup(self, name):
+        value = self._globals[name]
+        if value.__class__ is not _Lazy:
+            return value
+        value = value.resolve()
+        self._globals[name] = value
+        if self._eval_globals is not None:
+            self._eval_globals[name] = value
+        return value
+
+    # replace strings of verified tree by the shared ones, so both eval and
+    # build return them
+    def _intern(self, node):
+
+        interner = self.intern
+        keys = set()
+        for n in ast.walk(node):
+            if n.__class__ is _ast.Dict:
+                keys.update(id(k) for k in n.keys if k is not None)
+                continue
+            value = _literal(n)
+            if value.__class__ is not str:
+                continue
+            attr = "value" if hasattr(n, "value") else "s"
+            if id(n) in keys:
+                setattr(n, attr, interner.key(value))
+            else:
+                setattr(n, attr, interner.string(value))
+
+    # the whole source as one string, checked against max_bytes before
+    # it is joined
+    def _text(self):
+        if self.limits is not None:
+            if isinstance(self._source, str):
+                size = len(self._source)
+            else:
+                size = sum(len(line) for line in self._source)
+            msg = self.limits.exceeded("max_bytes", size)
+            if msg is not None:
+                raise LimitError(msg, (self._filename, 1, 1, None))
+        if isinstance(self._source, str):
+            return self._source
+        return ''.join(self._source)
+
     # prepare arguments for SyntaxError in a safe way
     def _seargs(self, node):
 
         offset = node.col_offset + 1 if hasattr(node, "col_offset") else 0
         lineno = node.lineno if hasattr(node, "lineno") else -1
+
+        # string source is split to lines only when an error is reported
+        if self._lines is None:
+            if self.stats is not None:
+                start = clock()
+            if isinstance(self._source, str):
+                self._lines = _split_lines(self._source)
+            else:
+                self._lines = self._source
+            if self.stats is not None:
+                self.stats.phase("split_lines", start)
         try:
-            line = self._source[lineno-1]
+            line = self._lines[lineno-1]
         except IndexError:
             line = "<N/A>"
 
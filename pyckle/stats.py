@@ -0,0 +1,103 @@
+##
+##  Copyright (c) 2013 Michal Vyskocil
+##
+##  released under MIT License, see LICENSE
+##
+
+"""Per-phase statistics of loading
+
+    stats = Stats()
+    obj = load(fp, use_cache=True, stats=stats)
+    print(stats)
+
+Phases are
+
+    read        - fp.readlines() in load
+    jsonlike    - the fast path for JSON-like documents
+    parse       - ast.parse
+    visit       - validation of the AST
+    compile     - compile (method="eval")
+    eval        - eval (method="eval")
+    build       - building of the object from the AST (method="build")
+    decode      - pyckle's own parser (method="decode")
+    split_lines - splitting the source for an error message
+    read_cache  - stat, digest and unpickling of the cache
+    write_cache - pickling and writing of the cache
+
+Nothing is measured, if no stats object is passed.
+"""
+
+from timeit import default_timer as clock
+
+class Stats(object):
+    """Statistics of loads and load
+
+    :ivar times: phase -> seconds spent in sum
+    :ivar calls: phase -> number of times the phase ran
+    :ivar nodes: number of AST nodes visited
+    :ivar bytes: number of characters of parsed documents
+    :ivar cache: "hit" or the reason of a miss ("missing", "magic", "size",
+                 "timestamp", "digest", "unpickling", "truncated") -> number
+
+    It is not locked, each thread should use its own instance.
+    """
+
+    def __init__(self, callback=None):
+        """Initialize a Stats
+
+        :param callback: The function called for each event with its name
+                         and value, phase name and seconds, "nodes" or
+                         "bytes" and number, or "cache" and "hit" or the
+                         reason of a miss
+        """
+
+        self.callback = callback
+        self.clear()
+
+    def clear(self):
+        """forget all recorded data"""
+
+        self.times = dict()
+        self.calls = dict()
+        self.nodes = 0
+        self.bytes = 0
+        self.cache = dict()
+
+    def phase(self, name, start):
+        """record the phase started at ``start`` (``pyckle.stats.clock``)
+
+        :return: The current time, the start of next phase
+        """
+
+        now = clock()
+        self.times[name] = self.times.get(name, 0.0) + now - start
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.callback is not None:
+            self.callback(name, now - start)
+        return now
+
+    def add_nodes(self, n):
+        self.nodes += n
+        if self.callback is not None:
+            self.callback("nodes", n)
+
+    def add_bytes(self, n):
+        self.bytes += n
+        if self.callback is not None:
+            self.callback("bytes", n)
+
+    def cache_event(self, reason):
+        """record the cache hit ("hit") or the reason of cache miss"""
+
+        self.cache[reason] = self.cache.get(reason, 0) + 1
+        if self.callback is not None:
+            self.callback("cache", reason)
+
+    def __str__(self):
+        lines = ["{:<12} {:6d}x {:10.6f}s".format(name, self.calls[name], t)
+                 for name, t in sorted(self.times.items(), key=lambda x: -x[1])]
+        lines.append("nodes {}, bytes {}".format(self.nodes, self.bytes))
+        if self.cache:
+            lines.append("cache " + ", ".join(
+                "{} {}".format(k, v) for k, v in sorted(self.cache.items())))
+        return "\n".join(lines)
@@ -1,54 +1,17 @@
 # various private helper functions for pyckle
 
 # for a proper error reporting, one needs to print a line
-# and line number - therefor string input is tokenizes
-# in order to produce such information
-def _split_lines_impl(src):
-
-    import tokenize
-
-    try:
-        from StringIO import StringIO
-        tokenize_f = lambda src: tokenize.generate_tokens(StringIO(src).readline)
-    except ImportError:
-        from io import BytesIO
-        tokenize_f = lambda src: tokenize.tokenize(BytesIO(src.encode('utf-8')).readline)
-    
-    lastline = 0
-
-    ret = list()
-
-
-    for toktype, tokstring, (srow, scol), (erow, ecol), line in tokenize_f(src):
-
-        if srow != erow:
-            raise SyntaxError("srow({}) != erow({}), on line `{}'!, which is not supported".format(srow, erow, line))
-
-        # ignore ENCODING(56) and ENDMARKER(0) tokens
-        if toktype in (56, 0):
-            continue
-
-        if erow != lastline:
-            ret.append(line)
-            lastline = erow
-
-    return ret
-
-# adds an error handling on top of _split_lines_impl
+# and line number - string input is split to lines only
+# when an error is about to be reported
+# >>> _split_lines('[1,\n2]')
+# ['[1,\n', '2]']
 def _split_lines(src):
 
-
-    import tokenize
-
-    try:
-        return _split_lines_impl(src)
-    except tokenize.TokenError as te:
-        raise SyntaxError(
-            te.args[0],
-            ("<string>",
-            te.args[1][0]-1,
-            te.args[1][1],
-            src)) #from None
+    ret = [line + '\n' for line in src.split('\n')]
+    ret[-1] = ret[-1][:-1]
+    if not ret[-1]:
+        del ret[-1]
+    return ret
 
 # split modules and return the tuple
 # >>> _split_modules('foo.bar.Baz')
@@ -64,21 +27,94 @@ def _split_modules(mod):
     return tuple(ret)
 
 
+# placeholder of a module or module attribute in globals, it is imported
+# when a document references the name for the first time
+# >>> _Lazy('decimal', 'Decimal').resolve()
+# <class 'decimal.Decimal'>
+class _Lazy(object):
+
+    __slots__ = ("module", "attr", "_value")
+
+    def __init__(self, module, attr=None):
+        self.module = module
+        self.attr = attr
+
+    def __repr__(self):
+        return "<lazy {}>".format(
+            self.module if self.attr is None else self.module + '.' + self.attr)
+
+    # raises ImportError or AttributeError if the name does not exist
+    def resolve(self):
+        try:
+            return self._value
+        except AttributeError:
+            pass
+        from importlib import import_module
+        value = import_module(self.module)
+        if self.attr is not None:
+            value = getattr(value, self.attr)
+        self._value = value
+        return value
+
+    # the module is imported already
+    def loaded(self):
+        import sys
+        return self.module in sys.modules
+
+# the package of pyckle.vector and pyckle.records, it is not an allowed name
+# itself, eval gets the _Package of allowed names instead
+_PACKAGE = 'pyckle'
+
 # fix imports - iow adds all undelying modules to globals
 # _fix_imports({'foo.Bar' : ...'})
-# {'foo.Bar' : ..., 'foo' : ...}
-def _fix_imports(globals):
-
-    from importlib import import_module
+# {'foo.Bar' : ..., 'foo' : <lazy foo>}
+# only ``keys`` are checked, if given
+def _fix_imports(globals, keys=None):
 
-    keys = list(globals.keys())
+    keys = list(globals.keys() if keys is None else keys)
 
     for key in (k for k in keys if '.' in k):
         for mod in _split_modules(key):
-            globals[mod] = import_module(mod)
+            if mod != _PACKAGE:
+                globals[mod] = _module(mod)
 
     return globals
 
+# the package in eval globals, attributes are the allowed names of globals
+# >>> _Package('pyckle', {'pyckle.vector' : vector}).vector
+# <function vector at ...>
+class _Package(object):
+
+    def __init__(self, name, globals):
+        self._name = name
+        self._globals = globals
+
+    def __getattr__(self, attr):
+        try:
+            value = self._globals[self._name + '.' + attr]
+        except KeyError:
+            raise AttributeError(attr)
+        if value.__class__ is _Lazy:
+            value = value.resolve()
+        return value
+
+# return the copy of globals for eval, with the _Package of pyckle names
+def _eval_globals(globals):
+    ret = dict(globals)
+    if _PACKAGE not in ret and \
+        any(k.startswith(_PACKAGE + '.') for k in globals):
+        ret[_PACKAGE] = _Package(_PACKAGE, ret)
+    return ret
+
+# placeholders of modules are shared, so each is imported once
+_MODULES = dict()
+
+def _module(mod):
+    try:
+        return _MODULES[mod]
+    except KeyError:
+        return _MODULES.setdefault(mod, _Lazy(mod))
+
 # prepare GLOBALS - this differs from python version
 def _make_globals():
     
@@ -88,12 +124,6 @@ def _make_globals():
     except ImportError:
         pass
 
-    import array
-    import collections
-    import datetime
-    import decimal
-    import fractions
-
 
     ret = { 
         'None'      : None,
@@ -146,28 +176,35 @@ def _make_globals():
         'datetime.timezone',
         'decimal.Decimal',
         'fractions.Fraction',
+        'pyckle.vector',
+        'pyckle.records',
         )
 
-    lc = locals()
-
-    for mod, attr in (x.split('.') for x in OTHERS):
-        if not mod in lc:
-            continue
-        foo = getattr(lc[mod], attr, None)
-        if foo is None:
-            continue
-        ret['.'.join((mod, attr))] = foo
+    # imported on the first use, names missing in current python
+    # implementation are not allowed then
+    for name in OTHERS:
+        ret[name] = _Lazy(*name.split('.'))
     return ret
 
-# guess a cache path from filename
+# guess a cache path from filename, PEP 3147 location honors
+# PYTHONPYCACHEPREFIX in python 3.8+
 def _cache_path(filename):
 
-    import imp
+    try:
+        from importlib.util import cache_from_source
+    except ImportError:
+        # python2 compatibility
+        return filename + ".cache"
 
-    if hasattr(imp, "cache_from_source"):
-        return imp.cache_from_source(filename) + "kle.cache"
-    else:
-        return fullname + ".cache"
+    return cache_from_source(filename) + "kle.cache"
+
+# guess a path of the index of top-level entries next to the cache, see
+# pyckle.indexed
+def _index_path(filename, nested=False):
+    base = _cache_path(filename)
+    if base.endswith(".cache"):
+        base = base[:-len(".cache")]
+    return base + (".nested.index" if nested else ".index")
 
 # write long long (8B) in little endian order to ``fp``
 # XXX: what happend on platform q/o uint64?
@@ -180,8 +217,9 @@ def _rd_llong(fp):
     import struct
     return struct.unpack("<Q", fp.read(8))[0]
 
-# return timestamp and a size of a file
-def _stat(filename, fp=None):
+# return timestamp and a size of a file, the timestamp is in nanoseconds
+# if ``ns`` is True
+def _stat(filename, fp=None, ns=False):
 
     import os
 
@@ -193,4 +231,28 @@ def _stat(filename, fp=None):
     except OSError:
         return None, None
 
+    if ns:
+        # python2 compatibility
+        if hasattr(st, "st_mtime_ns"):
+            return st.st_mtime_ns, st.st_size
+        return int(st.st_mtime * 10**9), st.st_size
     return int(st.st_mtime), st.st_size
+
+# return a new hash object producing 20B digests
+def _hasher():
+
+    import hashlib
+
+    # python2 compatibility
+    if hasattr(hashlib, "blake2b"):
+        return hashlib.blake2b(digest_size=20)
+    return hashlib.sha1()
+
+# return the digest of file content
+def _digest(filename):
+
+    h = _hasher()
+    with open(filename, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1024*1024), b''):
+            h.update(chunk)
+    return h.digest()
@@ -21,8 +21,9 @@ except NameError:
     PermissionError = IOError
     FileNotFoundError = IOError
 
-from pyckle import Pyckler, loads, load, dumps, dump
-from pyckle.cache import CacheMismatchError, write_cache, read_cache
+from pyckle import Pyckler, Engine, Memo, loads, load, dumps, dump, iterload
+from pyckle import FileCache, MemoryCache, SQLiteCache, LoadError, load_many
+from pyckle.cache import CacheMismatchError, write_cache, read_cache, load_cache
 
 VALID_TEST_CASES = (
     '42',
@@ -144,6 +145,92 @@ class TestLoad(unittest.TestCase):
             else:
                 self.fail("``{}'' is expected to raise an exception".format(string))
 
+    def testBuildLoad(self):
+
+        for string in VALID_TEST_CASES:
+
+            exp = loads(string)
+            ret = loads(string, method="build")
+
+            self.assertEqual(exp, ret)
+            self.assertIs(type(exp), type(ret))
+            self.assertEqual(ret, load(StringIO(string), method="build"))
+
+        for string, _ in UNSUPPORTED_TEST_CASES:
+            with self.assertRaises(SyntaxError):
+                loads(string, method="build")
+
+        with self.assertRaises(ValueError):
+            loads("42", method="exec")
+
+        for method in ("eval", "build"):
+            with self.assertRaisesRegexp(SyntaxError, "keyword argument repeated"):
+                loads("dict(a=1, a=2)", method=method)
+            with self.assertRaisesRegexp(TypeError, "multiple values"):
+                loads("dict(a=1, **{'a' : 2})", method=method)
+
+        pyckler = Pyckler(["datetime.date", ], "<string>")
+        self.assertIs(pyckler.globals["datetime.date"], pyckler.build())
+
+    def testDecodeLoad(self):
+
+        for string in VALID_TEST_CASES + (
+            '"con" \'cat\'',
+            '[1,\n 2, # comment\n 3,]',
+            '{1 : {2 : (3, )}, "x" : [], b"y\\x00" : ()}',
+            'dict(a=1, b=[-2.5e3])',
+            '1, (2, 3),',
+            '1+(2j)',
+            '-(1)',
+            '-((1))+2j',
+            '{**{1 : 2}}',
+            '{1 : 2, **{3 : 4}, 5 : 6}',
+            'dict(**{"a" : 1}, b=2)',
+            "decimal .Decimal('1')",
+            "[decimal.\n Decimal('1'), decimal\n.Decimal, decimal\\\n.Decimal]",
+            ):
+
+            exp = loads(string)
+            ret = loads(string, method="decode")
+
+            self.assertEqual(exp, ret)
+            self.assertIs(type(exp), type(ret))
+            self.assertEqual(ret, load(StringIO(string), method="decode"))
+
+        for string, (msg, filename, lineno, offset, text) in UNSUPPORTED_TEST_CASES:
+            with self.assertRaises(SyntaxError) as cm:
+                loads(string, method="decode")
+            self.assertEqual(
+                (filename, lineno, text),
+                (cm.exception.filename, cm.exception.lineno, cm.exception.text))
+
+        # keywords and constants are not names of keyword arguments
+        for string in ('dict(True=1)', 'dict(None=2)', 'dict(lambda=1)',
+            'dict(a=1, if=2)', 'decimal.\nDecimal', 'decimal.1'):
+            for method in ("eval", "build", "decode"):
+                self.assertRaises(SyntaxError, loads, string, method=method)
+
+        for string, offset in (('[1, 2,\n 3, 4 5]', 7), ('1 + 2j + 3', 1)):
+            with self.assertRaises(SyntaxError) as cm:
+                Pyckler([string, ], "<string>").decode()
+            self.assertEqual(
+                (string.count('\n') + 1, offset),
+                (cm.exception.lineno, cm.exception.offset))
+
+    def testMultilineString(self):
+
+        string = '["""multi\nline""",\n lambda: 42]'
+
+        self.assertEqual(
+            ["multi\nline", 42],
+            loads(string.replace("lambda: ", "")))
+
+        with self.assertRaises(SyntaxError) as cm:
+            loads(string)
+        self.assertEqual(
+            (3, " lambda: 42]"),
+            (cm.exception.lineno, cm.exception.text))
+
     def testInvalidSyntax(self):
 
         se1, se2, se3 = None, None, None
@@ -171,6 +258,230 @@ class TestLoad(unittest.TestCase):
         else:
             self.fail("SyntaxError expected for ``{}''".format(source))
 
+class TestVisit(unittest.TestCase):
+
+    def testDispatchTablePerClass(self):
+
+        class NoStrPyckler(Pyckler):
+            def visit_Str(self, node):
+                raise SyntaxError("no strings", self._seargs(node))
+            visit_Constant = visit_Str
+
+        self.assertEqual(["a"], loads('["a"]'))
+        with self.assertRaises(SyntaxError):
+            loads('["a"]', cls=NoStrPyckler)
+        self.assertIsNot(
+            Pyckler._dispatch_table(),
+            NoStrPyckler._dispatch_table())
+
+    def testVisitEveryNode(self):
+
+        visited = list()
+
+        class LoggingPyckler(Pyckler):
+            def visit_Tuple(self, node):
+                visited.append(node)
+
+        loads('[(1, 2), [(3, (4, ))]]', cls=LoggingPyckler)
+        self.assertEqual(3, len(visited))
+        self.assertEqual(3, len(set(visited)))
+
+class TestDeep(unittest.TestCase):
+
+    def testDeepNesting(self):
+
+        depth = 10 * sys.getrecursionlimit()
+        for opening, closing in (("[", "]"), ("(", ",)"), ("{1: ", "}"), ("{'a': ", "}")):
+
+            string = opening * depth + "42" + closing * depth
+
+            obj = loads(string, method="decode")
+            self.assertEqual(string, dumps(obj))
+
+            fp = StringIO()
+            dump(obj, fp)
+            self.assertEqual(string, fp.getvalue())
+
+        string = "dict(a=" * depth + "42" + ")" * depth
+        self.assertEqual(
+            "{'a': " * depth + "42" + "}" * depth,
+            dumps(loads(string, method="decode")))
+
+class TestEngine(unittest.TestCase):
+
+    def testEngineLoads(self):
+
+        from fractions import Fraction
+        source = "{'a': [1, -2, 3+4j], 'b': fractions.Fraction(1, 2), 'c': Foo}"
+        for method in ("eval", "build", "decode"):
+            engine = Engine(globals={"Foo": 42}, method=method)
+            self.assertEqual(
+                {'a': [1, -2, 3+4j], 'b': Fraction(1, 2), 'c': 42},
+                engine.loads(source))
+            self.assertEqual([1, 2], engine.load(StringIO("[1,\n 2]")))
+            with self.assertRaises(SyntaxError):
+                engine.loads("Bar")
+            with self.assertRaises(SyntaxError):
+                engine.loads("__builtins__")
+        # namespace is not modified by eval
+        self.assertNotIn("__builtins__", engine.pyckler("").globals)
+
+        self.assertRaises(ValueError, Engine, method="exec")
+        self.assertRaises(TypeError, engine.loads, 42)
+
+    def testEngineSubclass(self):
+
+        class NoListPyckler(Pyckler):
+            def visit_List(self, node):
+                raise SyntaxError("lists are not allowed", self._seargs(node))
+
+        engine = Engine(NoListPyckler, method="build")
+        self.assertEqual((1, 2), engine.loads("(1, 2)"))
+        with self.assertRaisesRegexp(SyntaxError, "lists are not allowed"):
+            engine.loads("[1, 2]")
+
+    def testEngineThreads(self):
+
+        import threading
+
+        engine = Engine()
+        ret = list()
+        def load_f(i):
+            for j in range(100):
+                ret.append(engine.loads(repr([i, j])) == [i, j])
+        threads = [threading.Thread(target=load_f, args=(i, )) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([True] * 400, ret)
+
+class TestJSONLike(unittest.TestCase):
+
+    def testSameAsEval(self):
+
+        from pyckle.jsonlike import decode
+
+        for string in (
+            "{'a': [1, -2.5e3, True, False, None], \"b\": {'c': ''}}",
+            "'a\\'b\"c'", '"a\\"b\'c"', "'\\\\u0041\\u00e9\\t'",
+            "[1e400, -0, 10000000000000000000000]", "\n[1,\n 2]\n",
+            "{'a': 1, 'a': 2}",
+            ):
+            self.assertEqual(
+                repr(Pyckler([string, ], "<string>").eval()), repr(decode(string)))
+            self.assertEqual(repr(decode(string)), repr(loads(string)))
+
+        # full path
+        for string in (
+            "(1, 2)", "1, 2", "{1: 2}", "{1, 2}", "1+2j", "[1,]",
+            "'\\x41'", "'\\ud83d\\ude00'", "'\\/'", "b'x'", "[1] # comment",
+            "decimal.Decimal('1')", "[1_0]", "'a' 'b'",
+            ):
+            self.assertRaises(ValueError, decode, string)
+            self.assertEqual(
+                repr(Pyckler([string, ], "<string>").eval()), repr(loads(string)))
+
+        for string in ("[1, 2", " [1]", "[1]\n  ", "[1,\n 2]\r\n\t", "'a\x00'"):
+            self.assertRaises(ValueError, decode, string)
+            self.assertRaises((SyntaxError, ValueError), loads, string)
+        self.assertEqual([1], decode("[1]\n  \n"))
+        with self.assertRaises(ValueError):
+            loads("[1, 2]", method="exec")
+
+    def testSubclass(self):
+
+        class NoListPyckler(Pyckler):
+            def visit_List(self, node):
+                raise SyntaxError("lists are not allowed", self._seargs(node))
+
+        with self.assertRaises(SyntaxError):
+            loads("[1, 2]", cls=NoListPyckler)
+        with self.assertRaises(SyntaxError):
+            Engine(NoListPyckler).loads("[1, 2]")
+
+class TestLazyImports(unittest.TestCase):
+
+    def testLazyImports(self):
+
+        import subprocess
+        import pyckle
+
+        code = (
+            "import sys, pyckle\n"
+            "mods = ('array', 'decimal', 'fractions', 'datetime')\n"
+            "print([m for m in mods if m in sys.modules])\n"
+            "pyckle.loads(\"decimal.Decimal('1')\", method=sys.argv[1])\n"
+            "print([m for m in mods if m in sys.modules])\n")
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.abspath(pyckle.__file__)))
+        for method in ("eval", "build", "decode"):
+            out = subprocess.check_output(
+                [sys.executable, "-c", code, method], env=env).decode("ascii")
+            self.assertEqual(["[]", "['decimal']"], out.split())
+
+    def testLazyGlobals(self):
+
+        from decimal import Decimal
+        from pyckle.utils import _Lazy
+
+        pyckler = Pyckler("decimal.Decimal('1')", "<string>")
+        self.assertIs(_Lazy, type(pyckler._globals["decimal.Decimal"]))
+        self.assertEqual(Decimal('1'), pyckler.eval())
+        self.assertIs(Decimal, pyckler._globals["decimal.Decimal"])
+        # placeholders of modules are shared by constructions
+        self.assertIs(
+            Pyckler("", "")._globals["decimal"], Pyckler("", "")._globals["decimal"])
+        # names missing in python are not allowed
+        with self.assertRaisesRegexp(SyntaxError, "'decimal.Foo' is not allowed name"):
+            loads("decimal.Foo", globals={"decimal.Foo": _Lazy("decimal", "Foo")})
+        self.assertIsNot(_Lazy, type(pyckler.globals["fractions.Fraction"]))
+
+class TestIterLoad(unittest.TestCase):
+
+    def testIterLoad(self):
+
+        for string in (
+            '[1, "two", (3, 4), {5 : 6}]',
+            '(1, fractions.Fraction(1, 3),\n # comment, with ]\n "a" "b", )',
+            '{"a" : 1, (1, 2) : [3, {4}], 5 : -1-2j}',
+            '{1, 2, 3}',
+            '{**{1 : 2}, 3 : 4}',
+            '[\n]\n',
+            repr({str(i) * 7 : [i, float(i), (i, -i)] for i in range(256)}),
+            ):
+
+            exp = loads(string)
+
+            for chunk_size in (1, 3, 64, 64*1024):
+                ret = iterload(StringIO(string), chunk_size=chunk_size)
+                self.assertEqual(exp, type(exp)(ret))
+
+    def testIterLoadError(self):
+
+        for chunk_size in (1, 3, 64):
+            with self.assertRaises(SyntaxError) as cm:
+                list(iterload(StringIO('[1, 2,\n 3 4]'), chunk_size=chunk_size))
+            self.assertEqual(
+                (2, 4, " 3 4]"),
+                (cm.exception.lineno, cm.exception.offset, cm.exception.text))
+
+        with self.assertRaises(SyntaxError):
+            list(iterload(StringIO('42')))
+
+    def testIterLoadSets(self):
+
+        # sets written by dumps
+        for obj in (set(), frozenset(), frozenset([1, 2]), {3, 4}):
+            for chunk_size in (1, 3, 64):
+                ret = iterload(StringIO(dumps(obj)), chunk_size=chunk_size)
+                self.assertEqual(obj, type(obj)(ret))
+        self.assertEqual([5], list(iterload(StringIO('set(\n[5] # c\n)\n'))))
+
+        for string in ('set() 1', "frozenset({'a' : 1})", 'set(', 'foo()'):
+            with self.assertRaises(SyntaxError):
+                list(iterload(StringIO(string)))
+
 class TestDump(unittest.TestCase):
 
     def testDump(self):
@@ -193,6 +504,55 @@ class TestDump(unittest.TestCase):
             self.assertEqual(obj, loads(string2))
             self.assertEqual(obj, loads(string3))
 
+    def testDumpGlobals(self):
+
+        import array
+        import collections
+        import datetime
+        import decimal
+        import fractions
+
+        for obj in (
+            float('inf'),
+            1-2j,
+            frozenset(),
+            bytearray(b"bytes"),
+            array.array('d', [0.5, -1.0]),
+            collections.deque([1, 2], 5),
+            collections.Counter("abracadabra"),
+            collections.OrderedDict([(2, 1), (1, 2)]),
+            collections.defaultdict(list, {1 : [2]}),
+            datetime.datetime(2013, 7, 14, 12, 0, 30, 42),
+            datetime.timedelta(-1, 5, 7),
+            decimal.Decimal("1.10"),
+            fractions.Fraction(22, 7),
+            ):
+
+            string = dumps(obj)
+            io = StringIO()
+            dump(obj, io)
+
+            self.assertEqual(string, io.getvalue())
+            self.assertEqual(obj, loads(string))
+            self.assertIs(type(obj), type(loads(string)))
+
+        self.assertEqual("{1: 2}", dumps({1 : 2}))
+
+        # python 3.6+
+        if hasattr(datetime.time, "fold"):
+            for obj in (
+                datetime.datetime(2013, 10, 27, 2, 30, fold=1),
+                datetime.time(2, 30, fold=1),
+                ):
+                self.assertEqual(1, loads(dumps(obj)).fold)
+                self.assertEqual(1, loads(dumps(obj), method="decode").fold)
+
+        l = list()
+        l.append(l)
+        for obj in (object(), collections.defaultdict(int), l):
+            with self.assertRaises(TypeError):
+                dumps(obj)
+
 class TestCache(unittest.TestCase):
 
     def setUp(self):
@@ -209,7 +569,7 @@ class TestCache(unittest.TestCase):
         cache = NamedTemporaryFile()
         write_cache(self.obj, pyckle.name, cache.name)
 
-        self.assertNotEqual(0, os.fstat(cache.file.fileno()).st_size)
+        self.assertNotEqual(0, os.stat(cache.name).st_size)
 
         obj2 = read_cache(pyckle.name, cache.name)
 
@@ -239,7 +599,7 @@ class TestCache(unittest.TestCase):
         self.assertIsNotNone(obj2)
         self.assertEqual(self.obj, obj2)
     
-    def testWriteCacheWithInaccessbileCFile(self):
+    def testWriteCacheReplacesInaccessbileCFile(self):
         
         foo = NamedTemporaryFile(mode='w+t')
         dump(self.obj, foo)
@@ -247,13 +607,14 @@ class TestCache(unittest.TestCase):
         cache = NamedTemporaryFile(mode='w+b')
         os.chmod(cache.name, 0o000)
 
-        #
-        with self.assertRaises(PermissionError):
-            write_cache(self.obj, foo.name, cfilename=cache.name)
+        # root can read anything
+        if not os.access(cache.name, os.R_OK):
+            with self.assertRaisesRegexp(PermissionError, "Permission denied"):
+                read_cache(foo.name, cache.name)
 
-        with self.assertRaisesRegexp(PermissionError, "Permission denied"):
-            obj2 = read_cache(foo.name, cache.name)
-            self.assertIsNone(obj2)
+        # the cache is replaced by a new file, not rewritten in place
+        write_cache(self.obj, foo.name, cfilename=cache.name)
+        self.assertEqual(self.obj, read_cache(foo.name, cache.name))
     
     def testWriteCacheWithInaccessbileFile(self):
         
@@ -343,6 +704,944 @@ class TestCache(unittest.TestCase):
             ret = read_cache(foo.name, cache.name)
             self.assertIsNone(ret)
 
+class TestHashCache(unittest.TestCase):
+
+    def testSameSizeEdit(self):
+
+        foo = NamedTemporaryFile(mode='w+t')
+        dump([1, 2], foo)
+        st = os.fstat(foo.fileno())
+
+        cache = NamedTemporaryFile(mode='w+b')
+        write_cache([1, 2], foo.name, cache.name, validate="hash")
+        self.assertEqual([1, 2], read_cache(foo.name, cache.name))
+
+        # same size, same timestamp
+        foo.seek(0, 0)
+        dump([3, 4], foo)
+        os.utime(foo.name, (st.st_atime, st.st_mtime))
+
+        with self.assertRaisesRegexp(CacheMismatchError, "digest mismatch"):
+            read_cache(foo.name, cache.name)
+
+    def testTouchedFile(self):
+
+        foo = NamedTemporaryFile(mode='w+t')
+        dump([1, 2], foo)
+
+        cache = NamedTemporaryFile(mode='w+b')
+        write_cache([1, 2], foo.name, cache.name, validate="hash")
+
+        os.utime(foo.name, (0, 42))
+        self.assertEqual([1, 2], read_cache(foo.name, cache.name))
+        self.assertEqual([1, 2], load(foo, use_cache=True, cfilename=cache.name))
+
+@unittest.skipIf(not hasattr(__import__("pickle"), "PickleBuffer"),
+    "out-of-band buffers require pickle protocol 5")
+class TestOutOfBandCache(unittest.TestCase):
+
+    def testWriteLoadCache(self):
+
+        import array
+
+        obj = {
+            "array" : array.array('d', range(1024)),
+            "memoryview" : memoryview(b'x' * 8192),
+            "bytearray" : bytearray(8192),
+            "small" : [b'x', bytearray(1)],
+            }
+
+        foo = NamedTemporaryFile(mode='w+t')
+        cache = NamedTemporaryFile(mode='w+b')
+        dump(obj, foo, use_cache=True, cfilename=cache.name, out_of_band=True)
+
+        obj2 = load(foo, use_cache=True, cfilename=cache.name)
+        self.assertEqual(obj, obj2)
+        # memoryview points to the mapped cache
+        self.assertTrue(obj2["memoryview"].readonly)
+        self.assertNotEqual(bytes, type(obj2["memoryview"].obj))
+
+    def testRewriteMappedCache(self):
+
+        foo = NamedTemporaryFile(mode='w+t')
+        cache = NamedTemporaryFile(mode='w+b')
+        dump(memoryview(b'x' * 8192), foo, use_cache=True, cfilename=cache.name, out_of_band=True)
+        obj = read_cache(foo.name, cache.name)
+
+        # the mapped file is not truncated
+        write_cache(b'y', foo.name, cache.name)
+        self.assertEqual(b'x' * 8192, obj.tobytes())
+
+    def testReadOutdatedCache(self):
+
+        foo = NamedTemporaryFile(mode='w+t')
+        dump(b'x' * 8192, foo)
+        cache = NamedTemporaryFile(mode='w+b')
+        write_cache(b'x' * 8192, foo.name, cache.name, validate="hash", out_of_band=True)
+        self.assertEqual(b'x' * 8192, read_cache(foo.name, cache.name))
+
+        foo.seek(0, 0)
+        dump(b'y' * 8192, foo)
+        with self.assertRaises(CacheMismatchError):
+            read_cache(foo.name, cache.name)
+
+class TestLoadCache(unittest.TestCase):
+
+    # call load_cache from 8 threads at once
+    def _load(self, filename, cfilename, load_f):
+
+        import threading
+
+        ret = list()
+        threads = [
+            threading.Thread(
+                target=lambda: ret.append(load_cache(filename, load_f, cfilename)))
+            for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return ret
+
+    def testSingleFlight(self):
+
+        foo = NamedTemporaryFile(mode='w+t')
+        dump([1, 2], foo)
+        cache = NamedTemporaryFile(mode='w+b')
+
+        calls = list()
+        def load_f():
+            calls.append(1)
+            time.sleep(0.1)
+            return [1, 2]
+
+        self.assertEqual([[1, 2]] * 8, self._load(foo.name, cache.name, load_f))
+        self.assertEqual(1, len(calls))
+        self.assertEqual([1, 2], read_cache(foo.name, cache.name))
+        # no temporary files are left
+        self.assertEqual(
+            sorted([os.path.basename(cache.name), os.path.basename(cache.name) + ".lock"]),
+            sorted(f for f in os.listdir(os.path.dirname(cache.name))
+                if f.startswith(os.path.basename(cache.name))))
+        os.unlink(cache.name + ".lock")
+
+    def testFailedRebuild(self):
+
+        foo = NamedTemporaryFile(mode='w+t')
+        foo.write("memoryview(b'x')")
+        foo.flush()
+        cache = NamedTemporaryFile(mode='w+b')
+
+        calls = list()
+        def load_f():
+            calls.append(1)
+            time.sleep(0.2)
+            # can't be pickled
+            return memoryview(b'x')
+
+        start = time.time()
+        self.assertEqual([b'x'] * 8, [m.tobytes() for m in self._load(foo.name, cache.name, load_f)])
+        # the others do not wait for each other
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(8, len(calls))
+
+        # nobody tries to rebuild until the source changes
+        self.assertEqual(b'x', load_cache(foo.name, load_f, cache.name, wait=0).tobytes())
+        os.unlink(cache.name + ".lock")
+
+    def testRebuildOutdated(self):
+
+        foo = NamedTemporaryFile(mode='w+t')
+        dump([1, 2], foo)
+        cache = NamedTemporaryFile(mode='w+b')
+        write_cache([1, 2], foo.name, cache.name, validate="hash")
+
+        foo.seek(0, 0)
+        dump([3, 4], foo)
+        foo.seek(0, 0)
+        self.assertEqual([3, 4], load(foo, use_cache=True, cfilename=cache.name))
+        # rebuilt in the same format
+        self.assertEqual([3, 4], read_cache(foo.name, cache.name))
+        with open(cache.name, 'rb') as fp:
+            self.assertEqual(b'pyckle\x00\x01', fp.read(8))
+        os.unlink(cache.name + ".lock")
+
+class TestMemo(unittest.TestCase):
+
+    def testMemoLoad(self):
+
+        memo = Memo(max_entries=2)
+        foo = NamedTemporaryFile(mode='w+t')
+        dump([1, 2], foo)
+        os.utime(foo.name, (0, 41))
+
+        foo.seek(0, 0)
+        obj = load(foo, memo=memo)
+        self.assertIs(obj, load(foo, memo=memo))
+        self.assertEqual((1, 1), (memo.hits, memo.misses))
+
+        # changed file is parsed again
+        foo.seek(0, 0)
+        dump([1, 2, 3], foo)
+        os.utime(foo.name, (0, 42))
+        foo.seek(0, 0)
+        self.assertEqual([1, 2, 3], load(foo, memo=memo))
+        self.assertEqual((1, 2), (memo.hits, memo.misses))
+
+        # different method is a different entry
+        self.assertEqual([1, 2], loads("[1, 2]", memo=memo, method="decode"))
+        self.assertEqual(2, len(memo))
+
+        # just modified file can be modified again with the same timestamp
+        memo.clear()
+        foo.seek(0, 0)
+        dump([3, 4, 5], foo)
+        foo.seek(0, 0)
+        self.assertEqual([3, 4, 5], load(foo, memo=memo))
+        self.assertEqual(0, len(memo))
+
+    def testMemoHashReplaced(self):
+
+        memo = Memo(validate="hash")
+        foo = NamedTemporaryFile(mode='w+t')
+        dump([1, 2], foo)
+        foo.seek(0, 0)
+        self.assertEqual([1, 2], load(foo, memo=memo))
+        self.assertEqual(1, len(memo))
+
+        # the path is replaced by other file, while fp is opened
+        foo.seek(0, 0)
+        bar = NamedTemporaryFile(mode='w+t', delete=False)
+        dump([3, 4], bar)
+        bar.close()
+        os.rename(bar.name, foo.name)
+        memo.clear()
+        self.assertEqual([1, 2], load(foo, memo=memo))
+        self.assertEqual(0, len(memo))
+
+    def testMemoLoads(self):
+
+        memo = Memo(max_bytes=16, copy=True)
+        obj = loads("[1, [2]]", memo=memo)
+        obj[1].append(3)
+        self.assertEqual([1, [2]], loads("[1, [2]]", memo=memo))
+        self.assertEqual((1, 1), (memo.hits, memo.misses))
+
+        self.assertEqual([1, 2], loads(["[1,\n", "2]"], memo=memo))
+        self.assertEqual(2, len(memo))
+        # least recently used entry is evicted
+        loads("[3, 4]", memo=memo)
+        self.assertEqual(2, len(memo))
+        self.assertLessEqual(memo.size, 16)
+
+        # bigger documents are not remembered at all
+        loads(repr(list(range(32))), memo=memo)
+        self.assertEqual(2, len(memo))
+
+    def testMemoLimits(self):
+
+        from pyckle import Limits, LimitError
+
+        memo = Memo()
+        string = "['ab', 'ab']"
+        self.assertEqual(["ab", "ab"], loads(string, memo=memo, method="build"))
+        # the remembered object is not returned bypassing limits or intern
+        with self.assertRaises(LimitError):
+            loads(string, memo=memo, method="build", limits=Limits(max_str=1))
+        obj = loads(string, memo=memo, method="build", intern=True)
+        self.assertIs(obj[0], obj[1])
+        self.assertEqual((0, 1), (memo.hits, memo.misses))
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    # dump to backend, load from it, then rebuild outdated cache
+    def _roundtrip(self, backend):
+
+        foo = NamedTemporaryFile(mode='w+t')
+        dump([1, 2], foo, use_cache=backend)
+        self.assertEqual([1, 2], backend.read(foo.name))
+
+        calls = list()
+        def load_f():
+            calls.append(1)
+            return [3, 4, 5]
+
+        foo.seek(0, 0)
+        dump([3, 4, 5], foo)
+        self.assertRaises(CacheMismatchError, backend.read, foo.name)
+        self.assertEqual([3, 4, 5], backend.load(foo.name, load_f))
+        self.assertEqual([3, 4, 5], backend.load(foo.name, load_f))
+        self.assertEqual(1, len(calls))
+
+        foo.seek(0, 0)
+        self.assertEqual([3, 4, 5], load(foo, use_cache=backend))
+
+        # the format of rebuilt cache
+        foo.seek(0, 0)
+        dump({"a": bytearray(8192)}, foo, use_cache=backend, validate="hash",
+            out_of_band=True)
+        self.assertEqual({"a": bytearray(8192)}, backend.read(foo.name))
+
+    def testFileCache(self):
+
+        backend = FileCache(os.path.join(self.tmpdir, "cache"))
+        self._roundtrip(backend)
+        self.assertEqual(self.tmpdir, os.path.dirname(os.path.dirname(backend.path("foo"))))
+        self.assertNotEqual(backend.path("foo"), backend.path("bar"))
+
+    def testFileCacheEvict(self):
+
+        foos = [NamedTemporaryFile(mode='w+t') for i in range(4)]
+        backend = FileCache(self.tmpdir)
+        dump(bytearray(300), foos[0], use_cache=backend)
+        size = os.stat(backend.path(foos[0].name)).st_size
+
+        # room for three caches
+        backend = FileCache(self.tmpdir, max_bytes=3 * size)
+        for i, foo in enumerate(foos[:3]):
+            dump(bytearray(300), foo, use_cache=backend)
+            os.utime(backend.path(foo.name), (i, i))
+        # the least recently used cache is removed
+        backend.read(foos[0].name)
+        dump(bytearray(300), foos[3], use_cache=backend)
+        caches = [f for f in os.listdir(self.tmpdir) if f.endswith(".cache")]
+        self.assertEqual(3, len(caches))
+        self.assertTrue(os.path.exists(backend.path(foos[0].name)))
+        self.assertFalse(os.path.exists(backend.path(foos[1].name)))
+
+        # the directory is listed on the first write and once the limit is
+        # exceeded, not on every write
+        listdir = os.listdir
+        calls = list()
+        def counting(path):
+            calls.append(path)
+            return listdir(path)
+        backend = FileCache(self.tmpdir, max_bytes=100 * size)
+        os.listdir = counting
+        try:
+            for foo in foos:
+                dump(bytearray(300), foo, use_cache=backend)
+        finally:
+            os.listdir = listdir
+        self.assertEqual(1, len(calls))
+
+    def testAbstractBackend(self):
+
+        from pyckle.backends import CacheBackend
+        self.assertRaises(TypeError, CacheBackend)
+
+    def testMemoryCache(self):
+
+        backend = MemoryCache(max_bytes=16*1024)
+        self._roundtrip(backend)
+
+        foo = NamedTemporaryFile(mode='w+t')
+        dump([1, [2]], foo, use_cache=backend)
+        # every load returns new object
+        obj = backend.read(foo.name)
+        self.assertIsNot(obj, backend.read(foo.name))
+
+        for i in range(4):
+            backend.write(bytearray(8192), foo.name)
+            backend.write(bytearray(8192), __file__)
+        self.assertLessEqual(backend.size, 16*1024)
+        self.assertEqual(1, len(backend))
+
+    def testSQLiteCache(self):
+
+        path = os.path.join(self.tmpdir, "cache.db")
+        self._roundtrip(SQLiteCache(path))
+
+        backend = SQLiteCache(path, max_bytes=16*1024)
+        foos = [NamedTemporaryFile(mode='w+t') for i in range(3)]
+        for foo in foos:
+            dump(bytearray(6000), foo, use_cache=backend)
+            time.sleep(0.01)
+        self.assertRaises(CacheMismatchError, backend.read, foos[0].name)
+        self.assertEqual(bytearray(6000), backend.read(foos[2].name))
+
+class TestLoadMany(unittest.TestCase):
+
+    def setUp(self):
+        self.foos = [NamedTemporaryFile(mode='w+t') for i in range(6)]
+        for i, foo in enumerate(self.foos):
+            dump([i, {"i": i}], foo)
+        self.foos[3].seek(0, 0)
+        self.foos[3].write("[3, {'i': 3]")
+        self.foos[3].flush()
+        self.paths = [foo.name for foo in self.foos]
+
+    def testLoadMany(self):
+
+        for workers in (1, 2):
+            ret = list(load_many(self.paths, workers=workers, errors="return"))
+            self.assertEqual(self.paths, [path for path, _ in ret])
+            self.assertEqual([1, {"i": 1}], ret[1][1])
+            error = ret[3][1]
+            self.assertIsInstance(error, LoadError)
+            self.assertEqual(self.paths[3], error.filename)
+            self.assertIsInstance(error.error, SyntaxError)
+
+            with self.assertRaises(LoadError):
+                list(load_many(self.paths, workers=workers))
+
+        ret = dict(load_many(self.paths, workers=2, ordered=False, errors="return",
+            method="decode"))
+        self.assertEqual(sorted(self.paths), sorted(ret))
+        self.assertEqual([5, {"i": 5}], ret[self.paths[5]])
+
+    def testLoadManyInterleaved(self):
+
+        class NoLists(Pyckler):
+            def visit_List(self, node):
+                raise SyntaxError("no lists")
+
+        del self.paths[3]
+        # loads in the calling process do not share the arguments
+        a = load_many(self.paths, workers=1)
+        self.assertEqual([0, {"i": 0}], next(a)[1])
+        b = list(load_many(self.paths, cls=NoLists, workers=1, errors="return"))
+        self.assertIsInstance(b[0][1], LoadError)
+        self.assertEqual([1, {"i": 1}], next(a)[1])
+
+    def testLoadManyCache(self):
+
+        backend = MemoryCache()
+        del self.paths[3]
+        # caches of the others are written by the calling process
+        ret = list(load_many(self.paths, use_cache=backend, workers=2))
+        self.assertEqual(5, len(backend))
+        self.assertEqual(ret, list(load_many(self.paths, use_cache=backend, workers=2)))
+
+        import tempfile
+        import shutil
+        tmpdir = tempfile.mkdtemp()
+        try:
+            backend = FileCache(tmpdir)
+            self.foos[0].seek(0, 0)
+            dump([0, {"i": 0}], self.foos[0], use_cache=backend)
+            self.assertEqual(ret, list(load_many(self.paths, use_cache=backend, workers=2)))
+            # caches are rebuilt by workers
+            self.assertEqual([4, {"i": 4}], backend.read(self.paths[3]))
+        finally:
+            shutil.rmtree(tmpdir)
+
+@unittest.skipIf(sys.version_info < (3, 5), "asyncio API requires python 3.5")
+class TestAsync(unittest.TestCase):
+
+    def _run(self, coro):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def testLoadDump(self):
+
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        from pyckle import aload, adump
+
+        foo = NamedTemporaryFile(mode='w+t')
+        cache = MemoryCache()
+
+        calls = list()
+        class CountingPyckler(Pyckler):
+            def __init__(self, *args):
+                calls.append(1)
+                Pyckler.__init__(self, *args)
+
+        async def main():
+            await adump({"a": [1, 2]}, foo.name, use_cache=cache)
+            # concurrent loads are coalesced
+            objs = await asyncio.gather(*(
+                aload(foo.name, cls=CountingPyckler) for i in range(4)))
+            # but not the ones with other use_cache
+            cached = await asyncio.gather(
+                aload(foo.name, cls=CountingPyckler),
+                aload(foo.name, cls=CountingPyckler, use_cache=cache))
+            with ThreadPoolExecutor(1) as executor:
+                obj = await aload(foo.name, use_cache=cache, executor=executor)
+                obj2 = await aload(foo.name, method="decode", executor=executor)
+            return objs, cached, obj, obj2
+
+        objs, cached, obj, obj2 = self._run(main())
+        self.assertEqual([{"a": [1, 2]}] * 4, objs)
+        self.assertEqual([{"a": [1, 2]}] * 2, cached)
+        self.assertIsNot(cached[0], cached[1])
+        self.assertEqual(2, len(calls))
+        self.assertEqual({"a": [1, 2]}, obj)
+        self.assertEqual({"a": [1, 2]}, obj2)
+        self.assertEqual("{'a': [1, 2]}", foo.read())
+
+        with self.assertRaises(SyntaxError):
+            foo.seek(0, 0)
+            foo.write("{'a': [1, 2}")
+            foo.flush()
+            self._run(aload(foo.name))
+
+class TestBench(unittest.TestCase):
+
+    def testBench(self):
+
+        import json
+        from pyckle import bench
+
+        for shape in bench.SHAPES:
+            obj = bench.corpus(shape, 10)
+            self.assertEqual(obj, loads(dumps(obj)))
+            self.assertEqual(obj, bench.corpus(shape, 10))
+
+        out = NamedTemporaryFile(mode='w+t')
+        bench.main(["--size", "10", "--repeat", "1", "--shape", "mixed",
+            "--method", "decode", "--json", out.name])
+        report = json.load(out)
+        self.assertEqual(
+            ["dumps", "dump", "loads", "engine", "load", "iterload", "dumpb",
+             "loadb", "write_cache", "read_cache"],
+            [r["op"] for r in report["results"]])
+        self.assertTrue(all(r["time"] >= 0 for r in report["results"]))
+
+        out.seek(0, 0)
+        bench.main(["--size", "10", "--repeat", "1", "--suite", "depth",
+            "--suite", "load_many", "--json", out.name])
+        report = json.load(out)
+        shapes = [r["shape"] for r in report["results"]]
+        self.assertEqual(["depth-100", "depth-100", "load_many-1"], shapes[:3])
+
+class TestStats(unittest.TestCase):
+
+    def testPhases(self):
+
+        from pyckle import Stats
+
+        stats = Stats()
+        self.assertEqual((1, 2), loads("(1, 2)", stats=stats))
+        # tuples are not JSON-like, the fast path is tried first
+        self.assertEqual(
+            ["compile", "eval", "jsonlike", "parse", "visit"], sorted(stats.times))
+        self.assertEqual(6, stats.bytes)
+        self.assertTrue(stats.nodes > 3)
+
+        stats.clear()
+        loads("(1, 2)", method="build", stats=stats)
+        loads("(1, 2)", method="decode", stats=stats)
+        self.assertEqual(
+            ["build", "decode", "jsonlike", "parse", "visit"], sorted(stats.times))
+        self.assertEqual(12, stats.bytes)
+
+        # JSON-like documents never reach the Pyckler
+        stats.clear()
+        loads("[1, 2]", stats=stats)
+        self.assertEqual(["jsonlike"], list(stats.times))
+        self.assertEqual(1, stats.calls["jsonlike"])
+
+        stats.clear()
+        self.assertRaises(SyntaxError, loads, "(1, foo)", stats=stats)
+        self.assertEqual(1, stats.calls["split_lines"])
+
+        # no Stats, nothing measured
+        self.assertEqual(None, Pyckler.stats)
+
+    def testCache(self):
+
+        from pyckle import Stats
+
+        events = list()
+        stats = Stats(lambda name, value: events.append(name))
+
+        foo = NamedTemporaryFile(mode='w+t')
+        dump((1, 2), foo)
+        cache = NamedTemporaryFile(mode='w+b')
+
+        foo.seek(0, 0)
+        self.assertEqual((1, 2), load(foo, use_cache=True, cfilename=cache.name, stats=stats))
+        foo.seek(0, 0)
+        self.assertEqual((1, 2), load(foo, use_cache=True, cfilename=cache.name, stats=stats))
+        self.assertEqual({"magic": 1, "hit": 1}, stats.cache)
+        # the cache is read again, once the rebuild lock is held
+        self.assertEqual(3, stats.calls["read_cache"])
+        self.assertEqual(1, stats.calls["write_cache"])
+        self.assertEqual(1, stats.calls["read"])
+        self.assertTrue("cache" in events and "read" in events)
+
+        stats.clear()
+        backend = MemoryCache()
+        for i in range(2):
+            foo.seek(0, 0)
+            self.assertEqual((1, 2), load(foo, use_cache=backend, stats=stats))
+        self.assertEqual({"missing": 1, "hit": 1}, stats.cache)
+        self.assertTrue("hit 1" in str(stats))
+
+class TestLimits(unittest.TestCase):
+
+    def setUp(self):
+        from pyckle import Limits
+        self.limits = Limits(max_bytes=100, max_nodes=20, max_depth=3,
+            max_length=5, max_str=10, max_digits=5)
+
+    def testLimits(self):
+
+        from pyckle import LimitError
+
+        for method in ("eval", "build", "decode"):
+            self.assertEqual(
+                [1, (2, 3), {'a': 'bc'}, -12345, 1+2j],
+                loads("[1, (2, 3), {'a': 'bc'}, -12345, 1+2j]", method=method, limits=self.limits))
+            for string, name in (
+                ("x" * 101,                         "max_bytes"),
+                ("[" + "1, " * 40 + "]",            "max_bytes"),
+                ("[[1, 2, 3, 4, 5], [1, 2, 3, 4, 5], [1, 2, 3, 4, 5], [1]]", "max_nodes"),
+                ("[[[[1]]]]",                       "max_depth"),
+                ("(1, 2, 3, 4, 5, 6)",              "max_length"),
+                ("{1: 2, 3: 4, 5: 6, 7: 8, 9: 0, 11: 1}", "max_length"),
+                ("dict(a=1, b=2, c=3, d=4, e=5, f=6)", "max_length"),
+                ("'aaaaaaaaaaa'",                   "max_str"),
+                ("b'aaaaaa' b'bbbbbb'",             "max_str"),
+                ("bytearray(11)",                   "max_str"),
+                ("123456",                          "max_digits"),
+                ("-0xfffffff",                      "max_digits"),
+                ):
+                with self.assertRaises(LimitError) as cm:
+                    loads(string, method=method, limits=self.limits)
+                self.assertTrue(
+                    cm.exception.msg.startswith(name + " exceeded"),
+                    (method, string, cm.exception.msg))
+
+        # it is still a SyntaxError, JSON-like documents are limited too
+        self.assertRaises(SyntaxError, loads, "[[[[1]]]]", limits=self.limits)
+
+    def testAllocations(self):
+
+        from decimal import Decimal
+        from fractions import Fraction
+        from pyckle import Limits, LimitError
+
+        limits = Limits(max_length=5, max_digits=5)
+        for method in ("eval", "build", "decode"):
+            self.assertEqual(
+                [Decimal('1.5e3'), Fraction(1, 3), [0, 1, 2, 3], [{'a': 1}]],
+                loads("""[decimal.Decimal('1.5e3'), fractions.Fraction('1/3'),
+                    list(pyckle.vector('b', 'AAECAw==')),
+                    pyckle.records(('a', ), [(1, )])]""", method=method, limits=limits))
+            for string, name in (
+                ("fractions.Fraction('1e1000000000')",          "max_digits"),
+                ("fractions.Fraction('1e" + "9" * 5000 + "')",  "max_digits"),
+                ("fractions.Fraction('123456/7')",              "max_digits"),
+                ("fractions.Fraction(decimal.Decimal('1e-99'))", "max_digits"),
+                ("decimal.Decimal('1E999999')",                 "max_digits"),
+                ("decimal.Decimal((0, (1, ), 1000000000))",     "max_digits"),
+                ("list(pyckle.vector('b', 'AAECAwQFBgc='))",    "max_length"),
+                ("pyckle.records(('a', ), list(pyckle.vector('b', 'AAECAwQFBgc=')))", "max_length"),
+                ):
+                with self.assertRaises(LimitError) as cm:
+                    loads(string, method=method, limits=limits)
+                self.assertTrue(
+                    cm.exception.msg.startswith(name + " exceeded"),
+                    (method, string, cm.exception.msg))
+
+    def testLoad(self):
+
+        from pyckle import Engine, LimitError
+
+        foo = NamedTemporaryFile(mode='w+t')
+        foo.write("[" + "1, " * 50 + "]")
+        foo.flush()
+        foo.seek(0, 0)
+        self.assertRaises(LimitError, load, foo, limits=self.limits)
+        foo.seek(0, 0)
+        self.assertRaises(LimitError, Engine(limits=self.limits).load, foo)
+        foo.seek(0, 0)
+        self.assertEqual([1] * 50, load(foo))
+
+        self.assertEqual([1, 2, 3], list(iterload(StringIO("[1, 2, 3]"), limits=self.limits)))
+        for string in ("[1, 2, 3, 4, 5, 6]", "{**{1: 2, 3: 4, 5: 6}, 7: 8, 9: 0, 11: 1}",
+            "[" + "1, " * 50 + "]", "[[[[1]]]]"):
+            with self.assertRaises(LimitError):
+                list(iterload(StringIO(string), chunk_size=4, limits=self.limits))
+
+class TestBinary(unittest.TestCase):
+
+    def testRoundTrip(self):
+
+        import array, collections, datetime, decimal, fractions
+        from pyckle import dumpb, loadb
+
+        for obj in (
+            None, True, False, 0, -128, 300, -2**31 - 1, 2**63, -2**100,
+            1.5, float('inf'), 1+2j, complex(float('inf'), 1), "\u00e9\ud800",
+            b"x", (1, ), [], {}, set(), frozenset([1]), bytearray(b"ab"),
+            {"a": [1, 2.5, decimal.Decimal("1.1"), fractions.Fraction(1, 3)]},
+            collections.deque([1, 2], 5), collections.Counter("aab"),
+            collections.OrderedDict([(1, 2)]),
+            collections.defaultdict(list, {1: [2]}),
+            datetime.datetime(2020, 1, 2, 3, 4, 5, 6,
+                datetime.timezone(datetime.timedelta(hours=2), "X")),
+            [datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)],
+            array.array('d', [1.5, 2]), array.array('l', [1, 2]), array.array('u', 'ab'),
+            ):
+            ret = loadb(dumpb(obj))
+            self.assertEqual(obj, ret)
+            self.assertIs(type(obj), type(ret))
+
+        self.assertRaises(TypeError, dumpb, object())
+        # repeated names are referenced
+        self.assertEqual(1, dumpb([datetime.date(2020, 1, 1)] * 3).count(b"datetime.date"))
+
+    def testInvalid(self):
+
+        from pyckle import dumpb, loadb, Limits, LimitError
+        from pyckle.pyckler import PycklerBase
+
+        data = dumpb({"a": [1, "foo", (2.5, 1+2j)]})
+        for i in range(len(data)):
+            self.assertRaises(ValueError, loadb, data[:i])
+        self.assertRaises(ValueError, loadb, data + b"N")
+        self.assertRaises(ValueError, loadb, b"pyckleb\x00?")
+
+        # the only callables are allowed names
+        evil = dumpb(bytearray(b"ls")).replace(b"\x09\x00\x00\x00bytearray", b"\x09\x00\x00\x00os.system")
+        self.assertRaises(ValueError, loadb, evil)
+        self.assertRaises(ValueError, loadb, dumpb(bytearray(b"ls")), cls=PycklerBase)
+
+        limits = Limits(max_length=3, max_str=3, max_depth=2)
+        self.assertEqual([1, "foo"], loadb(dumpb([1, "foo"]), limits=limits))
+        for obj in ([1, 2, 3, 4], ["food"], [[[1]]], bytearray(4)):
+            self.assertRaises(LimitError, loadb, dumpb(obj), limits=limits)
+
+class TestBlocks(unittest.TestCase):
+
+    def testBlocks(self):
+
+        import array
+
+        floats = [random.random() for i in range(100)]
+        ints = [random.randint(-2**40, 2**40) for i in range(100)]
+        obj = {
+            "floats": floats,
+            "ints": ints,
+            "array": array.array('h', range(100)),
+            "short": [1.5, 2.5],
+            "mixed": [1, 2.5] * 50,
+            "bools": [True, 1] * 50,
+            "big": [2**64] * 100,
+            "chars": array.array('u', 'a' * 100),
+            }
+
+        string = dumps(obj, block_size=64)
+        self.assertEqual(3, string.count("pyckle.vector("))
+        self.assertTrue("list(pyckle.vector('d', " in string)
+        self.assertTrue("pyckle.vector('h', " in string)
+        for method in ("eval", "build", "decode"):
+            ret = loads(string, method=method)
+            self.assertEqual(obj, ret)
+            self.assertIs(list, type(ret["floats"]))
+            self.assertIs(array.array, type(ret["array"]))
+            self.assertEqual(array.array('h', range(100)),
+                Engine(method=method).loads(dumps(obj["array"], block_size=64)))
+            # the package itself is not an allowed name
+            for name in ("pyckle", "pyckle.blocks", "[pyckle]"):
+                self.assertRaises(SyntaxError, loads, name, method=method)
+
+        # no blocks by default
+        self.assertFalse("pyckle.vector" in dumps(obj))
+
+    def testVector(self):
+
+        import array
+        from pyckle import vector
+
+        self.assertEqual(array.array('i', [1, 2]), vector('i', 'AQAAAAIAAAA='))
+        self.assertRaises(ValueError, vector, 'l', 'AQAAAAIAAAA=')
+        self.assertRaises(SyntaxError, loads, "pyckle.loads('1')")
+
+class TestInterning(unittest.TestCase):
+
+    def testIntern(self):
+
+        from pyckle import Interner
+
+        rows = [{"user name": "x" + str(i % 3), "id": i} for i in range(10)]
+        string = dumps(rows)
+        for method in ("eval", "build", "decode"):
+            ret = loads(string, method=method, intern=True)
+            self.assertEqual(rows, ret)
+            self.assertIs(list(ret[0])[0], list(ret[9])[0])
+            self.assertIs(ret[0]["user name"], ret[3]["user name"])
+
+        # the table is shared across loads
+        interner = Interner(keys=False, max_length=2)
+        one = loads("['ab', 'abc']", method="decode", intern=interner)
+        two = loads("['ab', 'abc']", method="build", intern=interner)
+        self.assertIs(one[0], two[0])
+        self.assertEqual(set(["ab"]), set(interner.table))
+
+        items = list(iterload(StringIO(string), intern=True))
+        self.assertEqual(rows, items)
+        self.assertIs(list(items[0])[0], list(items[5])[0])
+
+    def testRecords(self):
+
+        from pyckle import records
+
+        rows = [{"id": i, "name": "foo", "pos": (i, 1.5)} for i in range(20)]
+        obj = {"rows": rows, "short": rows[:2], "mixed": rows + [{"id": 1}]}
+        string = dumps(obj, record_size=10)
+        self.assertEqual(1, string.count("pyckle.records(('id', 'name', 'pos'), ["))
+        for method in ("eval", "build", "decode"):
+            ret = loads(string, method=method)
+            self.assertEqual(obj, ret)
+            self.assertIs(list(ret["rows"][0])[2], list(ret["rows"][19])[2])
+
+        # no records by default
+        self.assertFalse("pyckle.records" in dumps(obj))
+        self.assertRaises(ValueError, records, ("a", "b"), [(1, 2), (3, )])
+
+class TestColumns(unittest.TestCase):
+
+    def testColumns(self):
+
+        import array
+        from pyckle import Columns
+
+        rows = [{"id": i, "price": i / 2.0, "name": "x" + str(i)} for i in range(20)]
+        for string in (dumps(rows), dumps(rows, record_size=10)):
+            for method in ("eval", "build", "decode"):
+                ret = loads(string, method=method, columns=True)
+                self.assertIsInstance(ret, Columns)
+                self.assertEqual(20, ret.length)
+                self.assertEqual(["id", "price", "name"], list(ret))
+                self.assertEqual(array.array('q', range(20)), ret["id"])
+                self.assertEqual("d", ret["price"].typecode)
+                self.assertEqual([r["name"] for r in rows], ret["name"])
+
+        table = Engine(columns=True).loads(dumps(rows))
+        self.assertEqual(rows, [dict(row.items()) for row in table.rows()])
+        self.assertEqual(rows[-1], table.row(-1))
+        self.assertEqual(9.5, table.row(19).price)
+        self.assertRaises(IndexError, table.row, 20)
+        self.assertRaises(AttributeError, getattr, table.row(0), "foo")
+
+        # other shapes are returned unchanged
+        for obj in ([], [1, 2], [{"a": 1}, {"b": 1}], {"a": rows}):
+            self.assertEqual(obj, loads(dumps(obj), columns=True))
+
+    def testRecords(self):
+
+        from pyckle import Columns
+
+        # records are built as Columns without the dicts of rows, nested too
+        rows = [{"id": i, "name": "x" + str(i)} for i in range(20)]
+        string = dumps({"t": rows, "e": []}, record_size=10)
+        foo = NamedTemporaryFile(mode='w+t')
+        foo.write(string)
+        foo.flush()
+        for method in ("eval", "build", "decode"):
+            foo.seek(0, 0)
+            for ret in (
+                loads(string, method=method, columns=True),
+                Engine(method=method, columns=True).loads(string),
+                load(foo, method=method, columns=True)):
+                self.assertIsInstance(ret["t"], Columns)
+                self.assertEqual(rows, [dict(row.items()) for row in ret["t"].rows()])
+                self.assertEqual([], ret["e"])
+            self.assertEqual(rows, loads(string, method=method)["t"])
+        self.assertEqual(Columns({"a": []}, 0),
+            loads("pyckle.records(('a', ), [])", columns=True))
+        self.assertRaises(ValueError, loads, "pyckle.records(('a', ), [(1, 2)])", columns=True)
+
+class TestIndexed(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "doc.pyckle")
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, string):
+        with open(self.path, 'w') as fp:
+            fp.write(string)
+
+    def testIndexed(self):
+
+        import decimal
+        from pyckle import open_indexed, IndexedDict
+        from pyckle.utils import _index_path
+
+        obj = {
+            "a": [1, {"x": "}"}],
+            "b:c": {"n": 1, "m": {"deep": (1, 2)}, "s": {1, 2}},
+            3: "with ':' and # and ,",
+            "d": decimal.Decimal("1.5"),
+            "e": {},
+            }
+        self._write("# comment\n" + dumps(obj) + "\n")
+
+        for method in ("eval", "build", "decode"):
+            with open_indexed(self.path, method=method) as doc:
+                self.assertEqual(5, len(doc))
+                self.assertEqual(obj["b:c"], doc["b:c"])
+                self.assertEqual(obj[3], doc[3])
+                self.assertEqual(obj, dict(doc))
+                self.assertRaises(KeyError, lambda: doc["f"])
+        self.assertTrue(os.path.exists(_index_path(self.path)))
+
+        with open_indexed(self.path, nested=True) as doc:
+            self.assertIsInstance(doc["b:c"], IndexedDict)
+            self.assertEqual({"deep": (1, 2)}, doc["b:c"]["m"])
+            self.assertEqual(obj, doc)
+        self.assertTrue(os.path.exists(_index_path(self.path, nested=True)))
+
+        # the index is rebuilt once the file changes
+        self._write("{'new': 1}  ")
+        with open_indexed(self.path) as doc:
+            self.assertEqual({"new": 1}, dict(doc))
+
+    def testMultiline(self):
+
+        from pyckle import open_indexed
+
+        self._write("{\n  'a': 1 +\n    2j,\n  'b': 'x'\n    'y',  # comment\n"
+            "  'c'\n  : [1,\n  2]  # comment\n}\n")
+        for method in ("eval", "build", "decode"):
+            with open_indexed(self.path, method=method, use_cache=False) as doc:
+                self.assertEqual({"a": 1+2j, "b": "xy", "c": [1, 2]}, dict(doc))
+
+    def testSameSizeRewrite(self):
+
+        from pyckle import open_indexed
+
+        self._write("{'a': 12, 'b': 3}")
+        st = os.stat(self.path)
+        with open_indexed(self.path) as doc:
+            self.assertEqual({"a": 12, "b": 3}, dict(doc))
+        # the same size and timestamp, but other offsets
+        self._write("{'a': 1, 'bb': 3}")
+        os.utime(self.path, (st.st_atime, st.st_mtime))
+        with open_indexed(self.path) as doc:
+            self.assertEqual({"a": 1, "bb": 3}, dict(doc))
+
+    def testInvalid(self):
+
+        from pyckle import open_indexed
+
+        for string in ("[1]", "{1, 2}", "{'a': 1", "{'a: 1}", "{'a': (1]}",
+            "{'a': 1} 2", "", "{'a': 1, **b}"):
+            self._write(string)
+            self.assertRaises(SyntaxError, open_indexed, self.path, use_cache=False)
+
 class TestCacheWithNiceAPI(unittest.TestCase):
     
     def setUp(self):
@@ -356,7 +1655,7 @@ class TestCacheWithNiceAPI(unittest.TestCase):
         cache = NamedTemporaryFile()
         dump(self.obj, pyckle, use_cache=True, cfilename=cache.name)
 
-        self.assertNotEqual(0, os.fstat(cache.file.fileno()).st_size)
+        self.assertNotEqual(0, os.stat(cache.name).st_size)
 
         obj2 = load(pyckle, use_cache=True, cfilename=cache.name)
 